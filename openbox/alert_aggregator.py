@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Aggregation of alerts raised repeatedly by the same block.
+"""
+import time
+from collections import OrderedDict
+
+from tornado.ioloop import IOLoop
+
+from push_message_receiver import decode_json_lines
+
+
+class AlertAggregator(object):
+    """
+    Aggregates the alerts with the same origin block, message and severity raised within a window.
+
+    At the end of each window a single alert is emitted for each such group. It has the fields of the first alert
+    of the group, the number of alerts, the time of the first and the last alert, and up to samples of their packets.
+    Alerts dropped by the limiter are not aggregated.
+    """
+
+    def __init__(self, add_messages, window, samples, limiter=None):
+        """
+        :param add_messages: Called with a list of aggregated alerts at the end of each window
+        :param window: The window in seconds, 0 for passing the alerts as they are
+        :param samples: The maximal number of sample packets of each aggregated alert
+        :param limiter: A PushMessageLimiter applied to each alert before it's aggregated
+        """
+        self.add_messages = add_messages
+        self.window = window
+        self.samples = samples
+        self.limiter = limiter
+        self.received = 0
+        self.emitted = 0
+        self._aggregated = OrderedDict()
+        self._flush_timer = None
+
+    def add_batch(self, messages):
+        alerts = [alert for alert in decode_json_lines(messages) if isinstance(alert, dict)]
+        self.received += len(alerts)
+        if self.limiter is not None:
+            alerts = self.limiter.filter(alerts)
+        if not self.window:
+            self._emit(alerts)
+            return
+
+        timestamp = time.time()
+        not_aggregated = []
+        for alert in alerts:
+            try:
+                key = (alert.get('origin_block'), alert.get('message'), alert.get('severity'))
+                aggregated = self._aggregated.get(key)
+            except TypeError:
+                # an unhashable field, it can't be grouped with other alerts
+                not_aggregated.append(alert)
+                continue
+            if aggregated is None:
+                aggregated = self._aggregated[key] = dict(alert, count=0, first_timestamp=timestamp, packets=[])
+            aggregated['count'] += 1
+            aggregated['last_timestamp'] = timestamp
+            if 'packet' in alert and len(aggregated['packets']) < self.samples:
+                aggregated['packets'].append(alert['packet'])
+
+        self._emit(not_aggregated)
+        if self._aggregated and self._flush_timer is None:
+            self._flush_timer = IOLoop.current().call_later(self.window, self.flush)
+
+    def flush(self):
+        if self._flush_timer is not None:
+            IOLoop.current().remove_timeout(self._flush_timer)
+            self._flush_timer = None
+        aggregated, self._aggregated = self._aggregated, OrderedDict()
+        self._emit(aggregated.values())
+
+    def close(self):
+        self.flush()
+
+    def _emit(self, alerts):
+        if alerts:
+            self.emitted += len(alerts)
+            self.add_messages(alerts)
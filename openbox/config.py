@@ -36,12 +36,142 @@ class KeepAlive:
     INTERVAL = 30 * 1000
 
 
+class MessageRouter:
+    # The worker pool handling each message type, types not listed here have a pool of their own
+    POOLS = dict(ReadRequest='read',
+                 BatchReadRequest='read',
+                 CounterHistoryRequest='read',
+                 GlobalStatsRequest='read',
+                 ListCapabilitiesRequest='read',
+                 GetParametersRequest='read',
+                 WriteRequest='write',
+                 BatchWriteRequest='write',
+                 GlobalStatsReset='write',
+                 SetProcessingGraphRequest='configuration',
+                 AddCustomModuleRequest='configuration',
+                 RemoveCustomModuleRequest='configuration',
+                 SetParametersRequest='configuration')
+
+    # The number of messages each pool handles concurrently, pools not listed here handle one message at a time
+    # Messages of a pool that handles one message at a time are handled in the order they were received
+    CONCURRENCY = dict(read=32)
+
+    # The lane each message type waits in, types not listed here wait in the 'default' lane
+    LANES = dict(ListCapabilitiesRequest='control',
+                 SetParametersRequest='control',
+                 GetParametersRequest='control',
+                 Error='control',
+                 SetProcessingGraphRequest='configuration',
+                 AddCustomModuleRequest='configuration',
+                 RemoveCustomModuleRequest='configuration',
+                 ReadRequest='data',
+                 WriteRequest='data',
+                 BatchReadRequest='data',
+                 BatchWriteRequest='data',
+                 GlobalStatsRequest='stats',
+                 GlobalStatsReset='stats',
+                 CounterHistoryRequest='stats',
+                 SubscribeRequest='stats',
+                 UnsubscribeRequest='stats')
+
+    # The lanes from the highest priority to the lowest
+    LANES_PRIORITIES = ['control', 'default', 'configuration', 'data', 'stats']
+
+    # The maximal number of messages waiting in each lane, a message received when its lane is full is rejected
+    LANES_SIZES = dict(control=100, default=100, configuration=10, data=1000, stats=100)
+
+
+class ReadCoalescing:
+    # The number of seconds a value read from the engine is served to later reads of the same handler,
+    # 0 to only share reads that are in flight
+    TTL = 0
+
+    # The TTL of specific block read handlers by their name, overriding the default TTL
+    HANDLERS_TTL = {}
+
+
+class Metrics:
+    # The upper bounds in seconds of the buckets of the processing graph compilation time histogram
+    COMPILE_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class StatsSubscriptions:
+    # The interval in milliseconds between sampling ticks, subscription intervals are rounded up to a multiple of it
+    TICK = 100
+
+
+class CounterHistory:
+    # The block read handlers sampled into the history, dicts with a block_id and a read_handle
+    HANDLERS = []
+
+    # The interval in milliseconds between samples
+    INTERVAL = 1000
+
+    # The number of samples kept for each handler
+    SIZE = 600
+
+    # The maximal number of sampled handlers, bounding the memory of the history
+    MAX_HANDLERS = 256
+
+
+class OutboundSpool:
+    # Spool messages that couldn't be delivered to the controller and deliver them when it is reachable again
+    ENABLED = True
+    DIRECTORY = os.path.join(BASE_PATH, 'spool')
+
+    # The maximal total size in bytes of the spool
+    MAX_SIZE = 64 * 1024 * 1024
+
+    # The size in bytes of a spool segment file, delivered segments are removed
+    SEGMENT_SIZE = 4 * 1024 * 1024
+
+    # The number of seconds messages of each type are kept in the spool, 0 for not spooling a type
+    RETENTION = dict(KeepAlive=0, Hello=0, Stats=60)
+
+    # The number of seconds messages of types not in RETENTION are kept, None to keep them until delivered
+    DEFAULT_RETENTION = 24 * 60 * 60
+
+    # What to do with new messages when the spool is full, 'drop_oldest' or 'drop_newest'
+    OVERFLOW_POLICY = 'drop_oldest'
+
+    # The initial and maximal number of seconds between delivery attempts, doubled after each failure
+    RETRY_INTERVAL = 1
+    MAX_RETRY_INTERVAL = 60
+
+    # Sync each spooled message to disk, keeping it also if the machine crashes
+    SYNC = False
+
+
 class OpenBoxController:
     HOSTNAME = "127.0.0.1"
     PORT = 3637
     BASE_URI = "http://{host}:{port}".format(host=HOSTNAME, port=PORT)
     MESSAGE_ENDPOINT_PATTERN = BASE_URI + "/message/{message}"
 
+    # The endpoint receiving a JSON list of messages in a single request,
+    # None if the controller doesn't support it and each message is sent on its own
+    MULTIPLE_MESSAGES_ENDPOINT = None
+
+
+class MessageSender:
+    # The maximal number of open connections
+    MAX_CONNECTIONS = 10
+
+    # The maximal number of requests in flight to each destination
+    MAX_IN_FLIGHT = 10
+
+    # The number of seconds to wait for more messages to the controller before sending them together
+    BATCH_WINDOW = 0.01
+
+    # The maximal number of messages sent together
+    BATCH_SIZE = 100
+
+    # Request bodies larger than this number of bytes are sent compressed with gzip, None to never compress
+    COMPRESSION_THRESHOLD = None
+
+    # The Content-Type of the messages to the controller, see wire_format.supported_formats
+    WIRE_FORMAT = 'application/json'
+
 
 class Watchdog:
     CHECK_INTERVAL = 1000  # milliseconds
@@ -53,9 +183,33 @@ class RestServer:
     BASE_URI = 'http://127.0.0.1:{port}'.format(port=PORT)
     LOG_RECEIVED_MESSAGES = False
 
+    # Seconds the controller should wait before resending a message the manager can't receive
+    RETRY_AFTER = 1
+
+    # Seconds a block value or the global stats read by the local read endpoints are served to later reads,
+    # so frequent scrapes by local monitoring agents don't reach the engine
+    LOCAL_READ_TTL = 1
+
+    # The maximal size in bytes of a streamed AddCustomModuleRequest
+    MAX_MODULE_MESSAGE_SIZE = 1024 * 1024 * 1024
+
+    # The directory where the content of streamed modules is decoded, None for the system's temporary directory
+    MODULES_DIRECTORY = None
+
     class Endpoints:
         RUNNER_ALERT = '/obsi/runner_alert'
+        # received while the body arrives, before the generic MESSAGE endpoint
+        MODULE_MESSAGE = '/message/(AddCustomModuleRequest)'
         MESSAGE = '/message/(.*)'
+        MESSAGE_LANES = '/obsi/message_lanes'
+        COUNTER_HISTORY = '/obsi/counter_history/(.*)/(.*)'
+        MESSAGE_SENDER = '/obsi/message_sender'
+        OUTBOUND_SPOOL = '/obsi/outbound_spool'
+        PUSH_MESSAGES = '/obsi/push_messages'
+        BLOCK_VALUE = '/obsi/block/(.*)/(.*)'
+        GLOBAL_STATS = '/obsi/global_stats'
+        COMPILED_CONFIG = '/obsi/compiled_config'
+        METRICS = '/obsi/metrics'
 
 
 class Engine:
@@ -66,20 +220,27 @@ class Engine:
     PUSH_MESSAGES_SOCKET_TYPE = 'TCP'
     PUSH_MESSAGES_SOCKET_ENDPOINT = 10002
     PUSH_MESSAGES_CHANNEL = 'openbox'
+    PUSH_MESSAGES_LOG_SOCKET_ENDPOINT = 10003
+    PUSH_MESSAGES_LOG_CHANNEL = 'openbox_log'
+    # each channel has its own ChatterSocket and stream, so a flood of logs doesn't delay alerts
+    PUSH_MESSAGES_CHANNELS = [dict(name=PUSH_MESSAGES_CHANNEL, endpoint=PUSH_MESSAGES_SOCKET_ENDPOINT, types=['ALERT']),
+                              dict(name=PUSH_MESSAGES_LOG_CHANNEL, endpoint=PUSH_MESSAGES_LOG_SOCKET_ENDPOINT,
+                                   types=['LOG'])]
     NTHREADS = 2
     REQUIREMENTS = ['openbox']
     BASE_EMPTY_CONFIG = r'''{requirements}
-ChatterSocket("{push_type}", {push_endpoint}, RETRIES 3, RETRY_WARNINGS false, CHANNEL {channel});
+{chatter_sockets}
 ControlSocket("{control_type}", {control_endpoint}, RETRIES 3, RETRY_WARNINGS false);
 alert::ChatterMessage("ALERT", "{test_alert_message}", CHANNEL {channel});
-log::ChatterMessage("LOG", "{test_log_message}", CHANNEL {channel});
+log::ChatterMessage("LOG", "{test_log_message}", CHANNEL {log_channel});
 timed_source::TimedSource(10, "base");
 discard::Discard();
 timed_source -> alert -> log -> discard;'''.format(
         requirements='\n'.join('require(package "%s")' % package for package in REQUIREMENTS),
-        push_type=PUSH_MESSAGES_SOCKET_TYPE,
-        push_endpoint=PUSH_MESSAGES_SOCKET_ENDPOINT,
+        chatter_sockets='\n'.join(['ChatterSocket("%s", %s, RETRIES 3, RETRY_WARNINGS false, CHANNEL %s);' % (
+            PUSH_MESSAGES_SOCKET_TYPE, channel['endpoint'], channel['name']) for channel in PUSH_MESSAGES_CHANNELS]),
         channel=PUSH_MESSAGES_CHANNEL,
+        log_channel=PUSH_MESSAGES_LOG_CHANNEL,
         control_type=CONTROL_SOCKET_TYPE,
         control_endpoint=CONTROL_SOCKET_ENDPOINT,
         test_alert_message=r'{\"message\": \"This is a test alert\",'
@@ -117,20 +278,61 @@ class Control:
         '127.0.0.1', Engine.CONTROL_SOCKET_ENDPOINT) if SOCKET_TYPE == 'TCP' else Engine.CONTROL_SOCKET_ENDPOINT
 
 
+class GraphCompiler:
+    # The number of worker processes compiling processing graphs,
+    # None for the number of CPUs and 0 to compile in the manager's process
+    PROCESSES = None
+
+    # The maximal time in seconds for compiling a processing graph
+    TIMEOUT = 60
+
+
+class ProcessingGraph:
+    # The budget of a processing graph by the fields of its cost analysis
+    # (elements, longest_path, classifier_patterns, regex_patterns, regex_patterns_size, packet_cost).
+    # A missing field has no limit.
+    BUDGET = {}
+    BUDGET_FIELDS = ('elements', 'longest_path', 'classifier_patterns', 'regex_patterns', 'regex_patterns_size',
+                     'packet_cost')
+
+    # Reject a processing graph over the budget, otherwise only warn about it
+    REJECT_OVER_BUDGET = False
+
+
 class PushMessages:
     SOCKET_FAMILY = socket.AF_INET if Engine.PUSH_MESSAGES_SOCKET_TYPE == 'TCP' else socket.AF_UNIX
-    SOCKET_ADDRESS = (
-        '127.0.0.1',
-        Engine.PUSH_MESSAGES_SOCKET_ENDPOINT) if Engine.PUSH_MESSAGES_SOCKET_TYPE == 'TCP' else Engine.PUSH_MESSAGES_SOCKET_ENDPOINT
+    # the address of the ChatterSocket of each channel
+    CHANNELS_ADDRESSES = dict((channel['name'], ('127.0.0.1', channel['endpoint'])
+                               if Engine.PUSH_MESSAGES_SOCKET_TYPE == 'TCP' else channel['endpoint'])
+                              for channel in Engine.PUSH_MESSAGES_CHANNELS)
     RETRY_INTERVAL = 1
 
     class Alert:
         BUFFER_SIZE = 1
         BUFFER_TIMEOUT = 1  # in seconds
+        # the batch size grows up to this size while batches are sent slower than alerts arrive
+        MAX_BUFFER_SIZE = 1000
+        # the maximal number of batches sent at the same time
+        MAX_IN_FLIGHT = 2
+        # alerts with the same origin block, message and severity within this window are sent as a single alert,
+        # off by default since it changes the alerts controllers get, they enable it with SetParameters
+        AGGREGATION_WINDOW = 0  # in seconds, 0 for no aggregation
+        # the maximal number of sample packets of an aggregated alert
+        AGGREGATION_SAMPLES = 3
+        # rate limits and sampling per origin block and severity, see PushMessageLimiter
+        LIMITS = []
 
     class Log:
         SERVER_ADDRESS = None
         SERVER_PORT = None
+        # a sink shipping the logs directly instead of the HTTP log server, see log_sinks.check_sink
+        SINK = None
+        # the defaults of a file sink
+        FILE_MAX_BYTES = 10 * 1024 * 1024
+        FILE_BACKUP_COUNT = 5
         BUFFER_SIZE = 1
         BUFFER_TIMEOUT = 1
+        MAX_BUFFER_SIZE = 1000
+        MAX_IN_FLIGHT = 2
+        LIMITS = []
         _SERVER_CHANGED = False  # an ugly hack to help with updating
@@ -29,6 +29,14 @@ class ConfigurationBuilder(object):
         engine_configuration = self.engine_builder.from_open_box_configuration(open_box_configuration)
         return engine_configuration
 
+    def engine_config_builder_from_compiled_blocks(self, config, compiled_blocks, additional_requirements=None):
+        open_box_configuration = OpenBoxConfiguration.from_dict(config, additional_requirements)
+        engine_configuration = self.engine_builder.from_compiled_blocks(open_box_configuration, compiled_blocks)
+        return engine_configuration
+
+    def custom_modules(self):
+        return self.engine_builder.custom_modules()
+
     def supported_match_fields(self):
         return self.engine_builder.supported_match_fields()
 
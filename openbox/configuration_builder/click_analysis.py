@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Estimates the cost of a translated Click configuration before it is installed.
+
+Costs are in relative units, the weight of each element type is the estimated
+work it does for a single packet.
+"""
+from collections import defaultdict
+
+from click_configuration import ClickConfiguration
+
+DEFAULT_ELEMENT_WEIGHT = 5
+
+ELEMENT_WEIGHTS = {
+    'FromDevice': 10,
+    'FromDump': 10,
+    'InfiniteSource': 5,
+    'RandomSource': 5,
+    'ToDevice': 10,
+    'ToDump': 20,
+    'Queue': 5,
+    'Unqueue': 1,
+    'Discard': 1,
+    'DiscardNoFree': 1,
+    'Idle': 0,
+    'SimpleIdle': 0,
+    'TimedSink': 1,
+    'AutoMarkIPHeader': 1,
+    'CheckAverageLength': 1,
+    'Counter': 2,
+    'MultiCounter': 2,
+    'Classifier': 2,
+    'IPClassifier': 2,
+    'StringClassifier': 10,
+    'RegexMatcher': 20,
+    'RegexClassifier': 20,
+    'GroupRegexClassifier': 20,
+    'PushMessage': 50,
+    'VLANDecap': 2,
+    'VLANEncap': 2,
+    'DecIPTTL': 2,
+    'IPRewriter': 10,
+    'NetworkDirectionSwap': 2,
+    'NetworkHeaderFieldsRewriter': 5,
+    'SetTimestamp': 1,
+    'SetTimestampDelta': 1,
+    'Paint': 1,
+    'PaintSwitch': 1,
+}
+
+# Additional weight of each pattern a classifying element checks
+CLASSIFIER_PATTERN_WEIGHT = 1
+CLASSIFIER_ELEMENTS_TYPES = ('Classifier', 'IPClassifier')
+
+# Additional weight of each byte in the patterns of a payload matching element
+REGEX_PATTERN_BYTE_WEIGHT = 0.1
+REGEX_ELEMENTS_TYPES = ('RegexMatcher', 'RegexClassifier', 'StringClassifier', 'GroupRegexClassifier')
+
+
+def _element_type(element):
+    return element.__class__.__name__
+
+
+def _patterns(element):
+    patterns = getattr(element, 'pattern', None) or []
+    if isinstance(patterns, basestring):
+        patterns = [patterns]
+    return patterns
+
+
+def element_weight(element):
+    element_type = _element_type(element)
+    weight = ELEMENT_WEIGHTS.get(element_type, DEFAULT_ELEMENT_WEIGHT)
+    if element_type in CLASSIFIER_ELEMENTS_TYPES:
+        weight += CLASSIFIER_PATTERN_WEIGHT * len(_patterns(element))
+    elif element_type in REGEX_ELEMENTS_TYPES:
+        weight += REGEX_PATTERN_BYTE_WEIGHT * sum(len(pattern) for pattern in _patterns(element))
+    return weight
+
+
+def _heaviest_paths(click_config, weights):
+    """
+    Find the longest path (in elements) and the heaviest path (in weight) a packet can take,
+    starting at the elements without inputs. Connections closing a cycle are ignored.
+
+    The elements are visited depth first with an explicit stack, since a chain of elements
+    may be longer than the recursion limit.
+    """
+    successors = defaultdict(set)
+    has_inputs = set()
+    for connection in click_config.connections:
+        successors[connection.src].add(connection.dst)
+        has_inputs.add(connection.dst)
+
+    longest = {}
+    heaviest = {}
+    in_progress = set()
+
+    def visit(root):
+        in_progress.add(root)
+        stack = [(root, iter(successors[root]))]
+        while stack:
+            name, unvisited = stack[-1]
+            for successor in unvisited:
+                if successor not in longest and successor not in in_progress and successor in weights:
+                    in_progress.add(successor)
+                    stack.append((successor, iter(successors[successor])))
+                    break
+            else:
+                # all the successors were visited, except the ones closing a cycle
+                stack.pop()
+                in_progress.discard(name)
+                visited = [successor for successor in successors[name] if successor in longest]
+                longest[name] = max([longest[successor] for successor in visited] or [0]) + 1
+                heaviest[name] = max([heaviest[successor] for successor in visited] or [0]) + weights[name]
+
+    max_length, max_weight = 0, 0
+    for element in click_config.elements:
+        if element.name not in has_inputs:
+            if element.name not in longest:
+                visit(element.name)
+            max_length = max(max_length, longest[element.name])
+            max_weight = max(max_weight, heaviest[element.name])
+    return max_length, max_weight
+
+
+def analyze(click_config):
+    """
+    Analyze the cost of a Click configuration
+
+    :type click_config: ClickConfiguration
+    :return: The number of elements, the number of elements on the longest path of a packet,
+             the number of classifier patterns, the number and total size of regex patterns
+             and the estimated cost of the most expensive path of a packet.
+    :rtype: dict
+    """
+    weights = dict((element.name, element_weight(element)) for element in click_config.elements)
+    classifier_patterns = 0
+    regex_patterns = 0
+    regex_patterns_size = 0
+    for element in click_config.elements:
+        element_type = _element_type(element)
+        if element_type in CLASSIFIER_ELEMENTS_TYPES:
+            classifier_patterns += len(_patterns(element))
+        elif element_type in REGEX_ELEMENTS_TYPES:
+            patterns = _patterns(element)
+            regex_patterns += len(patterns)
+            regex_patterns_size += sum(len(pattern) for pattern in patterns)
+
+    longest_path, packet_cost = _heaviest_paths(click_config, weights)
+    return dict(elements=len(click_config.elements),
+                longest_path=longest_path,
+                classifier_patterns=classifier_patterns,
+                regex_patterns=regex_patterns,
+                regex_patterns_size=regex_patterns_size,
+                packet_cost=packet_cost)
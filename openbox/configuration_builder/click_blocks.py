@@ -12,6 +12,7 @@ import sys
 
 import transformations
 from matching import CompoundMatch, HeaderMatch
+from rules_optimizer import optimize_header_matches
 from configuration_builder_exceptions import ClickBlockConfigurationError, ConnectionConfigurationError
 from click_elements import Element, ClickElementConfigurationError
 from connection import Connection, MultiConnection
@@ -52,6 +53,24 @@ class ClickBlock(object):
     def name(self):
         return self._block.name
 
+    def removed_rules(self):
+        """
+        The rules removed from the block's configuration by optimizations
+        """
+        return []
+
+    def compiled(self):
+        """
+        The block's compiled elements and connections in a picklable form,
+        which can be loaded to a block of the same configuration in another process.
+
+        :return: The compiled block or None if the block is cheap to compile
+        """
+        return None
+
+    def load_compiled(self, compiled):
+        pass
+
     @classmethod
     def from_open_box_block(cls, open_box_block):
         """
@@ -433,7 +452,7 @@ Log = build_click_block('Log',
                                             ),
                         elements=[
                             dict(name='push_message', type='PushMessage',
-                                 config=dict(type='LOG', msg='$content', channel='openbox',
+                                 config=dict(type='LOG', msg='$content', channel='openbox_log',
                                              attach_packet='$attach_packet', packet_size='$packet_size')),
                         ],
                         input='push_message',
@@ -484,24 +503,26 @@ class HeaderClassifier(ClickBlock):
     # Fake attributes used by other API functions
     __elements__ = (
         dict(name='counter', type='MultiCounter', config={}),
-        dict(name='classifier', type='Classifier', config=dict(pattern=[])),)
+        dict(name='classifier', type='Classifier', config=dict(pattern=[])),
+        dict(name='idle', type='Idle', config={}),)
 
     __input__ = 'classifier'
     __output__ = 'counter'
     __read_mapping__ = dict(
-        count=('counter', 'count', 'identity'),
+        count=('counter', 'count', transformations.identity),
         byte_count=('counter', 'byte_count', transformations.identity),
-        rate=('counter', 'rate', 'identity'),
+        rate=('counter', 'rate', transformations.identity),
         byte_rate=('counter', 'byte_rate', transformations.identity),
     )
     __write_mapping__ = dict(
-        reset_counts=('counter', 'reset_counts', 'identity')
+        reset_counts=('counter', 'reset_counts', transformations.identity)
     )
 
     def __init__(self, open_box_block):
         super(HeaderClassifier, self).__init__(open_box_block)
         self._elements = []
         self._connections = []
+        self._removed_rules = []
 
     def elements(self):
         if not self._elements:
@@ -522,9 +543,10 @@ class HeaderClassifier(ClickBlock):
         for i, rule_number in enumerate(rule_numbers):
             self._connections.append(Connection(self._to_external_element_name('classifier'),
                                                 self._to_external_element_name('counter'), i, rule_number))
+        _feed_unused_counter_ports(self, 'counter', 'idle', set(rule_numbers), len(self._block.match))
 
     def _compile_match_patterns(self):
-        matches = [HeaderMatch(match) for match in self._block.match]
+        matches = self._optimized_matches()
         patterns = []
         rule_numbers = []
         try:
@@ -532,12 +554,56 @@ class HeaderClassifier(ClickBlock):
         except AttributeError:
             # default value is True
             allow_vlan = True
-        for i, match in enumerate(matches):
+        for i, match in matches:
             for pattern in match.to_patterns(allow_vlan):
                 patterns.append(pattern)
                 rule_numbers.append(i)
         return patterns, rule_numbers
 
+    def _optimized_matches(self):
+        matches, self._removed_rules = optimize_header_matches([HeaderMatch(match) for match in self._block.match])
+        return matches
+
+    def removed_rules(self):
+        if not self._elements:
+            self._compile_block()
+        return self._removed_rules
+
+    def compiled(self):
+        return _dump_compiled(self.elements(), self.connections(), self.removed_rules())
+
+    def load_compiled(self, compiled):
+        self._elements, self._connections, self._removed_rules = _load_compiled(compiled)
+
+
+def _dump_compiled(elements, connections, removed_rules):
+    # elements are dumped by their type since elements of custom modules can't be pickled
+    dumped_elements = [(element.__class__.__name__, element.name,
+                        dict((name, value) for name, value in vars(element).iteritems() if name != 'name'))
+                       for element in elements]
+    return dumped_elements, connections, removed_rules
+
+
+def _load_compiled(compiled):
+    dumped_elements, connections, removed_rules = compiled
+    elements = [Element.elements_registry[element_type](name, **attributes)
+                for element_type, name, attributes in dumped_elements]
+    return elements, list(connections), list(removed_rules)
+
+
+def _feed_unused_counter_ports(block, counter, idle, used_ports, number_of_ports):
+    """
+    Connect an Idle element to the counter's ports that lost all their rules,
+    so the counter keeps a port for each of the block's rules.
+    """
+    unused_ports = [port for port in xrange(number_of_ports) if port not in used_ports]
+    if not unused_ports:
+        return
+    idle_name = block._to_external_element_name(idle)
+    block._elements.append(Element.from_dict(dict(name=idle_name, type='Idle', config={})))
+    for i, port in enumerate(unused_ports):
+        block._connections.append(Connection(idle_name, block._to_external_element_name(counter), i, port))
+
 
 RegexMatcher = build_click_block('RegexMatcher',
                                  config_mapping=dict(pattern=(['pattern'], 'to_quoted_json_escaped'),
@@ -809,26 +875,29 @@ class HeaderPayloadClassifier(ClickBlock):
     # Fake attributes used by other API functions
     __elements__ = (dict(name='counter', type='MultiCounter', config={}),
                     dict(name='classifier', type='Classifier', config=dict(pattern=[])),
-                    dict(name='regex_classifier', type='GroupRegexClassifier', config=dict(pattern=[]))
+                    dict(name='regex_classifier', type='GroupRegexClassifier', config=dict(pattern=[])),
+                    dict(name='idle', type='Idle', config={}),
                     )
     __input__ = 'classifier'
     __output__ = 'counter'
     __read_mapping__ = dict(
-        count=('counter', 'count', 'identity'),
+        count=('counter', 'count', transformations.identity),
         byte_count=('counter', 'byte_count', transformations.identity),
-        rate=('counter', 'rate', 'identity'),
+        rate=('counter', 'rate', transformations.identity),
         byte_rate=('counter', 'byte_rate', transformations.identity),
     )
-    __write_mapping__ = dict(reset_counts=('counter', 'reset_counts', 'identity'))
+    __write_mapping__ = dict(reset_counts=('counter', 'reset_counts', transformations.identity))
 
     _MULTICOUNTER = 'counter'
     _REGEX_CLASSIFIER = 'regex_classifier_{num}'
     _CLASSIFIER = 'classifier'
+    _IDLE = 'idle'
 
     def __init__(self, open_box_block):
         super(HeaderPayloadClassifier, self).__init__(open_box_block)
         self._elements = []
         self._connections = []
+        self._removed_rules = []
 
     def elements(self):
         if not self._elements:
@@ -862,6 +931,21 @@ class HeaderPayloadClassifier(ClickBlock):
         self._elements.append(Element.from_dict(dict(name=self._to_external_element_name(self._CLASSIFIER),
                                                      type='Classifier',
                                                      config=dict(pattern=patterns))))
+        used_ports = set()
+        for match in matches:
+            used_ports.update(match.payload_matches)
+        _feed_unused_counter_ports(self, self._MULTICOUNTER, self._IDLE, used_ports, len(self._block.match))
+
+    def removed_rules(self):
+        if not self._elements:
+            self._compile_block()
+        return self._removed_rules
+
+    def compiled(self):
+        return _dump_compiled(self.elements(), self.connections(), self.removed_rules())
+
+    def load_compiled(self, compiled):
+        self._elements, self._connections, self._removed_rules = _load_compiled(compiled)
 
     def _get_matches_from_block(self):
         matches = [CompoundMatch.from_config_dict(match, i) for i, match in enumerate(self._block.match)]
@@ -870,7 +954,18 @@ class HeaderPayloadClassifier(ClickBlock):
         while previous_size < len(matches):
             previous_size = len(matches)
             matches = self._expand_matches(matches)
-        return matches
+        return self._optimize_matches(matches)
+
+    def _optimize_matches(self, matches):
+        # matches sending packets to the same payload patterns have the same target
+        targets = [tuple((number, tuple(match.payload_matches[number])) for number in sorted(match.payload_matches))
+                   for match in matches]
+        kept, removed = optimize_header_matches([match.header_match for match in matches], targets)
+        for removed_rule in removed:
+            # report the original rules of the combined match
+            removed_rule['rules'] = sorted(matches[removed_rule['rule']].payload_matches)
+        self._removed_rules = removed
+        return [CompoundMatch(header_match, matches[i].payload_matches) for i, header_match in kept]
 
     def _expand_matches(self, matches):
         expanded_matches = []
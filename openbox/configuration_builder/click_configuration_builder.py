@@ -8,24 +8,47 @@
 """
 Transforms an OpenBox configuration in to a Click's configuration
 """
+import copy
+import functools
+from collections import OrderedDict
+
 import capabilities
+import click_analysis
+import click_optimizations
 from click_blocks import ClickBlock, build_click_block_from_dict
 from click_configuration import ClickConfiguration
 from click_elements import build_element_from_dict
-from open_box_blocks import build_open_box_block_from_dict
+from open_box_blocks import OpenBoxBlock, build_open_box_block_from_dict
 from connection import Connection
 from configuration_builder_exceptions import ClickModuleTranslationError
 
 
 class ClickConfigurationBuilder(object):
-    _installed_modules = {}
+    _installed_modules = OrderedDict()
+
+    # Remove elements no packet can reach
+    REMOVE_DEAD_ELEMENTS = True
+
+    # Remove elements that pass every packet unchanged
+    COLLAPSE_PASS_THROUGH = True
+
+    # Fuse Classifiers chained through a MultiCounter into a single Classifier
+    FUSE_CLASSIFIERS = True
+
+    # Share a single matching automaton between identically configured matching elements
+    SHARE_MATCHERS = True
 
     def __init__(self, requirements=None, click_blocks=None, connections=None):
         self.requirements = requirements or []
         self.blocks = click_blocks or []
         self.connections = connections or []
         self._blocks_by_name = dict((block.name, block) for block in self.blocks)
-        self.click_config = self._build_click_config()
+        self._element_aliases = {}
+        self._shared_elements = set()
+        self._merged_ports = {}
+        click_config = self._build_click_config()
+        self._zero_counts = self._counters_zero_counts(click_config)
+        self.click_config = self._optimize_click_config(click_config)
 
     @staticmethod
     def required_elements():
@@ -66,6 +89,40 @@ class ClickConfigurationBuilder(object):
         connections = config.connections
         return cls(requirements, click_blocks, connections)
 
+    @classmethod
+    def compile_block(cls, block_config, custom_modules=None):
+        """
+        Compile a single block, usually in a worker process.
+
+        :param block_config: The OpenBox block configuration dict
+        :param custom_modules: The translations of the installed custom modules by name, see custom_modules()
+        :return: The compiled block which can be passed to from_compiled_blocks
+        """
+        for name, translation in (custom_modules or {}).iteritems():
+            if name not in cls._installed_modules:
+                cls.add_custom_module(name, translation)
+        block = ClickBlock.from_open_box_block(OpenBoxBlock.from_dict(block_config))
+        return block.compiled()
+
+    @classmethod
+    def from_compiled_blocks(cls, config, compiled_blocks):
+        """
+        Build from an OpenBox configuration whose blocks were already compiled by compile_block
+
+        :param compiled_blocks: The compiled blocks in the order of the configuration's blocks
+        """
+        click_blocks = []
+        for block, compiled in zip(config.blocks, compiled_blocks):
+            click_block = ClickBlock.from_open_box_block(block)
+            if compiled is not None:
+                click_block.load_compiled(compiled)
+            click_blocks.append(click_block)
+        return cls(config.requirements, click_blocks, config.connections)
+
+    @classmethod
+    def custom_modules(cls):
+        return OrderedDict((name, module['translation']) for name, module in cls._installed_modules.iteritems())
+
     def _build_click_config(self):
         # get the local elements of each block
         elements = []
@@ -86,26 +143,121 @@ class ClickConfigurationBuilder(object):
 
         return ClickConfiguration(self.requirements, elements, click_connections)
 
+    def _optimize_click_config(self, click_config):
+        if self.REMOVE_DEAD_ELEMENTS:
+            click_config = self._apply_optimization(click_optimizations.remove_dead_elements, click_config)
+        if self.COLLAPSE_PASS_THROUGH:
+            click_config = self._apply_optimization(click_optimizations.collapse_pass_through, click_config)
+        if self.FUSE_CLASSIFIERS:
+            click_config, aliases, self._merged_ports = click_optimizations.fuse_classifiers(click_config)
+            click_optimizations.update_aliases(self._element_aliases, aliases)
+        # Counters aren't removed even if nobody reads them yet, since the controller may read
+        # the handlers of any block at any time without declaring it in advance
+        if self.SHARE_MATCHERS:
+            click_config, aliases = click_optimizations.share_matchers(click_config)
+            self._shared_elements.update(aliases.itervalues())
+            click_optimizations.update_aliases(self._element_aliases, aliases)
+        return click_config
+
+    def _apply_optimization(self, optimization, click_config, *args):
+        click_config, aliases = optimization(click_config, *args)
+        click_optimizations.update_aliases(self._element_aliases, aliases)
+        return click_config
+
+    @staticmethod
+    def _counters_zero_counts(click_config):
+        """
+        The value of the read handlers of each counter before it counted any packet
+        """
+        inputs = {}
+        for connection in click_config.connections:
+            inputs[connection.dst] = max(inputs.get(connection.dst, 0), connection.dst_port + 1)
+        zero_counts = {}
+        for element in click_config.elements:
+            element_type = element.__class__.__name__
+            if element_type == 'MultiCounter':
+                # a MultiCounter formats the values of its inputs as a list
+                zero_counts[element.name] = '[{counts}]'.format(counts=','.join(['0'] * inputs.get(element.name, 0)))
+            elif element_type in click_optimizations.COUNTER_ELEMENTS_TYPES:
+                zero_counts[element.name] = '0'
+        return zero_counts
+
     def to_engine_config(self):
         return self.click_config.to_engine_config()
 
+    def removed_rules(self):
+        """
+        The rules removed by the optimization of each block's rule set, by block name
+        """
+        removed = {}
+        for block in self.blocks:
+            block_removed_rules = block.removed_rules()
+            if block_removed_rules:
+                removed[block.name] = block_removed_rules
+        return removed
+
+    def analyze(self):
+        """
+        Estimate the cost of the translated configuration, see click_analysis.analyze
+        """
+        return click_analysis.analyze(self.click_config)
+
+    def removed_elements(self):
+        """
+        The elements removed from the translated configuration by optimizations,
+        mapped to the element that took their place or None
+        """
+        return dict((name, alias) for name, alias in self._element_aliases.iteritems()
+                    if alias not in self._shared_elements)
+
     def translate_block_read_handler(self, block_name, handler_name):
+        """
+        :return: The element name, the element's handler name and the transform function of the read value.
+            The element name is None if the value is known without reading the engine,
+            the transform function should be called with None instead of a value.
+        """
         try:
             block = self._blocks_by_name[block_name]
         except KeyError:
             raise ValueError('Unknown block named: {name}'.format(name=block_name))
-        return block.translate_read_handler(handler_name)
+        element_name, element_handler_name, transform_function = block.translate_read_handler(handler_name)
+        if self._element_aliases.get(element_name, element_name) is None and element_name in self._zero_counts:
+            # no packet could reach a removed counter, its handlers are read without the engine
+            return None, element_handler_name, functools.partial(_read_constant, transform_function,
+                                                                 self._zero_counts[element_name])
+        element_name = self._resolve_element(element_name, block_name, handler_name)
+        if (element_name in self._merged_ports and
+                element_handler_name in click_optimizations.MULTI_COUNTER_PORTS_HANDLERS):
+            # the counter has more ports than the block since its classifier was fused with the next one
+            transform_function = functools.partial(_read_merged_ports, transform_function,
+                                                   self._merged_ports[element_name])
+        return element_name, element_handler_name, transform_function
 
     def translate_block_write_handler(self, block_name, handler_name):
         try:
             block = self._blocks_by_name[block_name]
         except KeyError:
             raise ValueError('Unknown block named: {name}'.format(name=block_name))
-        return block.translate_write_handler(handler_name)
+        element_name, element_handler_name, transform_function = block.translate_write_handler(handler_name)
+        resolved = self._resolve_element(element_name, block_name, handler_name)
+        if resolved in self._shared_elements:
+            # writing it would change the behaviour of the other blocks sharing the element,
+            # only such handlers fail, the block's other handlers belong to its own elements
+            raise ValueError('Handler {handler} of block {name} belongs to an element shared with other blocks '
+                             'and cannot be written'.format(handler=handler_name, name=block_name))
+        return resolved, element_handler_name, transform_function
+
+    def _resolve_element(self, element_name, block_name, handler_name):
+        element_name = self._element_aliases.get(element_name, element_name)
+        if element_name is None:
+            raise ValueError('Handler {handler} of block {name} belongs to an element removed '
+                             'by the optimization of the configuration'.format(handler=handler_name, name=block_name))
+        return element_name
 
     @classmethod
     def add_custom_module(cls, name, translation):
         translation = byteify(translation)
+        original_translation = copy.deepcopy(translation)
         try:
             open_box_blocks_defs = translation['open_box_blocks']
             click_elements_defs = translation['click_elements']
@@ -126,7 +278,16 @@ class ClickConfigurationBuilder(object):
 
         cls._installed_modules[name] = dict(open_box_blocks=open_box_blocks,
                                             click_elements=click_elements,
-                                            click_blocks=click_blocks)
+                                            click_blocks=click_blocks,
+                                            translation=original_translation)
+
+
+def _read_constant(transform_function, constant, value):
+    return transform_function(constant)
+
+
+def _read_merged_ports(transform_function, merged_ports, value):
+    return transform_function(click_optimizations.merge_counter_ports(merged_ports, value))
 
 
 def byteify(input):
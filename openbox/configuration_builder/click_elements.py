@@ -545,4 +545,12 @@ SetTimestampDelta = build_element('SetTimestampDelta',
 StringClassifier = build_element("StringClassifier",
                                  list_argument=ListArguments('pattern'),
                                  read_handlers=['pattern$i'],
-                                 write_handlers=['pattern$i'])
\ No newline at end of file
+                                 write_handlers=['pattern$i'])
+Paint = build_element('Paint',
+                      mandatory_positional=[MandatoryPositionalArgument('color')],
+                      optional_positional=[OptionalPositionalArgument('anno')],
+                      read_handlers=['color'],
+                      write_handlers=['color'])
+
+PaintSwitch = build_element('PaintSwitch',
+                            optional_positional=[OptionalPositionalArgument('anno')])
@@ -0,0 +1,474 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Optimizations over a translated Click configuration.
+
+Each optimization takes a ClickConfiguration and returns the optimized
+configuration and a dict mapping the name of each replaced element to the element
+that took its place (or None if the element was removed), so handlers of the original
+blocks can still be resolved.
+"""
+import copy
+import json
+import re
+from collections import OrderedDict, defaultdict
+
+from click_configuration import ClickConfiguration
+from click_elements import Element
+from connection import Connection
+
+# Elements that build a matching automaton from their configuration
+SHAREABLE_ELEMENTS_TYPES = ('RegexMatcher', 'RegexClassifier', 'StringClassifier', 'GroupRegexClassifier')
+
+# A Paint color is a single byte
+MAX_SHARING_ELEMENTS = 256
+
+SHARED_ELEMENT_PATTERN = 'openbox_shared@_@{type}_{num}'
+PAINT_PATTERN = '{element}_paint'
+DISPATCH_PATTERN = '{element}_dispatch_{port}'
+
+# Elements that never emit packets
+IDLE_ELEMENTS_TYPES = ('Idle', 'SimpleIdle')
+IDLE_ELEMENT_NAME = 'openbox_optimized@_@idle'
+
+COUNTER_ELEMENTS_TYPES = ('Counter', 'MultiCounter')
+
+# The read handlers of a MultiCounter formatting a value for each of its ports
+MULTI_COUNTER_PORTS_HANDLERS = ('count', 'byte_count', 'rate', 'byte_rate')
+
+MATCH_ALL_PATTERN = '-'
+DISCARD_PATTERN = '{element}_discard'
+
+# A single Classifier clause: [!]offset/value[%mask]
+_CLASSIFIER_CLAUSE = re.compile(r'^!?\d+/[0-9a-fA-F?]+(%[0-9a-fA-F?]+)?$')
+
+
+def _element_type(element):
+    return element.__class__.__name__
+
+
+def _element_key(element):
+    # The element's Click configuration without its name
+    return element.to_click_config()[len(element.name):]
+
+
+def _chunks(items, size):
+    return [items[i:i + size] for i in xrange(0, len(items), size)]
+
+
+def share_matchers(click_config):
+    """
+    Replace identically configured matching elements with a single shared element.
+
+    Packets entering each of the replaced elements are painted with a color of their own
+    before entering the shared element, and each output of the shared element is dispatched
+    by the color back to where the output of the replaced element was connected.
+    Only identical configurations are shared, since a classifier with a different set (or order) of
+    patterns may send the same packet to a different output.
+    The handlers of a shared element can't be written, since a write would change
+    the behaviour of every block sharing it.
+
+    :type click_config: ClickConfiguration
+    :rtype: tuple(ClickConfiguration, dict)
+    """
+    groups = OrderedDict()
+    for element in click_config.elements:
+        if _element_type(element) in SHAREABLE_ELEMENTS_TYPES:
+            groups.setdefault(_element_key(element), []).append(element)
+
+    elements = list(click_config.elements)
+    connections = list(click_config.connections)
+    aliases = {}
+    shared_number = 0
+    for group in groups.itervalues():
+        for sharing in _chunks(group, MAX_SHARING_ELEMENTS):
+            if len(sharing) < 2:
+                continue
+            shared_name = SHARED_ELEMENT_PATTERN.format(type=_element_type(sharing[0]).lower(), num=shared_number)
+            shared_number += 1
+            elements, connections = _share_element(elements, connections, sharing, shared_name)
+            for element in sharing:
+                aliases[element.name] = shared_name
+
+    return ClickConfiguration(click_config.requirements, elements, connections), aliases
+
+
+def _share_element(elements, connections, sharing, shared_name):
+    colors = dict((element.name, color) for color, element in enumerate(sharing))
+    shared = copy.copy(sharing[0])
+    shared.name = shared_name
+
+    new_elements = []
+    new_connections = []
+    dispatchers = OrderedDict()
+    for connection in connections:
+        src, src_port, dst, dst_port = connection.src, connection.src_port, connection.dst, connection.dst_port
+        if src in colors:
+            if src_port not in dispatchers:
+                dispatchers[src_port] = DISPATCH_PATTERN.format(element=shared_name, port=src_port)
+            src, src_port = dispatchers[src_port], colors[src]
+        if dst in colors:
+            dst, dst_port = PAINT_PATTERN.format(element=dst), 0
+        new_connections.append(Connection(src, dst, src_port, dst_port))
+
+    for element in sharing:
+        paint_name = PAINT_PATTERN.format(element=element.name)
+        new_elements.append(Element.from_dict(dict(name=paint_name, type='Paint',
+                                                   config=dict(color=colors[element.name]))))
+        new_connections.append(Connection(paint_name, shared_name, 0, 0))
+    new_elements.append(shared)
+    for port, dispatcher_name in dispatchers.iteritems():
+        new_elements.append(Element.from_dict(dict(name=dispatcher_name, type='PaintSwitch', config={})))
+        new_connections.append(Connection(shared_name, dispatcher_name, port, 0))
+
+    # the shared elements take the place of the first element in the group
+    result = []
+    for element in elements:
+        if element.name == sharing[0].name:
+            result.extend(new_elements)
+        elif element.name not in colors:
+            result.append(element)
+
+    return result, new_connections
+
+
+def update_aliases(aliases, new_aliases):
+    """
+    Add the aliases of a new optimization to the aliases of the previous ones,
+    so each original element is mapped to the element that finally took its place.
+    """
+    for name, alias in aliases.iteritems():
+        if alias in new_aliases:
+            aliases[name] = new_aliases[alias]
+    aliases.update(new_aliases)
+    return aliases
+
+
+def _inputs_by_element(connections):
+    inputs = defaultdict(list)
+    for connection in connections:
+        inputs[connection.dst].append(connection)
+    return inputs
+
+
+def _outputs_by_element(connections):
+    outputs = defaultdict(list)
+    for connection in connections:
+        outputs[connection.src].append(connection)
+    return outputs
+
+
+def _compact_idle_ports(elements, connections):
+    """
+    Renumber the ports of Idle elements so they have no unused ports
+    and remove Idle elements that are not connected at all.
+    """
+    idle_names = set(element.name for element in elements if _element_type(element) in IDLE_ELEMENTS_TYPES)
+    next_output = defaultdict(int)
+    next_input = defaultdict(int)
+    compacted = []
+    for connection in connections:
+        if connection.src in idle_names and connection.dst in idle_names:
+            continue
+        src_port, dst_port = connection.src_port, connection.dst_port
+        if connection.src in idle_names:
+            src_port = next_output[connection.src]
+            next_output[connection.src] += 1
+        if connection.dst in idle_names:
+            dst_port = next_input[connection.dst]
+            next_input[connection.dst] += 1
+        compacted.append(Connection(connection.src, connection.dst, src_port, dst_port))
+    elements = [element for element in elements
+                if element.name not in idle_names or next_output[element.name] or next_input[element.name]]
+    return elements, compacted
+
+
+def _live_output_ports(element, live_input_ports, outputs):
+    if _element_type(element) in COUNTER_ELEMENTS_TYPES:
+        # a counter passes packets from each input only to the output with the same number
+        return set(port for port in live_input_ports)
+    return set(connection.src_port for connection in outputs)
+
+
+def remove_dead_elements(click_config):
+    """
+    Remove elements that no packet can reach.
+
+    Packets enter the configuration at elements without inputs (except Idle elements which never emit packets),
+    every element with no path from such a source is removed. Inputs of the remaining elements
+    that were fed only by removed elements are fed by an Idle element instead, and their outputs
+    that were connected to removed elements are connected to it as well.
+
+    :type click_config: ClickConfiguration
+    :rtype: tuple(ClickConfiguration, dict)
+    """
+    elements_by_name = OrderedDict((element.name, element) for element in click_config.elements)
+    inputs = _inputs_by_element(click_config.connections)
+    outputs = _outputs_by_element(click_config.connections)
+    idle_names = set(name for name, element in elements_by_name.iteritems()
+                     if _element_type(element) in IDLE_ELEMENTS_TYPES)
+
+    # the input ports that packets can reach, by element
+    live = defaultdict(set)
+    pending = [(name, None) for name in elements_by_name if name not in inputs and name not in idle_names]
+    while pending:
+        name, port = pending.pop()
+        if name in live and port in live[name]:
+            continue
+        live[name].add(port)
+        live_ports = _live_output_ports(elements_by_name[name], live[name], outputs[name])
+        pending.extend((connection.dst, connection.dst_port) for connection in outputs[name]
+                       if connection.src_port in live_ports and connection.dst in elements_by_name)
+
+    dead = set(name for name in elements_by_name if name not in live and name not in idle_names)
+    if not dead:
+        return click_config, {}
+
+    connections = []
+    fed_inputs = set((connection.dst, connection.dst_port) for connection in click_config.connections
+                     if connection.src not in dead)
+    starved_inputs = OrderedDict()
+    for connection in click_config.connections:
+        if connection.src not in dead and connection.dst not in dead:
+            connections.append(connection)
+        elif connection.src not in dead:
+            # an output of a remaining element that no packet leaves through
+            connections.append(Connection(connection.src, IDLE_ELEMENT_NAME, connection.src_port, 0))
+        elif connection.dst not in dead and (connection.dst, connection.dst_port) not in fed_inputs:
+            starved_inputs[(connection.dst, connection.dst_port)] = True
+    for dst, dst_port in starved_inputs:
+        connections.append(Connection(IDLE_ELEMENT_NAME, dst, 0, dst_port))
+
+    elements = [element for name, element in elements_by_name.iteritems() if name not in dead]
+    elements.append(Element.from_dict(dict(name=IDLE_ELEMENT_NAME, type='Idle', config={})))
+    elements, connections = _compact_idle_ports(elements, connections)
+    return ClickConfiguration(click_config.requirements, elements, connections), dict.fromkeys(dead)
+
+
+def _bypass_element(connections, name, port_mapping):
+    """
+    Connect the inputs of an element directly to the elements its outputs are connected to.
+
+    :param port_mapping: A function from the element's input port to its output port
+    """
+    outputs = defaultdict(list)
+    for connection in connections:
+        if connection.src == name:
+            outputs[connection.src_port].append(connection)
+
+    bypassed = []
+    for connection in connections:
+        if connection.src == name:
+            continue
+        if connection.dst == name:
+            for output in outputs[port_mapping(connection.dst_port)]:
+                bypassed.append(Connection(connection.src, output.dst, connection.src_port, output.dst_port))
+        else:
+            bypassed.append(connection)
+    return bypassed
+
+
+def _is_pass_through(element, outputs):
+    """
+    A Classifier that ends with a match all pattern and sends all of its outputs
+    to the same place passes every packet it receives unchanged.
+    """
+    if _element_type(element) != 'Classifier' or not element.pattern or element.pattern[-1] != MATCH_ALL_PATTERN:
+        return False
+    destinations = set((connection.dst, connection.dst_port) for connection in outputs)
+    return len(destinations) == 1 and len(outputs) == len(element.pattern)
+
+
+def collapse_pass_through(click_config):
+    """
+    Remove elements that pass every packet unchanged to a single destination.
+
+    :type click_config: ClickConfiguration
+    :rtype: tuple(ClickConfiguration, dict)
+    """
+    connections = click_config.connections
+    removed = set()
+    for element in click_config.elements:
+        outputs = [connection for connection in connections if connection.src == element.name]
+        if _is_pass_through(element, outputs):
+            first_output_port = outputs[0].src_port
+            connections = _bypass_element(connections, element.name, lambda port: first_output_port)
+            removed.add(element.name)
+
+    if not removed:
+        return click_config, {}
+    elements = [element for element in click_config.elements if element.name not in removed]
+    return ClickConfiguration(click_config.requirements, elements, connections), dict.fromkeys(removed)
+
+
+def _is_simple_pattern(pattern):
+    return pattern == MATCH_ALL_PATTERN or all(_CLASSIFIER_CLAUSE.match(clause) for clause in pattern.split())
+
+
+def _combine_patterns(first, second):
+    if first == MATCH_ALL_PATTERN:
+        return second
+    if second == MATCH_ALL_PATTERN:
+        return first
+    return first + ' ' + second
+
+
+def _single_output(outputs, port):
+    port_outputs = [connection for connection in outputs if connection.src_port == port]
+    return port_outputs[0] if len(port_outputs) == 1 else None
+
+
+def _find_fusible(elements_by_name, inputs, outputs):
+    """
+    Find a Classifier fed only by an output of a MultiCounter which is fed only by outputs of another Classifier.
+
+    :return: The first Classifier, the MultiCounter, the second Classifier and the MultiCounter's port, or None
+    """
+    for name, second in elements_by_name.iteritems():
+        if (_element_type(second) != 'Classifier' or not second.pattern or len(inputs[name]) != 1 or
+                inputs[name][0].dst_port != 0):
+            continue
+        counter = elements_by_name.get(inputs[name][0].src)
+        port = inputs[name][0].src_port
+        if counter is None or _element_type(counter) != 'MultiCounter' or not _single_output(outputs[counter.name],
+                                                                                              port):
+            continue
+        counted = [connection for connection in inputs[counter.name] if connection.dst_port == port]
+        first = elements_by_name.get(counted[0].src) if counted else None
+        if (first is None or first is second or _element_type(first) != 'Classifier' or
+                any(connection.src != first.name for connection in counted) or
+                any(not _single_output(outputs[first.name], connection.src_port) for connection in counted) or
+                any(not _single_output(outputs[name], output_port) for output_port in xrange(len(second.pattern)))):
+            continue
+        if all(_is_simple_pattern(pattern) for pattern in first.pattern + second.pattern):
+            return first, counter, second, port
+    return None
+
+
+def _fuse(elements, connections, first, counter, second, port):
+    """
+    Replace each pattern of the first Classifier sending packets to the counter's port with the patterns
+    of the second Classifier, each combined with the replaced pattern.
+
+    Each of the second Classifier's outputs gets a port of the counter, so the packets are still counted
+    by it before reaching the second Classifier's destinations.
+
+    :return: The elements, the connections and the counter's new ports mapped to the port they count for
+    """
+    fused_ports = set(connection.src_port for connection in connections
+                      if connection.src == first.name and connection.dst == counter.name and
+                      connection.dst_port == port)
+    # packets matching a replaced pattern but none of the second classifier's patterns were dropped by it after
+    # being counted, they must not fall through to the following patterns of the first classifier
+    guard = MATCH_ALL_PATTERN not in second.pattern
+    counter_ports = 1 + max(connection.dst_port if connection.dst == counter.name else connection.src_port
+                            for connection in connections if counter.name in (connection.src, connection.dst))
+    # the counter's port counts the packets of the second classifier's first output
+    outputs_ports = [port] + range(counter_ports, counter_ports + len(second.pattern) - 1)
+    guard_port = counter_ports + len(second.pattern) - 1
+    new_ports = dict((new_port, port) for new_port in outputs_ports[1:] + ([guard_port] if guard else []))
+
+    patterns = []
+    first_ports = {}
+    for i, pattern in enumerate(first.pattern):
+        first_ports[i] = len(patterns)
+        if i in fused_ports:
+            patterns.extend(_combine_patterns(pattern, second_pattern) for second_pattern in second.pattern)
+            if guard:
+                patterns.append(pattern)
+        else:
+            patterns.append(pattern)
+    fused = Element.from_dict(dict(name=first.name, type='Classifier', config=dict(pattern=patterns)))
+    discard_name = DISCARD_PATTERN.format(element=counter.name)
+
+    new_connections = []
+    for connection in connections:
+        if connection.src == first.name and connection.src_port in fused_ports:
+            for i, counter_port in enumerate(outputs_ports):
+                new_connections.append(Connection(first.name, counter.name, first_ports[connection.src_port] + i,
+                                                  counter_port))
+            if guard:
+                new_connections.append(Connection(first.name, counter.name,
+                                                  first_ports[connection.src_port] + len(second.pattern), guard_port))
+        elif connection.src == first.name:
+            new_connections.append(Connection(first.name, connection.dst, first_ports[connection.src_port],
+                                              connection.dst_port))
+        elif connection.src == second.name:
+            new_connections.append(Connection(counter.name, connection.dst, outputs_ports[connection.src_port],
+                                              connection.dst_port))
+        elif connection.dst != second.name:
+            new_connections.append(connection)
+    if guard:
+        new_connections.append(Connection(counter.name, discard_name, guard_port, 0))
+
+    new_elements = []
+    for element in elements:
+        if element.name == first.name:
+            new_elements.append(fused)
+        elif element.name != second.name:
+            new_elements.append(element)
+    if guard and discard_name not in set(element.name for element in new_elements):
+        new_elements.append(Element.from_dict(dict(name=discard_name, type='Discard', config={})))
+
+    return new_elements, new_connections, new_ports
+
+
+def fuse_classifiers(click_config):
+    """
+    Fuse Classifiers chained through a MultiCounter into a single Classifier, so each packet is classified once.
+
+    When the packets of a MultiCounter's port come only from a Classifier and go only to another Classifier,
+    the patterns of the first Classifier sending packets to that port are replaced by the patterns of the
+    second Classifier, each combined with the replaced pattern. The counter gets a port for each of the
+    second Classifier's outputs, the values of these ports are summed back to the original port when read,
+    see merge_counter_ports.
+
+    :type click_config: ClickConfiguration
+    :return: The optimized configuration, the aliases and the added ports of each counter
+        mapped to the original port they count for
+    :rtype: tuple(ClickConfiguration, dict, dict)
+    """
+    elements = click_config.elements
+    connections = click_config.connections
+    aliases = {}
+    merged_ports = defaultdict(dict)
+    while True:
+        elements_by_name = OrderedDict((element.name, element) for element in elements)
+        fusible = _find_fusible(elements_by_name, _inputs_by_element(connections), _outputs_by_element(connections))
+        if fusible is None:
+            break
+        first, counter, second, port = fusible
+        elements, connections, new_ports = _fuse(elements, connections, first, counter, second, port)
+        counter_ports = merged_ports[counter.name]
+        counter_ports.update((new_port, counter_ports.get(original, original))
+                             for new_port, original in new_ports.iteritems())
+        update_aliases(aliases, {second.name: first.name})
+
+    if not aliases:
+        return click_config, {}, {}
+    return ClickConfiguration(click_config.requirements, elements, connections), aliases, dict(merged_ports)
+
+
+def merge_counter_ports(merged_ports, value):
+    """
+    Sum the values of a MultiCounter's ports added by fuse_classifiers back to the original ports.
+
+    :param merged_ports: The added ports mapped to their original ports
+    :param value: The value of a MultiCounter ports handler, formatted as a list
+    """
+    try:
+        values = json.loads(value)
+    except (TypeError, ValueError):
+        return value
+    if not isinstance(values, list):
+        return value
+    merged = values[:len(values) - len(merged_ports)]
+    for port, port_value in enumerate(values):
+        if port in merged_ports:
+            merged[merged_ports[port]] += port_value
+    return '[{values}]'.format(values=','.join(str(port_value) for port_value in merged))
@@ -8,6 +8,8 @@ from configuration_builder.configuration_builder_exceptions import ClickBlockCon
 
 
 def _to_int(value):
+    if not isinstance(value, basestring):
+        return int(value)
     try:
         return int(value, 10)
     except ValueError:
@@ -15,6 +17,12 @@ def _to_int(value):
 
 
 class MatchField(object):
+    # The width of the field in bits
+    bits = 0
+
+    # Whether a mask given by the user is honored by the classifier clause
+    MASKABLE = True
+
     def __init__(self, value):
         self.value = value
 
@@ -31,31 +39,85 @@ class MatchField(object):
     def _to_output(self, value):
         return value
 
+    def to_value_and_mask(self):
+        """
+        The numeric (value, mask) pair matched by this field, with the value already masked.
+        """
+        full_mask = (1 << self.bits) - 1
+        if isinstance(self.value, basestring) and '%' in self.value:
+            value, mask = self.value.split('%')
+            mask = self._to_number(mask) & full_mask
+            return self._to_number(value) & mask, mask
+        else:
+            return self._to_number(self.value) & full_mask, full_mask
+
+    def from_value_and_mask(self, value, mask):
+        """
+        The field's configuration value that matches the given (value, mask) pair.
+        """
+        if mask == (1 << self.bits) - 1:
+            return self._from_number(value)
+        return '{value}%{mask}'.format(value=self._from_number(value), mask=self._from_number(mask))
+
+    def _to_number(self, value):
+        raise NotImplementedError()
+
+    def _from_number(self, number):
+        raise NotImplementedError()
+
 
 class IntMatchField(MatchField):
     def __init__(self, value, bytes=1):
         super(IntMatchField, self).__init__(value)
         self._fmt = "%0{bytes}x".format(bytes=bytes * 2)
+        self.bits = bytes * 8
 
     def _to_output(self, value):
         return self._fmt % _to_int(value)
 
+    def _to_number(self, value):
+        return _to_int(value)
+
+    def _from_number(self, number):
+        return str(number)
+
 
 class MacMatchField(MatchField):
+    bits = 48
+
     def _to_output(self, value):
         return value.replace(':', '').replace('-', '').lower()
 
+    def _to_number(self, value):
+        return int(self._to_output(value), 16)
+
+    def _from_number(self, number):
+        digits = '%012x' % number
+        return ':'.join(digits[i:i + 2] for i in xrange(0, 12, 2))
+
 
 class Ipv4MatchField(MatchField):
+    bits = 32
+
     def _to_output(self, value):
         return ''.join(chr(int(c)) for c in value.split('.')).encode('hex')
 
+    def _to_number(self, value):
+        return int(self._to_output(value), 16)
+
+    def _from_number(self, number):
+        return '.'.join(str((number >> shift) & 0xff) for shift in (24, 16, 8, 0))
+
 
 class BitsIntMatchField(IntMatchField):
+    # The classifier clause always uses the full mask of the bits
+    MASKABLE = False
+
     def __init__(self, value, bytes=1, bits=8, shift=0):
         super(BitsIntMatchField, self).__init__(value, bytes)
         self._mask = int('1' * bits, 2) << shift
         self._shift = shift
+        self.bits = bits
 
     def to_classifier_clause(self, offset=0):
         if self.value is None:
@@ -71,8 +133,42 @@ class BitsIntMatchField(IntMatchField):
             return '{offset}/{value}%{mask}'.format(offset=offset, value=self._to_output(value),
                                                     mask=self._to_output(self._mask))
 
+    def to_value_and_mask(self):
+        full_mask = (1 << self.bits) - 1
+        if '%' in self.value:
+            value, mask = self.value.split('%')
+            return int(value) & int(mask) & full_mask, full_mask
+        else:
+            return int(self.value) & full_mask, full_mask
+
 
 class HeaderMatch(dict):
+    # The match field class and its arguments for each supported field
+    _FIELDS = dict(ETH_SRC=(MacMatchField, {}),
+                   ETH_DST=(MacMatchField, {}),
+                   ETH_TYPE=(IntMatchField, dict(bytes=2)),
+                   VLAN_VID=(BitsIntMatchField, dict(bytes=2, bits=12)),
+                   VLAN_PCP=(BitsIntMatchField, dict(bytes=1, bits=3, shift=5)),
+                   IPV4_PROTO=(IntMatchField, dict(bytes=1)),
+                   IPV4_SRC=(Ipv4MatchField, {}),
+                   IPV4_DST=(Ipv4MatchField, {}),
+                   TCP_SRC=(IntMatchField, dict(bytes=2)),
+                   TCP_DST=(IntMatchField, dict(bytes=2)),
+                   UDP_SRC=(IntMatchField, dict(bytes=2)),
+                   UDP_DST=(IntMatchField, dict(bytes=2)))
+
+    def match_field(self, name, value=None):
+        clazz, kwargs = self._FIELDS[name]
+        return clazz(self[name] if value is None else value, **kwargs)
+
+    def to_values_and_masks(self):
+        """
+        The numeric (value, mask) pair of each field in the match.
+
+        :rtype: dict
+        """
+        return dict((name, self.match_field(name).to_value_and_mask()) for name in self)
+
     def to_patterns(self, allow_vlan=True):
         patterns = []
         clauses = []
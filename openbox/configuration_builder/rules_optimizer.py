@@ -0,0 +1,165 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Optimizations of the ordered header rules of classifying blocks.
+
+Rules are evaluated in order and the first matching rule wins, so a rule
+whose packets are all matched by earlier rules can never be reached and can be dropped.
+"""
+
+from matching import HeaderMatch
+
+
+class RemovalReason:
+    # Fully covered by a single earlier rule
+    SHADOWED = 'shadowed'
+
+    # Fully covered by the union of several earlier rules
+    UNREACHABLE = 'unreachable'
+
+    # Merged into the previous rule which has the same target
+    MERGED = 'merged'
+
+
+class _Rule(object):
+    __slots__ = ['number', 'match', 'target', 'fields']
+
+    def __init__(self, number, match, target, fields):
+        self.number = number
+        self.match = match
+        self.target = target
+        self.fields = fields
+
+
+def _covers(general, specific):
+    """
+    Check if every packet matched by specific is also matched by general
+    """
+    for field, (value, mask) in general.iteritems():
+        try:
+            specific_value, specific_mask = specific[field]
+        except KeyError:
+            return False
+        if mask & ~specific_mask or specific_value & mask != value:
+            return False
+    return True
+
+
+def _merge(first, second):
+    """
+    Merge two matches that differ in a single bit of a single field.
+
+    :return: The merged fields and the name of the field that changed (None if they are identical)
+             or (None, None) if the matches cannot be merged.
+    """
+    if len(first) != len(second):
+        return None, None
+    changed_field = None
+    for field, (value, mask) in first.iteritems():
+        try:
+            other_value, other_mask = second[field]
+        except KeyError:
+            return None, None
+        if mask != other_mask:
+            return None, None
+        if value != other_value:
+            difference = value ^ other_value
+            if changed_field is not None or difference & (difference - 1):
+                return None, None
+            changed_field = field
+
+    merged = dict(first)
+    if changed_field is not None:
+        value, mask = first[changed_field]
+        bit = value ^ second[changed_field][0]
+        merged[changed_field] = (value & ~bit, mask & ~bit)
+    return merged, changed_field
+
+
+def _find_cover(coverage, fields):
+    for covering_fields, numbers in coverage:
+        if _covers(covering_fields, fields):
+            return numbers
+    return None
+
+
+def _add_coverage(coverage, fields, numbers):
+    # keep merging the new entry with existing ones, each merge covers exactly the union of both
+    merged_any = True
+    while merged_any:
+        merged_any = False
+        for i, (other_fields, other_numbers) in enumerate(coverage):
+            merged, _ = _merge(other_fields, fields)
+            if merged is not None:
+                del coverage[i]
+                fields = merged
+                numbers = numbers | other_numbers
+                merged_any = True
+                break
+    coverage[:] = [(other_fields, other_numbers) for other_fields, other_numbers in coverage
+                   if not _covers(fields, other_fields)]
+    coverage.append((fields, numbers))
+
+
+def _merge_with_previous(previous, fields):
+    merged, changed_field = _merge(previous.fields, fields)
+    if merged is None:
+        return False
+    if changed_field is not None:
+        field = previous.match.match_field(changed_field)
+        if not field.MASKABLE:
+            return False
+        previous.match = HeaderMatch(previous.match)
+        previous.match[changed_field] = field.from_value_and_mask(*merged[changed_field])
+    previous.fields = merged
+    return True
+
+
+def optimize_header_matches(matches, targets=None):
+    """
+    Remove shadowed and unreachable rules and merge adjacent rules with the same target.
+
+    :param matches: The header matches ordered by priority
+    :type matches: list(HeaderMatch)
+    :param targets: A hashable target for each rule, only adjacent rules with the same target are merged.
+                    By default each rule has its own target.
+    :type targets: list | None
+    :return: A list of the (rule_number, match) to keep and a list of the removed rules,
+             where each removed rule is a dict with its rule number, the reason and the covering rules.
+    :rtype: tuple(list(tuple(int, HeaderMatch)), list(dict))
+    """
+    if targets is None:
+        targets = range(len(matches))
+
+    kept = []
+    removed = []
+    coverage = []
+    for number, (match, target) in enumerate(zip(matches, targets)):
+        match = HeaderMatch(match)
+        try:
+            fields = match.to_values_and_masks()
+        except (ValueError, TypeError, KeyError):
+            # we can't reason about this rule, so keep it and don't let it affect other rules
+            kept.append(_Rule(number, match, target, None))
+            continue
+
+        covering = _find_cover(coverage, fields)
+        if covering is not None:
+            reason = RemovalReason.SHADOWED if len(covering) == 1 else RemovalReason.UNREACHABLE
+            removed.append(dict(rule=number, reason=reason, covered_by=sorted(covering)))
+            continue
+
+        _add_coverage(coverage, fields, frozenset([number]))
+        previous = kept[-1] if kept else None
+        if (previous is not None and previous.fields is not None and previous.target == target and
+                _merge_with_previous(previous, fields)):
+            removed.append(dict(rule=number, reason=RemovalReason.MERGED, covered_by=[previous.number]))
+        else:
+            kept.append(_Rule(number, match, target, fields))
+
+    return [(rule.number, rule.match) for rule in kept], removed
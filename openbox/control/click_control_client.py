@@ -13,6 +13,7 @@ import time
 from control_exceptions import (UnknownHandlerOperation, ControlError, ControlSyntaxError, HandlerError,
                         NoRouterInstalledError, NoSuchElementError, NoSuchHandlerError, PermissionDeniedError,
                         UnimplementedCommandError, DataTooBigError)
+from histogram import Histogram
 
 
 class ResponseCodes:
@@ -53,6 +54,9 @@ _EXCPTIONS_CODE_MAPPING = {
 }
 
 CONNECT_RETRIES = 50
+# the upper bounds in seconds of the buckets of the latency and hotswap duration histograms
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+HOTSWAP_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
 CHATTER_SOCKET_REGEXP = re.compile(r'ChatterSocket\(.*\)')
 CONTROL_SOCKET_REGEXP = re.compile(r'ControlSocket\(.*\)')
 
@@ -67,6 +71,16 @@ class ClickControlClient(object):
         self.address = None
         self._socket = None
         self.connected = False
+        self._command_time = 0.0
+        self._latency = Histogram(LATENCY_BUCKETS)
+        self._hotswap_duration = Histogram(HOTSWAP_BUCKETS)
+
+    def metrics(self):
+        """
+        The histograms of the control socket commands latency and of the hotswaps duration
+        """
+        return dict(control_socket_latency=self._latency.snapshot(),
+                    hotswap_duration=self._hotswap_duration.snapshot())
 
     def connect(self, address, family=socket.AF_INET):
         self.family = family
@@ -109,6 +123,7 @@ class ClickControlClient(object):
         return self._read_global('config')
 
     def hotswap(self, new_config):
+        start = time.time()
         new_config = self._migrate_control_elements(new_config)
         self._write_global('hotconfig', data=new_config)
         for _ in xrange(CONNECT_RETRIES):
@@ -120,6 +135,7 @@ class ClickControlClient(object):
                 break
             except socket.error:
                 time.sleep(0.1)
+        self._hotswap_duration.observe(time.time() - start)
 
     def elements_names(self):
         raw = self._read_global('list')
@@ -159,12 +175,14 @@ class ClickControlClient(object):
         cmd = self._build_cmd(Commands.CHECK_READ, element_name, handler_name, '')
         self._write_line(cmd)
         response_code, response_msg = self._read_response()
+        self._command_done()
         return response_code == ResponseCodes.OK
 
     def is_writeable_handler(self, element_name, handler_name):
         cmd = self._build_cmd(Commands.CHECK_WRITE, element_name, handler_name, '')
         self._write_line(cmd)
         response_code, response_msg = self._read_response()
+        self._command_done()
         return response_code == ResponseCodes.OK
 
     def write_handler(self, element_name, handler_name, params='', data=''):
@@ -176,6 +194,7 @@ class ClickControlClient(object):
         if data:
             self._write_raw(data)
         response_code, response_code_msg = self._read_response()
+        self._command_done()
         if response_code not in (ResponseCodes.OK, ResponseCodes.OK_BUT_WITH_WARNINGS):
             self._raise_exception(element_name, handler_name, response_code, response_code_msg)
         return response_code
@@ -185,9 +204,12 @@ class ClickControlClient(object):
         self._write_line(cmd)
         response_code, response_code_msg = self._read_response()
         if response_code not in (ResponseCodes.OK, ResponseCodes.OK_BUT_WITH_WARNINGS):
+            self._command_done()
             self._raise_exception(element_name, handler_name, response_code, response_code_msg)
         data_size = self._read_data_size()
         data = self._read_raw(data_size)
+        # the latency of a read includes its data
+        self._command_done()
         return data
 
     def operations_sequence(self, operations, preserve_order=False):
@@ -259,6 +281,9 @@ class ClickControlClient(object):
         response_code = int(last_line[:3])
         return response_code, response
 
+    def _command_done(self):
+        self._latency.observe(time.time() - self._command_time)
+
     def _read_data_size(self):
         data_size_line = self._readline()
         return int(data_size_line.split(' ')[1])
@@ -282,6 +307,8 @@ class ClickControlClient(object):
         return line
 
     def _write_line(self, data, delim='\r\n'):
+        # each command is a line, its latency is measured until its response and data are read
+        self._command_time = time.time()
         self._write_raw("{data}{delim}".format(data=data, delim=delim))
 
     def _write_raw(self, data):
@@ -297,8 +324,8 @@ class ClickControlClient(object):
         new_control_socket = CONTROL_SOCKET_REGEXP.findall(new_config)
         new_chatter_socket = CHATTER_SOCKET_REGEXP.findall(new_config)
         if not new_chatter_socket and old_chatter_socket:
-            # we add the old ChatterSocket only if it is not present in the new config but was in the old
-            chatter_socket = old_chatter_socket[0] + ';\n'
+            # we add the old ChatterSockets only if they are not present in the new config but were in the old
+            chatter_socket = ''.join(element + ';\n' for element in old_chatter_socket)
             new_config = chatter_socket + new_config
         if not new_control_socket and old_control_socket:
             # we add the old ControlSocket only if it is not present in the new config but was in the old
@@ -32,3 +32,4 @@ class RestServer:
         HANDLER_PATTERN = '/control/elements/{element}/{handler}'
         HANDLER = HANDLER_PATTERN.format(element='(.*)', handler='(.*)')
         LIST_HANDLERS = '/control/elements/(.*)'
+        METRICS = '/control/metrics'
@@ -137,6 +137,11 @@ class ConfigRequestHandler(BaseControlRequestHandler):
             raise tornado.web.HTTPError(500, reason=e.message)
 
 
+class MetricsRequestHandler(BaseControlRequestHandler):
+    def get(self, *args, **kwargs):
+        self._write(self._engine().metrics())
+
+
 class ListElementsRequestHandler(BaseControlRequestHandler):
     def get(self, *args, **kwargs):
         engine = self.control.engine
@@ -0,0 +1,53 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+A fixed-bucket histogram, shared by the manager's metrics registry and the control process,
+which sends snapshots of its histograms to the manager.
+"""
+import bisect
+
+# The default histogram buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histogram(object):
+    """
+    Counts observations in buckets with fixed upper bounds, the last bucket is unbounded.
+    """
+    __slots__ = ('buckets', 'counts', 'sum', 'count')
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def snapshot(self):
+        """
+        The observations, to be loaded by a histogram in another process
+        """
+        return dict(buckets=list(self.buckets), counts=list(self.counts), sum=self.sum, count=self.count)
+
+    def load(self, snapshot):
+        """
+        Replace the observations with a snapshot taken in another process
+
+        :param snapshot: A dict with the buckets, the count of each bucket including the unbounded one,
+            the sum and the count of the observations
+        """
+        if len(snapshot['counts']) != len(snapshot['buckets']) + 1:
+            raise ValueError("A histogram snapshot must have a count for each bucket and the unbounded one")
+        self.buckets = tuple(snapshot['buckets'])
+        self.counts = list(snapshot['counts'])
+        self.sum = snapshot['sum']
+        self.count = snapshot['count']
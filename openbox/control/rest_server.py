@@ -12,7 +12,8 @@ import tornado.options
 from handlers import (EnginesRequestHandler, CloseRequestHandler, ConfigRequestHandler,
                       ConnectRequestHandler, ElementRequestHandler, EngineVersionRequestHandler,
                       ListElementsRequestHandler, IsReadableRequestHandler, IsWriteableRequestHandler,
-                      LoadedPackagesRequestHandler, SequenceRequestHandler, SupportedElementsRequestHandler)
+                      LoadedPackagesRequestHandler, SequenceRequestHandler, SupportedElementsRequestHandler,
+                      MetricsRequestHandler)
 from config import RestServer, ENGINES
 
 
@@ -56,6 +57,7 @@ def run(port, debug=False):
         (RestServer.Endpoints.IS_WRITEABLE, IsWriteableRequestHandler, dict(control=server_control)),
         (RestServer.Endpoints.HANDLER, ElementRequestHandler, dict(control=server_control)),
         (RestServer.Endpoints.LIST_HANDLERS, ElementRequestHandler, dict(control=server_control)),
+        (RestServer.Endpoints.METRICS, MetricsRequestHandler, dict(control=server_control)),
     ], debug=debug)
     application.listen(port)
     tornado.ioloop.IOLoop.current().start()
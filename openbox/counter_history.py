@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+A bounded history of block counters, sampled at a fixed cadence.
+"""
+import array
+import json
+import math
+import time
+
+from tornado import gen
+from tornado.ioloop import PeriodicCallback
+from tornado.log import app_log
+
+from manager_exceptions import CounterHistoryError, EngineNotRunningError, ProcessingGraphNotSetError
+
+
+class RingBuffer(object):
+    """
+    A fixed size buffer of timestamped values, the oldest values are overwritten when it is full.
+    """
+
+    def __init__(self, size):
+        self.size = size
+        self._times = array.array('d', [0.0]) * size
+        self._values = array.array('d', [0.0]) * size
+        self._next = 0
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def append(self, timestamp, value):
+        self._times[self._next] = timestamp
+        self._values[self._next] = value
+        self._next = (self._next + 1) % self.size
+        self._count = min(self._count + 1, self.size)
+
+    def since(self, timestamp):
+        """
+        The (time, value) pairs sampled at or after the given time, from the oldest to the newest
+        """
+        samples = []
+        for i in xrange(1, self._count + 1):
+            index = (self._next - i) % self.size
+            if self._times[index] < timestamp:
+                break
+            samples.append((self._times[index], self._values[index]))
+        samples.reverse()
+        return samples
+
+
+def _percentile(sorted_values, percentile):
+    # nearest rank
+    rank = int(math.ceil(percentile / 100.0 * len(sorted_values)))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def _summary(values):
+    if not values:
+        return None
+    sorted_values = sorted(values)
+    return dict(min=sorted_values[0], max=sorted_values[-1], avg=sum(sorted_values) / len(sorted_values),
+                p99=_percentile(sorted_values, 99))
+
+
+def counter_value(result):
+    """
+    The value of a read counter handler, a MultiCounter handler is read as the sum of the list of its ports' values
+
+    :raise ValueError: If the result isn't a number or a list of numbers
+    """
+    if isinstance(result, basestring):
+        result = result.strip()
+        if result.startswith('['):
+            result = json.loads(result)
+    if isinstance(result, list):
+        return float(sum(float(value) for value in result))
+    if isinstance(result, bool) or result is None:
+        raise ValueError("Not a number: {value!r}".format(value=result))
+    return float(result)
+
+
+class CounterHistory(object):
+    """
+    Samples a set of block read handlers into ring buffers and answers window queries over them.
+    The per port values of a MultiCounter handler are kept as their sum, the value of the whole block.
+
+    The rate between two samples is the change of the value divided by the time between them,
+    a decrease of the value is taken as a reset of the counter and has no rate.
+    """
+
+    def __init__(self, read_block_values, size, interval, max_handlers):
+        """
+        :param read_block_values: A coroutine reading a list of block handlers
+        :param size: The number of samples kept for each handler
+        :param interval: The interval in milliseconds between samples
+        :param max_handlers: The maximal number of sampled handlers
+        """
+        self.read_block_values = read_block_values
+        self.size = size
+        self.interval = interval
+        self.max_handlers = max_handlers
+        self._buffers = {}
+        self._periodic_callback = None
+        self._sampling = False
+        # the handlers whose last value couldn't be parsed, so a failure is logged once until they are parsed again
+        self._unparsed = set()
+
+    def handlers(self):
+        return [dict(block_id=block_id, read_handle=read_handle) for block_id, read_handle in sorted(self._buffers)]
+
+    def check_handlers(self, handlers):
+        """
+        Check a list of handlers to sample without changing the sampled handlers.
+
+        :return: The block_id and read_handle of each handler
+        :rtype: set
+        :raises CounterHistoryError: If the handlers can't be sampled
+        """
+        try:
+            keys = set((handler['block_id'], handler['read_handle']) for handler in handlers)
+        except (KeyError, TypeError):
+            raise CounterHistoryError("Each sampled handler must have a block_id and a read_handle")
+        if len(keys) > self.max_handlers:
+            raise CounterHistoryError("Unable to sample more than {max} handlers".format(max=self.max_handlers))
+        return keys
+
+    def set_handlers(self, handlers):
+        """
+        Set the sampled handlers, the history of handlers that are still sampled is kept.
+
+        :param handlers: The block_id and read_handle of each handler
+        """
+        keys = self.check_handlers(handlers)
+        self._buffers = dict((key, self._buffers[key] if key in self._buffers else RingBuffer(self.size))
+                             for key in keys)
+        self.stop()
+        if self._buffers:
+            self._periodic_callback = PeriodicCallback(self._sample, self.interval)
+            self._periodic_callback.start()
+
+    def stop(self):
+        if self._periodic_callback is not None:
+            self._periodic_callback.stop()
+            self._periodic_callback = None
+
+    def query(self, block_id, read_handle, window):
+        """
+        Summarize the history of a handler over the last window seconds.
+
+        :return: The number of samples, the last value and the min, max, avg and p99 of the values and the rates
+        :rtype: dict
+        """
+        try:
+            buffer = self._buffers[(block_id, read_handle)]
+        except KeyError:
+            raise CounterHistoryError("Handler {handler} of block {block} is not sampled".format(handler=read_handle,
+                                                                                                 block=block_id))
+        samples = buffer.since(time.time() - window)
+        values = [value for _, value in samples]
+        rates = [(value - previous_value) / (timestamp - previous_time)
+                 for (previous_time, previous_value), (timestamp, value) in zip(samples, samples[1:])
+                 if value >= previous_value and timestamp > previous_time]
+        return dict(samples=len(samples), last=values[-1] if values else None,
+                    value=_summary(values), rate=_summary(rates))
+
+    @gen.coroutine
+    def _sample(self):
+        if self._sampling:
+            return
+        self._sampling = True
+        try:
+            timestamp = time.time()
+            results = yield self.read_block_values(self.handlers())
+            for result in results:
+                key = (result['block_id'], result['read_handle'])
+                buffer = self._buffers.get(key)
+                if buffer is None or result['error'] is not None:
+                    continue
+                try:
+                    buffer.append(timestamp, counter_value(result['result']))
+                except (TypeError, ValueError) as e:
+                    if key not in self._unparsed:
+                        self._unparsed.add(key)
+                        app_log.warning("Unable to sample handler {handler} of block {block}, "
+                                        "its value is not a counter: {error}".format(handler=key[1], block=key[0],
+                                                                                     error=e))
+                else:
+                    self._unparsed.discard(key)
+        except (EngineNotRunningError, ProcessingGraphNotSetError):
+            pass
+        except Exception as e:
+            app_log.error("Unable to sample counters history: {error}".format(error=e))
+        finally:
+            self._sampling = False
@@ -7,7 +7,11 @@
 
 import traceback
 from cStringIO import StringIO
-from manager_exceptions import (ManagerError, EngineNotRunningError, ProcessingGraphNotSetError)
+from manager_exceptions import (ManagerError, EngineNotRunningError, ProcessingGraphNotSetError,
+                                ProcessingGraphOverBudgetError, GraphCompilationTimeoutError,
+                                GraphCompilationCancelledError, BadSubscriptionError, UnknownSubscriptionError,
+                                CounterHistoryError, PushMessageLimitError, LogSinkError,
+                                UnsupportedWireFormatError, BadProcessingGraphBudgetError)
 from configuration_builder.configuration_builder_exceptions import (ClickBlockConfigurationError,
                                                                     ClickElementConfigurationError,
                                                                     ConfigurationError,
@@ -71,6 +75,13 @@ def exception_to_error_args(exc_type, exc_value, exc_tb):
         error_type = ErrorType.BAD_REQUEST
         error_subtype = ErrorSubType.ILLEGAL_STATE
         exception_message = "Processing graph is not set"
+    elif exc_type == GraphCompilationCancelledError:
+        error_type = ErrorType.BAD_REQUEST
+        error_subtype = ErrorSubType.ILLEGAL_STATE
+    elif exc_type in (BadSubscriptionError, UnknownSubscriptionError, CounterHistoryError, PushMessageLimitError,
+                      LogSinkError, UnsupportedWireFormatError, BadProcessingGraphBudgetError):
+        error_type = ErrorType.BAD_REQUEST
+        error_subtype = ErrorSubType.ILLEGAL_ARGUMENT
     elif exc_type in (EngineElementConfigurationError, ClickElementConfigurationError, ClickBlockConfigurationError,
                       OpenBoxBlockConfigurationError):
         error_type = ErrorType.BAD_REQUEST
@@ -78,7 +89,8 @@ def exception_to_error_args(exc_type, exc_value, exc_tb):
     elif exc_type == ConnectionConfigurationError:
         error_type = ErrorType.BAD_REQUEST
         error_subtype = ErrorSubType.BAD_CONNECTOR
-    elif exc_type in (OpenBoxConfigurationError, EngineConfigurationError, ConfigurationError):
+    elif exc_type in (OpenBoxConfigurationError, EngineConfigurationError, ConfigurationError,
+                      ProcessingGraphOverBudgetError, GraphCompilationTimeoutError):
         error_type = ErrorType.BAD_REQUEST
         error_subtype = ErrorSubType.BAD_GRAPH
 
@@ -0,0 +1,201 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Compiles processing graphs in a pool of worker processes, so the IOLoop is not blocked while a large graph is compiled.
+"""
+import copy
+import datetime
+import multiprocessing
+import pickle
+from Queue import Empty
+
+from tornado import gen
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop, PeriodicCallback
+from tornado.log import app_log
+
+from manager_exceptions import GraphCompilationTimeoutError, GraphCompilationCancelledError, GraphCompilationError
+
+
+def _announce_worker(started_workers):
+    # the pool starts a worker in place of each worker that died, so a new announcement means a worker died
+    started_workers.put(None)
+
+
+def _compile_block(engine_builder, block_config, custom_modules):
+    # exceptions are returned since the callbacks of a pool in python 2 are only called on success
+    try:
+        return True, engine_builder.compile_block(block_config, custom_modules)
+    except Exception as e:
+        try:
+            pickle.dumps(e, pickle.HIGHEST_PROTOCOL)
+        except Exception:
+            e = GraphCompilationError("{type}: {error}".format(type=e.__class__.__name__, error=e))
+        return False, e
+
+
+class GraphCompiler(object):
+    """
+    Compiles the blocks of a processing graph in parallel and merges them in the graph's order.
+
+    Graphs are compiled one at a time, when a newer graph is waiting to be set the compilation
+    of the current one is cancelled and its workers are killed.
+    """
+
+    # The interval in seconds between checks for compilations that failed without calling back
+    WORKERS_CHECK_INTERVAL = 0.5
+
+    def __init__(self, config_builder, processes=None, timeout=None):
+        """
+        :param config_builder: The configuration builder
+        :type config_builder: configuration_builder.ConfigurationBuilder
+        :param processes: The number of worker processes, None for the number of CPUs and 0 to compile in the IOLoop
+        :param timeout: The maximal time in seconds for compiling a graph or None to wait forever
+        """
+        self.config_builder = config_builder
+        self.processes = processes
+        self.timeout = timeout
+        self._pool = None
+        self._pending = []
+        self._started_workers = None
+        self._workers = 0
+
+    def start(self):
+        if self.processes != 0:
+            self._start_pool()
+
+    def _start_pool(self):
+        self._started_workers = multiprocessing.Queue()
+        self._workers = 0
+        self._pool = multiprocessing.Pool(self.processes, _announce_worker, (self._started_workers,))
+
+    def stop(self):
+        self._cancel_pending(GraphCompilationCancelledError("Graph compiler stopped"))
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool = None
+
+    def cancel(self, error):
+        """
+        Cancel the compilation of the current graph, if there is one, and kill its workers
+
+        :param error: The exception the compilation fails with
+        """
+        if self._pool is None or not self._pending:
+            return
+        self._cancel_pending(error)
+        self._restart()
+
+    def _restart(self):
+        app_log.info("Restarting graph compilation workers")
+        self._pool.terminate()
+        self._start_pool()
+
+    def _cancel_pending(self, error):
+        pending, self._pending = self._pending, []
+        for future, _ in pending:
+            if not future.done():
+                future.set_exception(error)
+
+    def _worker_died(self):
+        """
+        :return: True if the pool started more workers than its size, it replaces a worker that died and
+            the task that worker was running is never completed
+        """
+        try:
+            while True:
+                self._started_workers.get_nowait()
+                self._workers += 1
+        except Empty:
+            pass
+        return self._workers > (self.processes or multiprocessing.cpu_count())
+
+    def _check_workers(self):
+        """
+        Fail the compilations whose worker died, or whose result couldn't be sent back by the worker
+        """
+        died = self._worker_died()
+        for future, result in self._pending:
+            if future.done():
+                continue
+            if result.ready():
+                try:
+                    future.set_result(result.get(0))
+                except Exception as e:
+                    future.set_exception(GraphCompilationError("Compilation worker failed: {error}".format(error=e)))
+        if died:
+            self._cancel_pending(GraphCompilationError("Compilation worker died"))
+            self._restart()
+
+    @gen.coroutine
+    def compile(self, processing_graph, additional_requirements=None):
+        """
+        Compile a processing graph.
+
+        :param processing_graph: The processing graph dict with requirements, blocks and connections
+        :return: The engine configuration builder of the graph
+        :raises GraphCompilationTimeoutError: If the compilation didn't end in time
+        :raises GraphCompilationError: If a worker died or failed sending its result
+        :raises GraphCompilationCancelledError: If the compilation was cancelled by a newer graph
+        """
+        if self._pool is None:
+            raise gen.Return(self.config_builder.engine_config_builder_from_dict(processing_graph,
+                                                                                 additional_requirements))
+
+        # the blocks are copied since parsing the configuration changes them
+        pending = [self._apply(block_config) for block_config in copy.deepcopy(processing_graph['blocks'])]
+        self._pending = pending
+        watchdog = PeriodicCallback(self._check_workers, self.WORKERS_CHECK_INTERVAL * 1000)
+        watchdog.start()
+        compilation = gen.multi([future for future, _ in pending],
+                                quiet_exceptions=(GraphCompilationCancelledError, GraphCompilationError))
+        try:
+            if self.timeout is None:
+                results = yield compilation
+            else:
+                results = yield gen.with_timeout(datetime.timedelta(seconds=self.timeout), compilation,
+                                                 quiet_exceptions=(GraphCompilationCancelledError,
+                                                                   GraphCompilationError))
+        except gen.TimeoutError:
+            if self._pending is pending:
+                self._cancel_pending(GraphCompilationCancelledError("Compilation timed out"))
+                self._restart()
+            raise GraphCompilationTimeoutError("Processing graph compilation took more than {timeout} seconds".format(
+                timeout=self.timeout))
+        finally:
+            watchdog.stop()
+            if self._pending is pending:
+                self._pending = []
+
+        compiled_blocks = []
+        for succeeded, result in results:
+            if not succeeded:
+                raise result
+            compiled_blocks.append(result)
+
+        raise gen.Return(self.config_builder.engine_config_builder_from_compiled_blocks(processing_graph,
+                                                                                        compiled_blocks,
+                                                                                        additional_requirements))
+
+    def _apply(self, block_config):
+        """
+        :return: The future of the block's compilation and its pool result
+        """
+        future = Future()
+        io_loop = IOLoop.current()
+
+        def _set_result(result):
+            if not future.done():
+                future.set_result(result)
+
+        # the callback is called from the pool's result thread
+        result = self._pool.apply_async(_compile_block,
+                                        (self.config_builder.engine_builder, block_config,
+                                         self.config_builder.custom_modules()),
+                                        callback=lambda result: io_loop.add_callback(_set_result, result))
+        return future, result
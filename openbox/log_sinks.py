@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Sinks shipping log push messages directly to a log collector or a local file.
+
+Each sink gets the batches of log messages buffered by a PushMessageHandler and writes each batch at once.
+"""
+import datetime
+import json
+import os
+import socket
+from multiprocessing.pool import ThreadPool
+
+from tornado import gen, locks
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado.iostream import IOStream, StreamClosedError
+from tornado.log import app_log
+
+from manager_exceptions import LogSinkError
+
+SYSLOG_VERSION = 1
+SYSLOG_FACILITY_LOCAL0 = 16
+SYSLOG_DEFAULT_SEVERITY = 6  # informational
+# the enterprise number reserved for documentation (RFC 5612)
+SYSLOG_SD_ID = 'obsi@32473'
+SYSLOG_NIL = '-'
+
+
+def _syslog_name(value, max_length):
+    # header fields are printable US-ASCII without spaces
+    value = ''.join(c for c in unicode(value).encode('ascii', 'ignore') if '!' <= c <= '~')[:max_length]
+    return value or SYSLOG_NIL
+
+
+def _syslog_param_value(value):
+    return unicode(value).replace('\\', '\\\\').replace('"', '\\"').replace(']', '\\]').encode('utf-8')
+
+
+def _syslog_severity(severity):
+    try:
+        return min(max(int(severity), 0), 7)
+    except (TypeError, ValueError):
+        return SYSLOG_DEFAULT_SEVERITY
+
+
+def format_syslog_message(message, hostname, app_name, dpid, facility=SYSLOG_FACILITY_LOCAL0):
+    """
+    Format a log message as an RFC 5424 syslog message.
+    """
+    timestamp = datetime.datetime.utcfromtimestamp(message.get('timestamp', 0)).isoformat() + 'Z'
+    priority = facility * 8 + _syslog_severity(message.get('severity'))
+    params = [('origin_dpid', dpid)] + [(field, message[field]) for field in ('origin_block', 'id', 'packet')
+                                        if message.get(field) is not None]
+    structured_data = '[{sd_id} {params}]'.format(sd_id=SYSLOG_SD_ID, params=' '.join(
+        '{name}="{value}"'.format(name=name, value=_syslog_param_value(value)) for name, value in params))
+    text = unicode(message.get('message', '')).encode('utf-8')
+    # the BOM marks the message as UTF-8
+    return '<{priority}>{version} {timestamp} {hostname} {app_name} {procid} {msgid} {sd} \xef\xbb\xbf{text}'.format(
+        priority=priority, version=SYSLOG_VERSION, timestamp=timestamp, hostname=_syslog_name(hostname, 255),
+        app_name=_syslog_name(app_name, 48), procid=os.getpid(),
+        msgid=_syslog_name(message.get('origin_block', SYSLOG_NIL), 32), sd=structured_data, text=text)
+
+
+class SyslogUdpSink(object):
+    """
+    Sends each log message as an RFC 5424 syslog message in a UDP datagram (RFC 5426).
+
+    RFC 5426 allows a single syslog message per datagram, so messages aren't coalesced in to larger datagrams;
+    the batching is that of the PushMessageHandler's buffer, sending a whole batch at once.
+    """
+
+    def __init__(self, address, port, dpid, hostname=None, app_name='obsi'):
+        self.address = (address, port)
+        self.dpid = dpid
+        self.hostname = hostname or socket.gethostname()
+        self.app_name = app_name
+        self._socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self._socket.setblocking(False)
+
+    @gen.coroutine
+    def send(self, messages):
+        for message in messages:
+            try:
+                self._socket.sendto(format_syslog_message(message, self.hostname, self.app_name, self.dpid),
+                                    self.address)
+            except socket.error as e:
+                # like any UDP datagram, a log message may be lost
+                app_log.debug("Unable to send syslog message: {error}".format(error=e))
+
+    def close(self):
+        self._socket.close()
+
+
+class NdjsonTcpSink(object):
+    """
+    Writes the log messages as newline delimited JSON over a persistent TCP connection, reconnecting when it's lost.
+    """
+
+    def __init__(self, address, port, dpid):
+        self.address = (address, port)
+        self.dpid = dpid
+        self._stream = None
+        self._closed = False
+        # keeps the order of the batches and a single connection
+        self._lock = locks.Lock()
+
+    @gen.coroutine
+    def _connect(self):
+        if self._stream is None or self._stream.closed():
+            self._stream = IOStream(socket.socket(socket.AF_INET, socket.SOCK_STREAM))
+            yield self._stream.connect(self.address)
+
+    @gen.coroutine
+    def send(self, messages):
+        if self._closed:
+            return
+        lines = ''.join(json.dumps(dict(message, origin_dpid=self.dpid)) + '\n' for message in messages)
+        with (yield self._lock.acquire()):
+            try:
+                yield self._connect()
+                yield self._stream.write(lines)
+            except (StreamClosedError, socket.error) as e:
+                app_log.error("Unable to ship log messages to {address}:{port}: {error}".format(
+                    address=self.address[0], port=self.address[1], error=e))
+                if self._stream is not None:
+                    self._stream.close()
+
+    def close(self):
+        self._closed = True
+        if self._stream is not None:
+            self._stream.close()
+
+
+class RotatingFileSink(object):
+    """
+    Appends the log messages as newline delimited JSON to a file, rotated when it reaches max_bytes.
+
+    The writes are done by a writer thread so the IOLoop is never blocked by the disk.
+    """
+
+    def __init__(self, path, dpid, max_bytes, backup_count):
+        """
+        :param path: The path of the log file
+        :param max_bytes: The size from which the file is rotated
+        :param backup_count: The number of rotated files kept as path.1, path.2 and so on
+        """
+        self.path = path
+        self.dpid = dpid
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._file = None
+        # a single thread keeps the batches in order
+        self._pool = ThreadPool(1)
+
+    def send(self, messages):
+        lines = ''.join(json.dumps(dict(message, origin_dpid=self.dpid)) + '\n' for message in messages)
+        return self._run(self._write, lines)
+
+    def _run(self, function, *args):
+        """
+        Run the function by the writer thread, the returned future is resolved on the IOLoop with its result.
+        """
+        future = Future()
+        io_loop = IOLoop.current()
+
+        def done(result):
+            io_loop.add_callback(future.set_result, result)
+
+        self._pool.apply_async(function, args, callback=done)
+        return future
+
+    def _write(self, lines):
+        # exceptions are logged since the callbacks of a pool in python 2 are only called on success
+        try:
+            if self._file is None:
+                self._open_file()
+            if self._file.tell() and self._file.tell() + len(lines) > self.max_bytes:
+                self._rotate()
+            self._file.write(lines)
+            self._file.flush()
+            return True
+        except Exception as e:
+            app_log.error("Unable to write log messages to {path}: {error}".format(path=self.path, error=e))
+            return False
+
+    def _open_file(self):
+        self._file = open(self.path, 'ab')
+        # the position of a file opened for appending is its end only after the first write
+        self._file.seek(0, os.SEEK_END)
+
+    def _rotate(self):
+        self._file.close()
+        self._file = None
+        for i in xrange(self.backup_count - 1, 0, -1):
+            source = '{path}.{i}'.format(path=self.path, i=i)
+            if os.path.exists(source):
+                os.rename(source, '{path}.{i}'.format(path=self.path, i=i + 1))
+        if self.backup_count > 0:
+            os.rename(self.path, self.path + '.1')
+        else:
+            os.remove(self.path)
+        self._open_file()
+
+    def close(self):
+        """
+        Close the file once the pending writes are done, without waiting for them.
+
+        :return: A future resolved when the file is closed
+        """
+        future = self._run(self._close_file)
+        # the writer thread exits after the queued tasks
+        self._pool.close()
+        return future
+
+    def _close_file(self):
+        try:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        except Exception as e:
+            app_log.error("Unable to close {path}: {error}".format(path=self.path, error=e))
+
+
+# the fields of each sink type's configuration and whether they are required
+SINK_FIELDS = {
+    'syslog': dict(address=True, port=True, hostname=False, app_name=False),
+    'ndjson': dict(address=True, port=True),
+    'file': dict(path=True, max_bytes=False, backup_count=False),
+}
+
+
+def check_sink(sink):
+    """
+    Check the configuration of a log sink, None is for the HTTP log server.
+
+    :raise LogSinkError: If the configuration is invalid
+    """
+    if sink is None:
+        return
+    if not isinstance(sink, dict) or sink.get('type') not in SINK_FIELDS:
+        raise LogSinkError("A log sink must have a type of: {types}".format(types=', '.join(sorted(SINK_FIELDS))))
+    fields = SINK_FIELDS[sink['type']]
+    unknown = set(sink) - set(fields) - {'type'}
+    if unknown:
+        raise LogSinkError("Unknown fields for a {type} log sink: {fields}".format(type=sink['type'],
+                                                                                  fields=', '.join(unknown)))
+    missing = [field for field, required in fields.iteritems() if required and sink.get(field) is None]
+    if missing:
+        raise LogSinkError("Missing fields for a {type} log sink: {fields}".format(type=sink['type'],
+                                                                                  fields=', '.join(missing)))
+
+
+def build_sink(sink, dpid, max_bytes, backup_count):
+    """
+    Build a log sink from its configuration.
+
+    :param max_bytes: The default size from which a file sink is rotated
+    :param backup_count: The default number of rotated files kept by a file sink
+    """
+    check_sink(sink)
+    if sink['type'] == 'syslog':
+        return SyslogUdpSink(sink['address'], sink['port'], dpid, sink.get('hostname'), sink.get('app_name', 'obsi'))
+    elif sink['type'] == 'ndjson':
+        return NdjsonTcpSink(sink['address'], sink['port'], dpid)
+    else:
+        return RotatingFileSink(sink['path'], dpid, sink.get('max_bytes', max_bytes),
+                                sink.get('backup_count', backup_count))
@@ -10,6 +10,7 @@
 An OBSI's Manager.
 """
 import functools
+import hashlib
 import socket
 import time
 import sys
@@ -18,7 +19,8 @@ import config
 import messages
 import rest_server
 from manager_exceptions import EngineNotRunningError, ProcessingGraphNotSetError, UnknownRequestedParameter, \
-    UnsupportedModuleDataEncoding
+    UnsupportedModuleDataEncoding, ProcessingGraphOverBudgetError, BadProcessingGraphBudgetError, \
+    GraphCompilationCancelledError
 from tornado import httpclient, gen, options, locks
 from tornado.escape import json_decode, json_encode, url_escape
 from tornado.log import app_log
@@ -28,7 +30,18 @@ from message_handler import MessageHandler
 from message_sender import MessageSender
 from watchdog import ProcessWatchdog
 from push_message_receiver import PushMessageReceiver, PushMessageHandler
+from alert_aggregator import AlertAggregator
+from push_message_limiter import PushMessageLimiter, check_limits
+import log_sinks
+import wire_format
 from message_router import MessageRouter
+from graph_compiler import GraphCompiler
+from read_coalescer import ReadCoalescer
+from request_handlers import json_etag
+from stats_subscriptions import StatsSubscriptions
+from counter_history import CounterHistory
+from module_streaming import StreamedModule, module_digest
+from manager_metrics import ManagerMetrics
 from uuid import getnode
 
 
@@ -42,6 +55,20 @@ def _get_full_uri(base, endpoint):
     return '{base}{endpoint}'.format(base=base, endpoint=endpoint)
 
 
+def _format_endpoint(endpoint, *args):
+    """
+    Fill the groups of an endpoint pattern with URL escaped arguments
+    """
+    for arg in args:
+        endpoint = endpoint.replace('(.+)', url_escape(arg, plus=False), 1)
+    return endpoint
+
+
+def _full_handler_name(element_name, handler_name):
+    # the name the control server uses for the results of an operations sequence
+    return '{element}.{handler}'.format(element=element_name, handler=handler_name)
+
+
 def _start_remote_rest_server(bin_path, port, debug):
     # use the current interpreter to run the remote servers
     # this may be an issue with virtualenv or anaconda
@@ -55,11 +82,17 @@ class Manager(object):
         self._runner_process = None
         self._control_process = None
         self._watchdog = ProcessWatchdog(config.Watchdog.CHECK_INTERVAL)
-        self.push_messages_receiver = PushMessageReceiver()
+        self.push_messages_receivers = dict((channel['name'], PushMessageReceiver())
+                                            for channel in config.Engine.PUSH_MESSAGES_CHANNELS)
         self.config_builder = ConfigurationBuilder(config.Engine.CONFIGURATION_BUILDER)
+        self.graph_compiler = GraphCompiler(self.config_builder, config.GraphCompiler.PROCESSES,
+                                            config.GraphCompiler.TIMEOUT)
         self.message_handler = MessageHandler(self)
-        self.message_sender = MessageSender()
-        self.message_router = MessageRouter(self.message_sender, self.message_handler.default_message_handler)
+        self.message_sender = MessageSender(config.OutboundSpool.DIRECTORY if config.OutboundSpool.ENABLED else None)
+        self.message_router = MessageRouter(self.message_sender, self.message_handler.default_message_handler,
+                                            config.MessageRouter.POOLS, config.MessageRouter.CONCURRENCY,
+                                            config.MessageRouter.LANES, config.MessageRouter.LANES_SIZES,
+                                            config.MessageRouter.LANES_PRIORITIES)
         self.state = ManagerState.EMPTY
         self._http_client = httpclient.HTTPClient()
         self._alert_registered = False
@@ -68,12 +101,32 @@ class Manager(object):
         self._engine_running_lock = locks.Lock()
         self._processing_graph_set = False
         self._engine_config_builder = None
+        self._processing_graph_cost = None
+        self._read_coalescer = ReadCoalescer(self._read_engine_handler, config.ReadCoalescing.TTL,
+                                             config.ReadCoalescing.HANDLERS_TTL)
+        # the reads of the local read endpoints, keyed by block and handler names
+        self._local_reads = ReadCoalescer(self.read_block_value, config.RestServer.LOCAL_READ_TTL, etag=json_etag)
+        self._local_global_stats = ReadCoalescer(self.get_engine_global_stats, config.RestServer.LOCAL_READ_TTL,
+                                                 etag=json_etag)
+        self._compiled_config = None
+        self._compiled_config_digest = None
+        self.stats_subscriptions = StatsSubscriptions(self.read_block_values, self.get_engine_global_stats,
+                                                      self._send_stats, config.StatsSubscriptions.TICK)
+        self.counter_history = CounterHistory(self.read_block_values, config.CounterHistory.SIZE,
+                                              config.CounterHistory.INTERVAL, config.CounterHistory.MAX_HANDLERS)
         self._keep_alive_periodic_callback = None
         self._avg_cpu = 0
         self._avg_duration = 0
         self._supported_elements_types = []
+        # the SHA-256 of each custom module installed and loaded into the engine
+        self._installed_modules = {}
         self._alert_messages_handler = None
+        self._alert_aggregator = None
         self._log_messages_handler = None
+        self._log_sink = None
+        self._alert_messages_limiter = PushMessageLimiter(config.PushMessages.Alert.LIMITS)
+        self._log_messages_limiter = PushMessageLimiter(config.PushMessages.Log.LIMITS)
+        self.metrics = ManagerMetrics(self)
 
     def start(self):
         app_log.info("Starting components")
@@ -84,6 +137,8 @@ class Manager(object):
         self._start_push_messages_receiver()
         self._start_configuration_builder()
         self._start_message_router()
+        self._start_message_sender()
+        self._start_counter_history()
         self._start_local_rest_server()
         app_log.info("All components active")
         self.state = ManagerState.INITIALIZED
@@ -120,6 +175,9 @@ class Manager(object):
         app_log.info("Alert Registration status: {status}".format(status=self._alert_registered))
 
     def exit(self, exit_code):
+        self.stats_subscriptions.stop()
+        self.counter_history.stop()
+        self.graph_compiler.stop()
         if self._runner_process:
             while self._runner_process.is_running():
                 self._runner_process.kill()
@@ -168,7 +226,9 @@ class Manager(object):
                       nthreads=config.Engine.NTHREADS,
                       push_messages_type=config.Engine.PUSH_MESSAGES_SOCKET_TYPE,
                       push_messages_endpoint=config.Engine.PUSH_MESSAGES_SOCKET_ENDPOINT,
-                      push_messages_channel=config.Engine.PUSH_MESSAGES_CHANNEL)
+                      push_messages_channel=config.Engine.PUSH_MESSAGES_CHANNEL,
+                      push_messages_channels=[dict(name=channel['name'], endpoint=channel['endpoint'])
+                                              for channel in config.Engine.PUSH_MESSAGES_CHANNELS])
         uri = _get_full_uri(config.Runner.Rest.BASE_URI, config.Runner.Rest.Endpoints.START)
         try:
             self._http_client.fetch(uri, method="POST", body=json_encode(params))
@@ -243,18 +303,35 @@ class Manager(object):
             app_log.error("Unknown process dies")
 
     def _start_push_messages_receiver(self):
-        app_log.info("Starting PushMessagesReceiver and registering Alert handling")
+        app_log.info("Starting PushMessagesReceivers and registering Alert handling")
         url = None  # this will force the message sender to use the URL based on the message type
         send_alert_messages = functools.partial(self.message_sender.send_push_messages, messages.Alert, self.obsi_id,
                                                 url)
         self._alert_messages_handler = PushMessageHandler(send_alert_messages,
                                                           config.PushMessages.Alert.BUFFER_SIZE,
-                                                          config.PushMessages.Alert.BUFFER_TIMEOUT)
-
-        self.push_messages_receiver.register_message_handler('ALERT', self._alert_messages_handler.add)
-        self.push_messages_receiver.connect(config.PushMessages.SOCKET_ADDRESS,
-                                            config.PushMessages.SOCKET_FAMILY,
-                                            config.PushMessages.RETRY_INTERVAL)
+                                                          config.PushMessages.Alert.BUFFER_TIMEOUT,
+                                                          config.PushMessages.Alert.MAX_BUFFER_SIZE,
+                                                          config.PushMessages.Alert.MAX_IN_FLIGHT)
+        # alerts are limited before they are aggregated, so every alert counts against the limits
+        self._alert_aggregator = AlertAggregator(self._alert_messages_handler.add_messages,
+                                                 config.PushMessages.Alert.AGGREGATION_WINDOW,
+                                                 config.PushMessages.Alert.AGGREGATION_SAMPLES,
+                                                 self._alert_messages_limiter)
+
+        self.push_messages_receiver('ALERT').register_message_handler('ALERT', self._alert_aggregator.add_batch)
+        for channel, receiver in self.push_messages_receivers.iteritems():
+            receiver.connect(config.PushMessages.CHANNELS_ADDRESSES[channel], config.PushMessages.SOCKET_FAMILY,
+                             config.PushMessages.RETRY_INTERVAL)
+
+    def push_messages_receiver(self, message_type):
+        """
+        The receiver of the channel the engine sends the push messages of a type on
+        """
+        for channel in config.Engine.PUSH_MESSAGES_CHANNELS:
+            if message_type in channel['types']:
+                return self.push_messages_receivers[channel['name']]
+        # types without a channel of their own are sent on the first one
+        return self.push_messages_receivers[config.Engine.PUSH_MESSAGES_CHANNELS[0]['name']]
 
     def _start_configuration_builder(self):
         app_log.info("Starting EE Configuration Builder")
@@ -271,6 +348,7 @@ class Manager(object):
 
         except httpclient.HTTPError:
             app_log.error("Unable to connect to EE control in order to get a list of supported elements types")
+        self.graph_compiler.start()
 
     @gen.coroutine
     def _start_message_router(self):
@@ -282,6 +360,19 @@ class Manager(object):
         app_log.info("Registering handlers for messages")
         for message, handler in self.message_handler.registered_message_handlers.iteritems():
             self.message_router.register_message_handler(message, handler)
+        self.message_router.register_queued_hook(messages.SetProcessingGraphRequest, self._processing_graph_queued)
+
+    def _processing_graph_queued(self, message):
+        # the graph being compiled is replaced by the queued one, so there is no point in waiting for it
+        self.graph_compiler.cancel(GraphCompilationCancelledError("Compilation cancelled by a newer processing graph"))
+
+    def _start_message_sender(self):
+        app_log.info("Starting MessageSender")
+        self.message_sender.start()
+
+    def _start_counter_history(self):
+        app_log.info("Starting counter history of {count} handlers".format(count=len(config.CounterHistory.HANDLERS)))
+        self.counter_history.set_handlers(config.CounterHistory.HANDLERS)
 
     def _start_local_rest_server(self):
         app_log.info("Starting local REST server on port {port}".format(port=config.RestServer.PORT))
@@ -310,8 +401,18 @@ class Manager(object):
                 app_log.error("Hello message received an error response from OBC")
                 yield gen.sleep(config.Manager.INTERVAL_BETWEEN_CONNECTION_TRIES)
 
+    @gen.coroutine
+    def _send_stats(self, subscription_id, timestamp, samples, global_stats):
+        message = messages.Stats(origin_dpid=self.obsi_id, subscription_id=subscription_id, timestamp=timestamp,
+                                 samples=samples, global_stats=global_stats)
+        received = yield self.message_sender.send_message_ignore_response(message)
+        if not received:
+            app_log.error('Stats message received an error response from OBC')
+
     def get_capabilities(self):
-        proto_messages = []
+        proto_messages = [messages.BatchReadRequest.__name__, messages.BatchWriteRequest.__name__,
+                          messages.SubscribeRequest.__name__, messages.UnsubscribeRequest.__name__,
+                          messages.CounterHistoryRequest.__name__]
         if config.Engine.Capabilities.MODULE_INSTALLATION:
             proto_messages.append(messages.AddCustomModuleRequest.__name__)
         if config.Engine.Capabilities.MODULE_REMOVAL:
@@ -324,7 +425,10 @@ class Manager(object):
 
         return dict(proto_messages=proto_messages, processing_blocks=processing_blocks,
                     match_fields=match_fields, complex_match=complex_match,
-                    protocol_analyser_protocols=protocol_analyser_protocols)
+                    protocol_analyser_protocols=protocol_analyser_protocols,
+                    processing_graph_budget=config.ProcessingGraph.BUDGET,
+                    processing_graph_cost=self._processing_graph_cost,
+                    wire_formats=wire_format.supported_formats())
 
     def _start_io_loop(self):
         app_log.info("Starting the IOLoop")
@@ -353,13 +457,75 @@ class Manager(object):
         self._avg_duration += duration
         stats = dict(memory_rss=memory['rss'], memory_vms=memory['vms'], memory_percent=memory['percent'],
                      cpus=cpu_count, current_load=current_load, avg_load=self._avg_cpu,
-                     avg_minutes=self._avg_duration / 60.0, uptime=uptime['uptime'])
+                     avg_minutes=self._avg_duration / 60.0, uptime=uptime['uptime'],
+                     reads=self._read_coalescer.reads, engine_reads=self._read_coalescer.engine_reads,
+                     read_hit_ratio=self._read_coalescer.hit_ratio(),
+                     alert_messages_dropped=self._push_messages_dropped(self._alert_messages_limiter,
+                                                                        self._alert_messages_handler),
+                     log_messages_dropped=self._push_messages_dropped(self._log_messages_limiter,
+                                                                      self._log_messages_handler))
         raise gen.Return(stats)
 
+    @staticmethod
+    def _push_messages_dropped(limiter, handler):
+        """
+        The number of push messages dropped by their limits or since their handler's buffer was full
+        """
+        return limiter.dropped + (handler.dropped if handler is not None else 0)
+
+    def push_messages_metrics(self):
+        """
+        The counters of the alert and log push messages dropped by their limits
+        """
+        return dict(alert=self._alert_messages_limiter.metrics(), log=self._log_messages_limiter.metrics())
+
+    def local_block_value(self, block_name, handler_name):
+        """
+        Read a block value for the local read endpoints, reused for LOCAL_READ_TTL seconds
+
+        :rtype: Future
+        """
+        return self._local_reads.read((block_name, handler_name))
+
+    def local_global_stats(self):
+        """
+        Read the global stats for the local read endpoints, reused for LOCAL_READ_TTL seconds
+
+        :rtype: Future
+        """
+        return self._local_global_stats.read(())
+
+    def local_block_value_etag(self, block_name, handler_name):
+        """
+        The ETag of the block value local_block_value would return without reading the engine
+
+        :return: The ETag, None if the value must be read
+        """
+        return self._local_reads.cached_etag((block_name, handler_name))
+
+    def local_global_stats_etag(self):
+        """
+        The ETag of the global stats local_global_stats would return without reading the engine
+
+        :return: The ETag, None if the stats must be read
+        """
+        return self._local_global_stats.cached_etag(())
+
+    def compiled_config(self):
+        """
+        :return: The engine config of the current processing graph and its SHA-1, None if it's not set
+        """
+        return self._compiled_config, self._compiled_config_digest
+
+    def _invalidate_reads(self):
+        self._read_coalescer.invalidate()
+        self._local_reads.invalidate()
+
     @gen.coroutine
     def reset_engine_global_stats(self):
         self._avg_cpu = 0
         self._avg_duration = 0
+        self._read_coalescer.reset_stats()
 
     @gen.coroutine
     def read_block_value(self, block_name, handler_name):
@@ -373,14 +539,22 @@ class Manager(object):
              engine_handler_name,
              transform_function) = self._engine_config_builder.translate_block_read_handler(block_name,
                                                                                             handler_name)
-            element = url_escape(engine_element_name)
-            handler = url_escape(engine_handler_name)
-            uri = _get_full_uri(config.Control.Rest.BASE_URI,
-                                config.Control.Rest.Endpoints.HANDLER_PATTERN.format(element=element,
-                                                                                     handler=handler))
-            client = httpclient.AsyncHTTPClient(request_timeout=config.Manager.REQUEST_TIMEOUT)
-            response = yield client.fetch(uri)
-            raise gen.Return(transform_function(json_decode(response.body)))
+            if engine_element_name is None:
+                raise gen.Return(transform_function(None))
+            # concurrent reads of the same engine handler share a single request to the engine
+            value = yield self._read_coalescer.read((engine_element_name, engine_handler_name), handler_name)
+            raise gen.Return(transform_function(value))
+
+    @gen.coroutine
+    def _read_engine_handler(self, engine_element_name, engine_handler_name):
+        element = url_escape(engine_element_name)
+        handler = url_escape(engine_handler_name)
+        uri = _get_full_uri(config.Control.Rest.BASE_URI,
+                            config.Control.Rest.Endpoints.HANDLER_PATTERN.format(element=element,
+                                                                                 handler=handler))
+        client = httpclient.AsyncHTTPClient(request_timeout=config.Manager.REQUEST_TIMEOUT)
+        response = yield client.fetch(uri)
+        raise gen.Return(json_decode(response.body))
 
     @gen.coroutine
     def write_block_value(self, block_name, handler_name, value):
@@ -400,14 +574,126 @@ class Manager(object):
             body = json_encode(transform_function(value))
             client = httpclient.AsyncHTTPClient(request_timeout=config.Manager.REQUEST_TIMEOUT)
             yield client.fetch(uri, method='POST', body=body)
+            # a write may change the values of read handlers
+            self._invalidate_reads()
             raise gen.Return(True)
 
+    @gen.coroutine
+    def read_block_values(self, reads):
+        """
+        Read the values of several block handlers in a single engine operations sequence
+
+        :param reads: The block_id and read_handle of each read
+        :return: The block_id, read_handle, result and error of each read, in the order of the reads
+        """
+        yield self._check_processing_graph_ready()
+        results = []
+        operations = []
+        pending = []
+        for read in reads:
+            result = dict(block_id=read.get('block_id'), read_handle=read.get('read_handle'), result=None, error=None)
+            results.append(result)
+            try:
+                (engine_element_name,
+                 engine_handler_name,
+                 transform_function) = self._engine_config_builder.translate_block_read_handler(result['block_id'],
+                                                                                                result['read_handle'])
+            except ValueError as e:
+                result['error'] = e.message
+                continue
+            if engine_element_name is None:
+                result['result'] = transform_function(None)
+                continue
+            operations.append(dict(type='READ', element_name=engine_element_name, handler_name=engine_handler_name))
+            pending.append((result, engine_element_name, engine_handler_name, transform_function))
+
+        values = yield self._run_engine_operations(operations)
+        for result, engine_element_name, engine_handler_name, transform_function in pending:
+            value = values.get(_full_handler_name(engine_element_name, engine_handler_name), False)
+            if value is False:
+                result['error'] = "Engine failed reading handler {handler} of block {block}".format(
+                    handler=result['read_handle'], block=result['block_id'])
+            else:
+                result['result'] = transform_function(value)
+        raise gen.Return(results)
+
+    @gen.coroutine
+    def write_block_values(self, writes):
+        """
+        Write the values of several block handlers in a single engine operations sequence
+
+        :param writes: The block_id, write_handle and value of each write
+        :return: The block_id, write_handle and error of each write, in the order of the writes
+        """
+        yield self._check_processing_graph_ready()
+        results = []
+        operations = []
+        pending = []
+        for write in writes:
+            result = dict(block_id=write.get('block_id'), write_handle=write.get('write_handle'), error=None)
+            results.append(result)
+            try:
+                (engine_element_name,
+                 engine_handler_name,
+                 transform_function) = self._engine_config_builder.translate_block_write_handler(result['block_id'],
+                                                                                                 result['write_handle'])
+            except ValueError as e:
+                result['error'] = e.message
+                continue
+            operations.append(dict(type='WRITE', element_name=engine_element_name, handler_name=engine_handler_name,
+                                   params=transform_function(write.get('value'))))
+            pending.append((result, engine_element_name, engine_handler_name))
+
+        values = yield self._run_engine_operations(operations)
+        if operations:
+            self._invalidate_reads()
+        for result, engine_element_name, engine_handler_name in pending:
+            if values.get(_full_handler_name(engine_element_name, engine_handler_name), False) is False:
+                result['error'] = "Engine failed writing handler {handler} of block {block}".format(
+                    handler=result['write_handle'], block=result['block_id'])
+        raise gen.Return(results)
+
+    @gen.coroutine
+    def _check_processing_graph_ready(self):
+        with (yield self._engine_running_lock.acquire()):
+            if not self._engine_running:
+                raise EngineNotRunningError()
+        if not self._processing_graph_set or self._engine_config_builder is None:
+            raise ProcessingGraphNotSetError()
+
+    @gen.coroutine
+    def _run_engine_operations(self, operations):
+        """
+        Run read and write operations one after the other in the engine
+
+        :return: The result of each operation by its full engine handler name, False for failed operations
+        """
+        if not operations:
+            raise gen.Return({})
+        uri = _get_full_uri(config.Control.Rest.BASE_URI, config.Control.Rest.Endpoints.SEQUENCE)
+        client = httpclient.AsyncHTTPClient(request_timeout=config.Manager.REQUEST_TIMEOUT)
+        response = yield client.fetch(uri, method='POST', body=json_encode(operations))
+        raise gen.Return(json_decode(response.body))
+
     @gen.coroutine
     def set_processing_graph(self, required_modules, blocks, connections):
         processing_graph = dict(requirements=required_modules, blocks=blocks, connections=connections)
-        self._engine_config_builder = self.config_builder.engine_config_builder_from_dict(processing_graph,
-                                                                                          config.Engine.REQUIREMENTS)
+        compile_start = time.time()
+        engine_config_builder = yield self.graph_compiler.compile(processing_graph, config.Engine.REQUIREMENTS)
+        self.metrics.graph_compile_time.observe(time.time() - compile_start)
+        cost = engine_config_builder.analyze()
+        app_log.info("Processing graph cost: {cost}".format(cost=cost))
+        self._check_processing_graph_budget(cost)
+        self._engine_config_builder = engine_config_builder
+        self._processing_graph_cost = cost
+        self._invalidate_reads()
         engine_config = self._engine_config_builder.to_engine_config()
+        for block_name, removed_rules in self._engine_config_builder.removed_rules().iteritems():
+            app_log.info("Removed rules from block {block}: {rules}".format(block=block_name, rules=removed_rules))
+        removed_elements = self._engine_config_builder.removed_elements()
+        if removed_elements:
+            app_log.info("Removed {count} elements from the processing graph: {elements}".format(
+                count=len(removed_elements), elements=sorted(removed_elements)))
         app_log.debug("Setting processing graph to:\n%s" % engine_config)
         client = httpclient.AsyncHTTPClient(request_timeout=config.Manager.REQUEST_TIMEOUT)
 
@@ -420,26 +706,86 @@ class Manager(object):
         new_config = json_decode(response.body)
         if engine_config in new_config:
             self._processing_graph_set = True
+            self._compiled_config = engine_config
+            self._compiled_config_digest = hashlib.sha1(engine_config).hexdigest()
         else:
             app_log.error("Unable to set processing graph")
 
+    def _check_processing_graph_budget(self, cost):
+        over_budget = ['{field}={value} (limit {limit})'.format(field=field, value=cost[field], limit=limit)
+                       for field, limit in sorted(config.ProcessingGraph.BUDGET.iteritems())
+                       if limit is not None and cost.get(field, 0) > limit]
+        if not over_budget:
+            return
+        message = "Processing graph is over budget: {fields}".format(fields=', '.join(over_budget))
+        if config.ProcessingGraph.REJECT_OVER_BUDGET:
+            raise ProcessingGraphOverBudgetError(message)
+        app_log.warning(message)
+
+    @staticmethod
+    def _check_processing_graph_budget_parameter(budget):
+        if not isinstance(budget, dict):
+            raise BadProcessingGraphBudgetError("A processing graph budget must be an object")
+        for field, limit in budget.iteritems():
+            if field not in config.ProcessingGraph.BUDGET_FIELDS:
+                raise BadProcessingGraphBudgetError("Unknown processing graph budget field {field}, known fields: "
+                                                    "{fields}".format(field=field,
+                                                                      fields=', '.join(
+                                                                          config.ProcessingGraph.BUDGET_FIELDS)))
+            if limit is not None and (isinstance(limit, bool) or not isinstance(limit, (int, long, float)) or
+                                      limit < 0):
+                raise BadProcessingGraphBudgetError("The limit of processing graph budget field {field} must be "
+                                                    "a non-negative number or null".format(field=field))
+
     @gen.coroutine
     def set_parameters(self, params):
+        # check the values that may be rejected first, so a rejected request changes nothing
+        log_sinks.check_sink(params.get('log_sink'))
+        if 'processing_graph_budget' in params:
+            self._check_processing_graph_budget_parameter(params['processing_graph_budget'])
+        if 'wire_format' in params:
+            wire_format.check_format(params['wire_format'])
+        if 'counter_history_handlers' in params:
+            self.counter_history.check_handlers(params['counter_history_handlers'])
+        for limits in ('alert_messages_limits', 'log_messages_limits'):
+            if limits in params:
+                check_limits(params[limits])
+        counter_history_handlers = params.get('counter_history_handlers', config.CounterHistory.HANDLERS)
+        self.counter_history.set_handlers(counter_history_handlers)
+        config.CounterHistory.HANDLERS = counter_history_handlers
+        if 'alert_messages_limits' in params:
+            self._alert_messages_limiter.set_limits(params['alert_messages_limits'])
+            config.PushMessages.Alert.LIMITS = self._alert_messages_limiter.limits()
+        if 'log_messages_limits' in params:
+            self._log_messages_limiter.set_limits(params['log_messages_limits'])
+            config.PushMessages.Log.LIMITS = self._log_messages_limiter.limits()
         config.KeepAlive.INTERVAL = params.get('keepalive_interval', config.KeepAlive.INTERVAL)
         config.PushMessages.Alert.BUFFER_SIZE = params.get('alert_messages_buffer_size',
                                                            config.PushMessages.Alert.BUFFER_SIZE)
         config.PushMessages.Alert.BUFFER_TIMEOUT = params.get('alert_messages_buffer_timeout',
                                                               config.PushMessages.Alert.BUFFER_TIMEOUT * 1000.0) / 1000.0
+        config.PushMessages.Alert.AGGREGATION_WINDOW = params.get(
+            'alert_messages_aggregation_window', config.PushMessages.Alert.AGGREGATION_WINDOW * 1000.0) / 1000.0
+        config.PushMessages.Alert.AGGREGATION_SAMPLES = params.get('alert_messages_aggregation_samples',
+                                                                   config.PushMessages.Alert.AGGREGATION_SAMPLES)
         config.PushMessages.Log.BUFFER_SIZE = params.get('log_messages_buffer_size',
                                                          config.PushMessages.Log.BUFFER_SIZE)
         config.PushMessages.Log.BUFFER_TIMEOUT = params.get('log_messages_buffer_timeout',
                                                             config.PushMessages.Log.BUFFER_TIMEOUT * 1000.0) / 1000.0
         old_server, old_port = config.PushMessages.Log.SERVER_ADDRESS, config.PushMessages.Log.SERVER_PORT
+        old_sink = config.PushMessages.Log.SINK
+        config.PushMessages.Log.SINK = params.get('log_sink', config.PushMessages.Log.SINK)
         config.PushMessages.Log.SERVER_ADDRESS = params.get('log_server_address',
                                                             config.PushMessages.Log.SERVER_ADDRESS)
         config.PushMessages.Log.SERVER_PORT = params.get('log_server_port', config.PushMessages.Log.SERVER_PORT)
         new_server, new_port = config.PushMessages.Log.SERVER_ADDRESS, config.PushMessages.Log.SERVER_PORT
-        config.PushMessages.Log._SERVER_CHANGED = new_server != old_server or new_port != old_port
+        config.PushMessages.Log._SERVER_CHANGED = (new_server != old_server or new_port != old_port or
+                                                   config.PushMessages.Log.SINK != old_sink)
+        config.ProcessingGraph.BUDGET = params.get('processing_graph_budget', config.ProcessingGraph.BUDGET)
+        config.ProcessingGraph.REJECT_OVER_BUDGET = params.get('reject_over_budget_processing_graph',
+                                                               config.ProcessingGraph.REJECT_OVER_BUDGET)
+        config.ReadCoalescing.TTL = params.get('read_cache_ttl', config.ReadCoalescing.TTL * 1000.0) / 1000.0
+        config.MessageSender.WIRE_FORMAT = params.get('wire_format', config.MessageSender.WIRE_FORMAT)
 
         self._update_components()
 
@@ -449,38 +795,76 @@ class Manager(object):
             self._keep_alive_periodic_callback.stop()
             self._start_sending_keep_alive()
 
+        # update the read cache
+        self._read_coalescer.ttl = config.ReadCoalescing.TTL
+
         # update alert push messages
         if self._alert_messages_handler:
             self._alert_messages_handler.buffer_size = config.PushMessages.Alert.BUFFER_SIZE
             self._alert_messages_handler.buffer_timeout = config.PushMessages.Alert.BUFFER_TIMEOUT
+        if self._alert_aggregator:
+            self._alert_aggregator.window = config.PushMessages.Alert.AGGREGATION_WINDOW
+            self._alert_aggregator.samples = config.PushMessages.Alert.AGGREGATION_SAMPLES
+            if not self._alert_aggregator.window:
+                self._alert_aggregator.flush()
 
         # update log push messages
-        if config.PushMessages.Log.SERVER_PORT and config.PushMessages.Log.SERVER_PORT:
-            url = "http://{host}:{port}/message/Log".format(host=config.PushMessages.Log.SERVER_ADDRESS,
-                                                            port=config.PushMessages.Log.SERVER_PORT)
-            send_log_messages = functools.partial(self.message_sender.send_push_messages, messages.Log,
-                                                  self.obsi_id, url)
-            if config.PushMessages.Log._SERVER_CHANGED:
-                # better close it and make it start over
-                if self._log_messages_handler:
-                    self._log_messages_handler.close()
-                self.push_messages_receiver.unregister_message_handler('LOG')
+        if config.PushMessages.Log._SERVER_CHANGED:
+            # better close it and make it start over
+            if self._log_messages_handler:
+                self._log_messages_handler.close()
+                self._log_messages_handler = None
+            if self._log_sink:
+                self._log_sink.close()
+                self._log_sink = None
+            self.push_messages_receiver('LOG').unregister_message_handler('LOG')
+            send_log_messages = self._log_messages_sender()
+            if send_log_messages:
                 self._log_messages_handler = PushMessageHandler(send_log_messages,
                                                                 config.PushMessages.Log.BUFFER_SIZE,
-                                                                config.PushMessages.Log.BUFFER_TIMEOUT)
-                self.push_messages_receiver.register_message_handler('LOG', self._log_messages_handler.add)
+                                                                config.PushMessages.Log.BUFFER_TIMEOUT,
+                                                                config.PushMessages.Log.MAX_BUFFER_SIZE,
+                                                                config.PushMessages.Log.MAX_IN_FLIGHT,
+                                                                self._log_messages_limiter)
+                self.push_messages_receiver('LOG').register_message_handler('LOG',
+                                                                            self._log_messages_handler.add_batch)
         if self._log_messages_handler:
             self._log_messages_handler.buffer_size = config.PushMessages.Log.BUFFER_SIZE
             self._log_messages_handler.buffer_timeout = config.PushMessages.Log.BUFFER_TIMEOUT
 
+    def _log_messages_sender(self):
+        """
+        The sender of the log messages batches: the configured sink, the HTTP log server or None
+        """
+        if config.PushMessages.Log.SINK:
+            self._log_sink = log_sinks.build_sink(config.PushMessages.Log.SINK, self.obsi_id,
+                                                  config.PushMessages.Log.FILE_MAX_BYTES,
+                                                  config.PushMessages.Log.FILE_BACKUP_COUNT)
+            return self._log_sink.send
+        elif config.PushMessages.Log.SERVER_ADDRESS and config.PushMessages.Log.SERVER_PORT:
+            url = "http://{host}:{port}/message/Log".format(host=config.PushMessages.Log.SERVER_ADDRESS,
+                                                            port=config.PushMessages.Log.SERVER_PORT)
+            return functools.partial(self.message_sender.send_push_messages, messages.Log, self.obsi_id, url)
+        return None
+
     def get_parameters(self, parameters):
         result = dict(keepalive_interval=int(config.KeepAlive.INTERVAL),
                       alert_messages_buffer_size=config.PushMessages.Alert.BUFFER_SIZE,
                       alert_messages_buffer_timeout=int(config.PushMessages.Alert.BUFFER_TIMEOUT * 1000),
+                      alert_messages_aggregation_window=int(config.PushMessages.Alert.AGGREGATION_WINDOW * 1000),
+                      alert_messages_aggregation_samples=config.PushMessages.Alert.AGGREGATION_SAMPLES,
+                      alert_messages_limits=self._alert_messages_limiter.limits(),
+                      log_messages_limits=self._log_messages_limiter.limits(),
                       log_messages_buffer_size=config.PushMessages.Log.BUFFER_SIZE,
                       log_messages_buffer_timeout=int(config.PushMessages.Log.BUFFER_TIMEOUT * 1000),
                       log_server_address=config.PushMessages.Log.SERVER_ADDRESS,
-                      log_server_port=config.PushMessages.Log.SERVER_PORT)
+                      log_server_port=config.PushMessages.Log.SERVER_PORT,
+                      log_sink=config.PushMessages.Log.SINK,
+                      wire_format=config.MessageSender.WIRE_FORMAT,
+                      processing_graph_budget=config.ProcessingGraph.BUDGET,
+                      reject_over_budget_processing_graph=config.ProcessingGraph.REJECT_OVER_BUDGET,
+                      read_cache_ttl=int(config.ReadCoalescing.TTL * 1000),
+                      counter_history_handlers=self.counter_history.handlers())
         if not parameters:
             # an empty list means they want all of them
             return result
@@ -496,20 +880,53 @@ class Manager(object):
 
     @gen.coroutine
     def add_custom_module(self, name, content, content_type, encoding, translation):
-        if content:
-            if encoding.lower() != 'base64':
-                raise UnsupportedModuleDataEncoding("Unknown encoding '{enc}' for module content".format(enc=encoding))
-            yield self._install_package(name, content, encoding.lower())
-            yield self._update_running_config_with_package(name)
-            yield self._update_supported_elements()
-            self.config_builder.add_custom_module(name, translation)
+        try:
+            if content:
+                if encoding.lower() != 'base64':
+                    raise UnsupportedModuleDataEncoding(
+                        "Unknown encoding '{enc}' for module content".format(enc=encoding))
+                digest = module_digest(content)
+                if self._installed_modules.get(name) == digest:
+                    app_log.info("Custom module {name} is already installed".format(name=name))
+                else:
+                    installed = yield self._install_stored_package(name, digest)
+                    if not installed:
+                        yield self._install_package(name, content, encoding.lower())
+                    yield self._update_running_config_with_package(name)
+                    yield self._update_supported_elements()
+                    self._installed_modules[name] = digest
+                self.config_builder.add_custom_module(name, translation)
+        finally:
+            if isinstance(content, StreamedModule):
+                content.remove()
+
+    @gen.coroutine
+    def _install_stored_package(self, name, digest):
+        """
+        Install a module the runner already stores, with the same content sent before under any name
+
+        :return: True if the runner had the module
+        """
+        client = httpclient.AsyncHTTPClient(request_timeout=config.Manager.REQUEST_TIMEOUT)
+        uri = _get_full_uri(config.Runner.Rest.BASE_URI,
+                            _format_endpoint(config.Runner.Rest.Endpoints.INSTALL_STORED, name))
+        response = yield client.fetch(uri, method='POST', body=json_encode(digest))
+        raise gen.Return(json_decode(response.body))
 
     @gen.coroutine
     def _install_package(self, name, content, encoding):
-        package = dict(name=name, data=content, encoding=encoding)
         client = httpclient.AsyncHTTPClient(request_timeout=config.Manager.REQUEST_TIMEOUT)
-        uri = _get_full_uri(config.Runner.Rest.BASE_URI, config.Runner.Rest.Endpoints.INSTALL)
-        yield client.fetch(uri, method='POST', body=json_encode(package))
+        if isinstance(content, StreamedModule):
+            # the decoded module is streamed from its file as the raw body
+            uri = _get_full_uri(config.Runner.Rest.BASE_URI,
+                                _format_endpoint(config.Runner.Rest.Endpoints.INSTALL_STREAM, name))
+            headers = {'Content-Type': 'application/octet-stream', 'Content-Length': str(content.size),
+                       'Digest': content.digest}
+            yield client.fetch(uri, method='POST', headers=headers, body_producer=content.produce)
+        else:
+            uri = _get_full_uri(config.Runner.Rest.BASE_URI, config.Runner.Rest.Endpoints.INSTALL)
+            package = dict(name=name, data=content, encoding=encoding)
+            yield client.fetch(uri, method='POST', body=json_encode(package))
 
     @gen.coroutine
     def _update_running_config_with_package(self, name):
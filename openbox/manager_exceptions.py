@@ -24,3 +24,58 @@ class UnknownRequestedParameter(ManagerError):
 
 class UnsupportedModuleDataEncoding(ManagerError):
     pass
+
+
+class ProcessingGraphOverBudgetError(ManagerError):
+    pass
+
+
+class MessageRouterNotRunningError(ManagerError):
+    pass
+
+
+class MessageLaneFullError(ManagerError):
+    def __init__(self, lane, retry_after):
+        super(MessageLaneFullError, self).__init__("Message lane {lane} is full".format(lane=lane))
+        self.lane = lane
+        self.retry_after = retry_after
+
+
+class BadSubscriptionError(ManagerError):
+    pass
+
+
+class UnknownSubscriptionError(ManagerError):
+    pass
+
+
+class CounterHistoryError(ManagerError):
+    pass
+
+
+class PushMessageLimitError(ManagerError):
+    pass
+
+
+class LogSinkError(ManagerError):
+    pass
+
+
+class UnsupportedWireFormatError(ManagerError):
+    pass
+
+
+class BadProcessingGraphBudgetError(ManagerError):
+    pass
+
+
+class GraphCompilationTimeoutError(ManagerError):
+    pass
+
+
+class GraphCompilationCancelledError(ManagerError):
+    pass
+
+
+class GraphCompilationError(ManagerError):
+    pass
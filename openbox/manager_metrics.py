@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+The metrics of the OBSI subsystems, exposed by the manager's REST server.
+
+Most values are already counted by the subsystems themselves and are copied into the registry only when
+it's rendered. The control and runner processes are asked for theirs before each rendering.
+"""
+import socket
+
+from tornado import gen, httpclient
+from tornado.escape import json_decode
+from tornado.log import app_log
+
+import config
+from metrics import MetricsRegistry
+
+
+class ManagerMetrics(object):
+    def __init__(self, manager):
+        self.manager = manager
+        self.registry = registry = MetricsRegistry()
+
+        self.lane_depth = registry.gauge('obsi_message_lane_depth', "Messages waiting in a message router lane",
+                                         ['lane'])
+        self.lane_received = registry.counter('obsi_message_lane_received_total', "Messages received by a lane",
+                                              ['lane'])
+        self.lane_rejected = registry.counter('obsi_message_lane_rejected_total',
+                                              "Messages rejected since their lane was full", ['lane'])
+        self.lane_dispatched = registry.counter('obsi_message_lane_dispatched_total',
+                                                "Messages of a lane dispatched to their handler", ['lane'])
+        self.lane_max_wait = registry.gauge('obsi_message_lane_max_wait_seconds',
+                                            "The longest time a message waited in a lane", ['lane'])
+
+        self.push_buffered = registry.gauge('obsi_push_messages_buffered',
+                                            "Push messages buffered before they are sent", ['type'])
+        self.push_batch_size = registry.gauge('obsi_push_messages_batch_size',
+                                              "The current batch size of push messages", ['type'])
+        self.push_in_flight = registry.gauge('obsi_push_messages_batches_in_flight',
+                                             "Batches of push messages being sent", ['type'])
+        self.push_dropped = registry.counter('obsi_push_messages_dropped_total',
+                                             "Push messages dropped by their limits or a full buffer", ['type'])
+
+        self.sender_requests = registry.counter('obsi_message_sender_requests_total',
+                                                "Requests sent to a destination", ['destination'])
+        self.sender_errors = registry.counter('obsi_message_sender_errors_total',
+                                              "Failed requests to a destination", ['destination'])
+        self.sender_bytes = registry.counter('obsi_message_sender_bytes_total',
+                                             "Bytes of the messages sent to a destination", ['destination'])
+        self.sender_in_flight = registry.gauge('obsi_message_sender_requests_in_flight',
+                                               "Requests to a destination waiting for their response", ['destination'])
+
+        self.reads = registry.counter('obsi_block_reads_total', "Reads of block handlers")
+        self.engine_reads = registry.counter('obsi_engine_reads_total', "Reads of block handlers sent to the engine")
+
+        self.graph_compile_time = registry.histogram('obsi_graph_compile_seconds',
+                                                     "The time of compiling a processing graph",
+                                                     config.Metrics.COMPILE_BUCKETS)
+        self.control_socket_latency = registry.histogram('obsi_control_socket_latency_seconds',
+                                                         "The latency of the engine's control socket commands")
+        self.hotswap_duration = registry.histogram('obsi_hotswap_seconds', "The duration of engine hotswaps")
+
+        self.engine_memory_rss = registry.gauge('obsi_engine_memory_rss_bytes', "The engine's resident memory")
+        self.engine_memory_vms = registry.gauge('obsi_engine_memory_vms_bytes', "The engine's virtual memory")
+        self.engine_load = registry.gauge('obsi_engine_cpu_load', "The engine's current CPU load")
+        self.engine_uptime = registry.gauge('obsi_engine_uptime_seconds', "The engine's uptime")
+
+        registry.add_collector(self._collect)
+
+    def _collect(self):
+        manager = self.manager
+        for name, lane in manager.message_router.metrics().iteritems():
+            self.lane_depth.labels(name).set(lane['depth'])
+            self.lane_received.labels(name).value = lane['received']
+            self.lane_rejected.labels(name).value = lane['rejected']
+            self.lane_dispatched.labels(name).value = lane['dispatched']
+            self.lane_max_wait.labels(name).set(lane['max_wait_time'])
+
+        for message_type, handler, limiter in (('alert', manager._alert_messages_handler,
+                                                manager._alert_messages_limiter),
+                                               ('log', manager._log_messages_handler,
+                                                manager._log_messages_limiter)):
+            self.push_dropped.labels(message_type).value = limiter.dropped
+            if handler is not None:
+                handler_metrics = handler.metrics()
+                self.push_dropped.labels(message_type).value += handler_metrics['dropped']
+                self.push_buffered.labels(message_type).set(handler_metrics['buffered'])
+                self.push_batch_size.labels(message_type).set(handler_metrics['batch_size'])
+                self.push_in_flight.labels(message_type).set(handler_metrics['in_flight'])
+
+        for destination, sender in manager.message_sender.metrics().iteritems():
+            self.sender_requests.labels(destination).value = sender['requests']
+            self.sender_errors.labels(destination).value = sender['errors']
+            self.sender_bytes.labels(destination).value = sender['bytes']
+            self.sender_in_flight.labels(destination).set(sender['in_flight'])
+
+        self.reads.value = manager._read_coalescer.reads
+        self.engine_reads.value = manager._read_coalescer.engine_reads
+
+    @gen.coroutine
+    def collect_engine_metrics(self):
+        """
+        Update the metrics of the runner and control processes, their last values are kept if they can't be reached
+        """
+        try:
+            stats = yield self.manager.local_global_stats()
+            self.engine_memory_rss.set(stats['memory_rss'])
+            self.engine_memory_vms.set(stats['memory_vms'])
+            self.engine_load.set(stats['current_load'])
+            self.engine_uptime.set(stats['uptime'])
+        except (httpclient.HTTPError, socket.error) as e:
+            app_log.debug("Unable to get the engine's global stats: {error}".format(error=e))
+
+        client = httpclient.AsyncHTTPClient(request_timeout=config.Manager.REQUEST_TIMEOUT)
+        uri = '{base}{endpoint}'.format(base=config.Control.Rest.BASE_URI,
+                                        endpoint=config.Control.Rest.Endpoints.METRICS)
+        try:
+            response = yield client.fetch(uri)
+        except (httpclient.HTTPError, socket.error) as e:
+            app_log.debug("Unable to get the control metrics: {error}".format(error=e))
+            return
+        control_metrics = json_decode(response.body)
+        self.control_socket_latency.load(control_metrics['control_socket_latency'])
+        self.hotswap_duration.load(control_metrics['hotswap_duration'])
+
+    def render(self):
+        return self.registry.render()
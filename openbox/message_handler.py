@@ -29,6 +29,11 @@ class MessageHandler(object):
             messages.GlobalStatsReset: self.handle_global_stats_reset,
             messages.ReadRequest: self.handle_read_request,
             messages.WriteRequest: self.handle_write_request,
+            messages.BatchReadRequest: self.handle_batch_read_request,
+            messages.CounterHistoryRequest: self.handle_counter_history_request,
+            messages.BatchWriteRequest: self.handle_batch_write_request,
+            messages.SubscribeRequest: self.handle_subscribe_request,
+            messages.UnsubscribeRequest: self.handle_unsubscribe_request,
             messages.SetProcessingGraphRequest: self.handle_set_processing_graph_request,
             messages.BarrierRequest: self.handle_barrier_request,
             messages.Error: self.handle_error,
@@ -74,6 +79,42 @@ class MessageHandler(object):
         response = messages.WriteResponse.from_request(message)
         yield self.manager.message_sender.send_message_ignore_response(response)
 
+    @gen.coroutine
+    def handle_counter_history_request(self, message):
+        app_log.debug("Handling:{message}".format(message=message.to_json()))
+        history = self.manager.counter_history.query(message.block_id, message.read_handle, message.window)
+        response = messages.CounterHistoryResponse.from_request(message, history=history)
+        yield self.manager.message_sender.send_message_ignore_response(response)
+
+    @gen.coroutine
+    def handle_batch_read_request(self, message):
+        app_log.debug("Handling:{message}".format(message=message.to_json()))
+        results = yield self.manager.read_block_values(message.reads)
+        response = messages.BatchReadResponse.from_request(message, results=results)
+        yield self.manager.message_sender.send_message_ignore_response(response)
+
+    @gen.coroutine
+    def handle_batch_write_request(self, message):
+        app_log.debug("Handling:{message}".format(message=message.to_json()))
+        results = yield self.manager.write_block_values(message.writes)
+        response = messages.BatchWriteResponse.from_request(message, results=results)
+        yield self.manager.message_sender.send_message_ignore_response(response)
+
+    @gen.coroutine
+    def handle_subscribe_request(self, message):
+        app_log.debug("Handling:{message}".format(message=message.to_json()))
+        subscription_id = self.manager.stats_subscriptions.subscribe(message.reads, message.global_stats,
+                                                                     message.interval)
+        response = messages.SubscribeResponse.from_request(message, subscription_id=subscription_id)
+        yield self.manager.message_sender.send_message_ignore_response(response)
+
+    @gen.coroutine
+    def handle_unsubscribe_request(self, message):
+        app_log.debug("Handling:{message}".format(message=message.to_json()))
+        self.manager.stats_subscriptions.unsubscribe(message.subscription_id)
+        response = messages.UnsubscribeResponse.from_request(message)
+        yield self.manager.message_sender.send_message_ignore_response(response)
+
     @gen.coroutine
     def handle_set_processing_graph_request(self, message):
         app_log.debug("Handling SetProcessingGraphRequest".format(message=message.to_json()))
@@ -83,7 +124,10 @@ class MessageHandler(object):
 
     @gen.coroutine
     def handle_barrier_request(self, message):
-        app_log.info("Received BarrierRequest")
+        # the router calls this handler only after all the messages received before the barrier were handled
+        app_log.debug("Handling:{message}".format(message=message.to_json()))
+        response = messages.BarrierResponse.from_request(message)
+        yield self.manager.message_sender.send_message_ignore_response(response)
 
     @gen.coroutine
     def handle_error(self, message):
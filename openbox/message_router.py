@@ -6,50 +6,290 @@
 #####################################################################
 
 import errors
+import math
 import sys
+import time
+from collections import deque, defaultdict, OrderedDict
 from tornado import gen
-from tornado.queues import Queue
-from messages import MessageMeta, Message, Error
+from tornado.locks import Condition
+from messages import MessageMeta, Message, Error, BarrierRequest
+from manager_exceptions import MessageLaneFullError, MessageRouterNotRunningError
+
+DEFAULT_LANE = 'default'
+
+
+class _Lane(object):
+    """
+    The messages waiting in a lane, queued by their pool in the order they were received.
+    BarrierRequests are queued under the None pool.
+    """
+
+    def __init__(self, name, size):
+        self.name = name
+        self.size = size
+        self.queues = OrderedDict()
+        self.depth = 0
+        self.received = 0
+        self.rejected = 0
+        self.dispatched = 0
+        self.total_wait_time = 0.0
+        self.max_wait_time = 0.0
+
+    def full(self):
+        return self.size is not None and self.depth >= self.size
+
+    def put(self, pool, sequence, message):
+        self.received += 1
+        self.depth += 1
+        self.queues.setdefault(pool, deque()).append((sequence, time.time(), message))
+
+    def head(self, pool):
+        """
+        The sequence number of the earliest waiting message of a pool, None if it has none
+        """
+        queue = self.queues.get(pool)
+        return queue[0][0] if queue else None
+
+    def pop(self, pool):
+        """
+        Take the earliest waiting message of a pool.
+
+        :return: The message's sequence number and the message
+        """
+        queue = self.queues[pool]
+        sequence, received_time, message = queue.popleft()
+        if not queue:
+            del self.queues[pool]
+        self.depth -= 1
+        wait_time = time.time() - received_time
+        self.dispatched += 1
+        self.total_wait_time += wait_time
+        self.max_wait_time = max(self.max_wait_time, wait_time)
+        return sequence, message
+
+    def average_wait_time(self):
+        if not self.dispatched:
+            return 0.0
+        return self.total_wait_time / self.dispatched
+
+    def metrics(self):
+        now = time.time()
+        oldest = min(queue[0][1] for queue in self.queues.itervalues()) if self.queues else now
+        return dict(size=self.size,
+                    depth=self.depth,
+                    received=self.received,
+                    rejected=self.rejected,
+                    dispatched=self.dispatched,
+                    average_wait_time=self.average_wait_time(),
+                    max_wait_time=self.max_wait_time,
+                    oldest_wait_time=now - oldest)
 
 
 class MessageRouter(object):
-    def __init__(self, message_sender, default_handler=None):
-        self._queue = Queue()
+    """
+    Routes received messages to their handlers.
+
+    Received messages wait in bounded lanes, a message is rejected if its lane is full.
+    Each lane queues its messages by pool, so the next message is found without going over all the waiting ones.
+    Messages are taken from the lanes by their priority and handled by the worker pool of their type,
+    which handles a limited number of messages concurrently, so slow messages of one pool don't delay
+    the messages of the others. Each pool handles its messages in the order they were received,
+    a pool that handles one message at a time takes them in that order even from lanes of lower priority.
+
+    A BarrierRequest waits in its lane like any other message and is handled only after all the messages
+    received before it were handled, and messages received after it wait for it.
+    """
+
+    def __init__(self, message_sender, default_handler=None, pools=None, concurrency=None, lanes=None,
+                 lanes_sizes=None, lanes_priorities=None):
+        """
+        :param pools: The name of the pool of each message type, by default each type has a pool of its own
+        :type pools: dict
+        :param concurrency: The number of messages each pool handles concurrently, by default 1
+        :type concurrency: dict
+        :param lanes: The name of the lane of each message type, by default all types share a single lane
+        :type lanes: dict
+        :param lanes_sizes: The maximal number of waiting messages in each lane, by default unlimited
+        :type lanes_sizes: dict
+        :param lanes_priorities: The names of the lanes from the highest priority to the lowest
+        :type lanes_priorities: list
+        """
         self.message_sender = message_sender
         self.default_handler = default_handler
         self._message_handlers = {}
+        self._queued_hooks = {}
         self._working = False
+        self._pools = pools or {}
+        self._concurrency = concurrency or {}
+        self._message_lanes = lanes or {}
+        lanes_sizes = lanes_sizes or {}
+        lanes_priorities = list(lanes_priorities or [])
+        for lane in sorted(set(self._message_lanes.itervalues()) | set([DEFAULT_LANE])):
+            if lane not in lanes_priorities:
+                lanes_priorities.append(lane)
+        self._lanes = [_Lane(name, lanes_sizes.get(name)) for name in lanes_priorities]
+        self._lanes_by_name = dict((lane.name, lane) for lane in self._lanes)
+        self._running = defaultdict(int)
+        self._in_flight = set()
+        self._handling_barrier = False
+        self._sequence = 0
+        self._changed = Condition()
 
     def register_message_handler(self, message, handler):
         assert isinstance(message, MessageMeta)
         assert hasattr(handler, '__call__')
         self._message_handlers[message.__name__] = handler
 
-    @gen.coroutine
+    def register_queued_hook(self, message, hook):
+        """
+        Register a hook called with each message of a type as soon as it's queued, before it waits for its turn
+        """
+        assert isinstance(message, MessageMeta)
+        assert hasattr(hook, '__call__')
+        self._queued_hooks[message.__name__] = hook
+
     def put_message(self, message):
+        """
+        Add a received message to its lane.
+
+        :raises MessageLaneFullError: If the message's lane is full
+        :raises MessageRouterNotRunningError: If the router was stopped
+        """
         assert isinstance(message, Message)
-        yield self._queue.put(message)
+        if not self._working:
+            raise MessageRouterNotRunningError("Message router is not running")
+        lane = self._lane(message.type)
+        if lane.full():
+            lane.rejected += 1
+            raise MessageLaneFullError(lane.name, self.retry_after(lane.name))
+        self._sequence += 1
+        if isinstance(message, BarrierRequest):
+            lane.put(None, self._sequence, message)
+        else:
+            lane.put(self._pool(message.type), self._sequence, message)
+            hook = self._queued_hooks.get(message.type)
+            if hook is not None:
+                hook(message)
+        self._changed.notify()
 
     @gen.coroutine
     def start(self):
         self._working = True
         while self._working:
-            message = yield self._queue.get()
-            try:
-                # TODO: Maybe we need to add special handling for BarrierRequest
-                handler = self._message_handlers.get(message.type, self.default_handler)
-                if handler:
-                    yield handler(message)
-            except Exception as e:
-                exc_type, exc_value, exc_tb = sys.exc_info()
-                error_type, error_subtype, error_message, extended_message = errors.exception_to_error_args(exc_type,
-                                                                                                            exc_value,
-                                                                                                            exc_tb)
-                response = Error.from_request(message, error_type=error_type, error_subtype=error_subtype,
-                                              message=error_message, extended_message=extended_message)
-                yield self.message_sender.send_message_ignore_response(response)
-            finally:
-                self._queue.task_done()
+            if not self._dispatch_next():
+                yield self._changed.wait()
 
     def stop(self):
-        self._working = False
\ No newline at end of file
+        self._working = False
+        self._changed.notify()
+
+    def metrics(self):
+        """
+        The depth and wait time metrics of each lane, by lane name
+        """
+        return dict((lane.name, lane.metrics()) for lane in self._lanes)
+
+    def retry_after(self, lane_name):
+        """
+        The estimated number of seconds until a full lane has room for new messages
+        """
+        return max(1, int(math.ceil(self._lanes_by_name[lane_name].average_wait_time())))
+
+    def _lane(self, message_type):
+        return self._lanes_by_name[self._message_lanes.get(message_type, DEFAULT_LANE)]
+
+    def _pool(self, message_type):
+        return self._pools.get(message_type, message_type)
+
+    def _has_capacity(self, pool):
+        return self._running[pool] < self._concurrency.get(pool, 1)
+
+    def _dispatch_next(self):
+        """
+        Dispatch the next message that can be handled now.
+
+        :return: True if a message was dispatched
+        """
+        if self._handling_barrier:
+            return False
+        barrier_sequence, barrier_lane = self._earliest_head(None)
+        if barrier_lane is not None and self._earliest_pending() > barrier_sequence:
+            self._handling_barrier = True
+            self._dispatch(barrier_lane, None)
+            return True
+
+        for lane in self._lanes:
+            # the earliest message of the lane whose pool can handle it now
+            ready = None
+            for pool, queue in lane.queues.iteritems():
+                sequence = queue[0][0]
+                if pool is None or sequence > barrier_sequence or not self._has_capacity(pool):
+                    continue
+                if ready is None or sequence < ready[0]:
+                    ready = sequence, pool
+            if ready is not None:
+                _, pool = ready
+                if self._concurrency.get(pool, 1) == 1:
+                    # a serial pool takes its messages in the order they were received, in any lane
+                    _, lane = self._earliest_head(pool)
+                self._dispatch(lane, pool)
+                return True
+        return False
+
+    def _earliest_head(self, pool):
+        """
+        The sequence number and lane of the earliest waiting message of a pool, in any lane
+
+        :return: The sequence number and the lane, sys.maxint and None if the pool has no waiting messages
+        """
+        earliest = sys.maxint, None
+        for lane in self._lanes:
+            sequence = lane.head(pool)
+            if sequence is not None and sequence < earliest[0]:
+                earliest = sequence, lane
+        return earliest
+
+    def _dispatch(self, lane, pool):
+        sequence, message = lane.pop(pool)
+        self._start(message, pool, sequence)
+
+    def _earliest_pending(self):
+        """
+        The sequence number of the earliest message that was not handled yet, other than barriers
+        """
+        pending = [sequence for sequence, _ in self._in_flight]
+        pending.extend(queue[0][0] for lane in self._lanes for pool, queue in lane.queues.iteritems()
+                       if pool is not None)
+        return min(pending) if pending else sys.maxint
+
+    def _start(self, message, pool, sequence):
+        in_flight = (sequence, message)
+        self._in_flight.add(in_flight)
+        if pool is not None:
+            self._running[pool] += 1
+        future = self._handle(message)
+
+        def _done(_):
+            self._in_flight.discard(in_flight)
+            if pool is not None:
+                self._running[pool] -= 1
+            else:
+                self._handling_barrier = False
+            self._changed.notify()
+
+        future.add_done_callback(_done)
+
+    @gen.coroutine
+    def _handle(self, message):
+        try:
+            handler = self._message_handlers.get(message.type, self.default_handler)
+            if handler:
+                yield handler(message)
+        except Exception as e:
+            exc_type, exc_value, exc_tb = sys.exc_info()
+            error_type, error_subtype, error_message, extended_message = errors.exception_to_error_args(exc_type,
+                                                                                                        exc_value,
+                                                                                                        exc_tb)
+            response = Error.from_request(message, error_type=error_type, error_subtype=error_subtype,
+                                          message=error_message, extended_message=extended_message)
+            yield self.message_sender.send_message_ignore_response(response)
@@ -9,36 +9,217 @@
 Send messages to OBC
 """
 import config
+import gzip
 import socket
+import time
+import urlparse
+from cStringIO import StringIO
 
 from tornado import gen
-from tornado.queues import Queue
-from tornado.httpclient import AsyncHTTPClient, HTTPError
+from tornado.concurrent import Future
+from tornado.ioloop import IOLoop
+from tornado.locks import Semaphore
+from tornado.queues import Queue, QueueEmpty
+from tornado.httpclient import HTTPError
+from outbound_spool import OutboundSpool
+import wire_format
 
+try:
+    # only the curl client keeps connections alive between requests
+    import pycurl
+    from tornado.curl_httpclient import CurlAsyncHTTPClient as _HTTPClient
+except ImportError:
+    from tornado.simple_httpclient import SimpleAsyncHTTPClient as _HTTPClient
 
-class MessageSender(object):
+
+def _gzip(body):
+    compressed = StringIO()
+    with gzip.GzipFile(fileobj=compressed, mode='wb') as f:
+        f.write(body)
+    return compressed.getvalue()
+
+
+def _unreachable(http_error):
+    # 599 is used for connection errors and timeouts
+    return http_error.code in (599, 502, 503, 504)
+
+
+class _DestinationMetrics(object):
     def __init__(self):
+        self.requests = 0
+        self.messages = 0
+        self.errors = 0
+        self.in_flight = 0
+        self.bytes = 0
+        self.compressed_bytes = 0
+        self.total_latency = 0.0
+        self.max_latency = 0.0
+
+    def to_dict(self):
+        return dict(requests=self.requests, messages=self.messages, errors=self.errors, in_flight=self.in_flight,
+                    bytes=self.bytes, compressed_bytes=self.compressed_bytes,
+                    average_latency=self.total_latency / self.requests if self.requests else 0.0,
+                    max_latency=self.max_latency)
+
+
+class MessageSender(object):
+    """
+    Sends messages over a pool of connections, with a limited number of requests in flight to each destination.
+
+    If the controller supports it, messages to the controller queued within a short window are sent together
+    in a single request. Bodies larger than a threshold are compressed.
+    """
+
+    def __init__(self, spool_directory=None):
+        """
+        :param spool_directory: The directory of the spool of messages that couldn't be delivered, None for no spool
+        """
         self._queue = Queue()
-        self._client = AsyncHTTPClient()
+        self._client = _HTTPClient(force_instance=True, max_clients=config.MessageSender.MAX_CONNECTIONS)
+        self._destinations_locks = {}
+        self._metrics = {}
+        self._batching = False
+        self.spool = None
+        if spool_directory is not None:
+            self.spool = OutboundSpool(spool_directory, self._deliver_spooled, config.OutboundSpool.MAX_SIZE,
+                                       config.OutboundSpool.SEGMENT_SIZE, config.OutboundSpool.RETENTION,
+                                       config.OutboundSpool.DEFAULT_RETENTION, config.OutboundSpool.OVERFLOW_POLICY,
+                                       config.OutboundSpool.RETRY_INTERVAL, config.OutboundSpool.MAX_RETRY_INTERVAL,
+                                       config.OutboundSpool.SYNC)
+
+    def start(self):
+        if self.spool is not None:
+            # deliver the messages spooled before a restart
+            self.spool.start()
+
+    def metrics(self):
+        """
+        The number of requests, messages, errors, bytes and latency metrics of each destination
+        """
+        return dict((destination, metrics.to_dict()) for destination, metrics in self._metrics.iteritems())
 
     @gen.coroutine
     def send_message(self, message, url=None):
-        url = url or config.OpenBoxController.MESSAGE_ENDPOINT_PATTERN.format(message=message.type)
-        yield self._client.fetch(url, method='POST', user_agent='OBSI', headers={'Content-Type': 'application/json'},
-                                 body=message.to_json())
+        if url is None and config.OpenBoxController.MULTIPLE_MESSAGES_ENDPOINT:
+            future = Future()
+            self._queue.put_nowait((message, future))
+            if not self._batching:
+                self._batching = True
+                IOLoop.current().spawn_callback(self._send_batches)
+            yield future
+        else:
+            body, content_type = self._encode(message, url)
+            yield self._post(url or config.OpenBoxController.MESSAGE_ENDPOINT_PATTERN.format(message=message.type),
+                             body, 1, content_type)
+
+    @staticmethod
+    def _encode(message, url):
+        """
+        :return: The body and content type of a message sent on its own
+        """
+        if url is None:
+            # the controller may have chosen another wire format
+            return wire_format.encode(message, config.MessageSender.WIRE_FORMAT), config.MessageSender.WIRE_FORMAT
+        return message.to_json(), wire_format.JSON
 
     @gen.coroutine
     def send_message_ignore_response(self, message, url=None):
+        if self.spool is not None and self.spool.pending and self.spool.spools(message.type):
+            # keep the order of the messages waiting in the spool, messages that aren't spooled are sent now
+            raise gen.Return(self._spool_message(message, url))
         try:
             response = yield self.send_message(message, url)
             raise gen.Return(True)
-        except HTTPError:
+        except HTTPError as e:
+            if _unreachable(e):
+                raise gen.Return(self._spool_message(message, url))
             raise gen.Return(False)
         except socket.error:
+            raise gen.Return(self._spool_message(message, url))
+
+    def _spool_message(self, message, url):
+        """
+        :return: True if the message was spooled for a later delivery
+        """
+        if self.spool is None:
+            return False
+        # the message is replayed as it would have been sent now, in the same wire format
+        body, content_type = self._encode(message, url)
+        url = url or config.OpenBoxController.MESSAGE_ENDPOINT_PATTERN.format(message=message.type)
+        return self.spool.append(message.type, url, body, content_type)
+
+    @gen.coroutine
+    def _deliver_spooled(self, url, body, content_type):
+        try:
+            yield self._post(url, body, 1, content_type)
+        except HTTPError as e:
+            if _unreachable(e):
+                raise
             raise gen.Return(False)
+        raise gen.Return(True)
 
     @gen.coroutine
     def send_push_messages(self, push_message_class, dpid, url, buffered_messages):
         message = push_message_class(origin_dpid=dpid, messages=buffered_messages)
         yield self.send_message_ignore_response(message, url)
 
+    @gen.coroutine
+    def _send_batches(self):
+        while True:
+            try:
+                batch = [self._queue.get_nowait()]
+            except QueueEmpty:
+                self._batching = False
+                return
+            deadline = IOLoop.current().time() + config.MessageSender.BATCH_WINDOW
+            while len(batch) < config.MessageSender.BATCH_SIZE:
+                try:
+                    batch.append((yield self._queue.get(timeout=deadline)))
+                except gen.TimeoutError:
+                    break
+            IOLoop.current().spawn_callback(self._send_batch, batch)
+
+    @gen.coroutine
+    def _send_batch(self, batch):
+        content_type = config.MessageSender.WIRE_FORMAT
+        body = wire_format.encode_many([message for message, _ in batch], content_type)
+        try:
+            yield self._post(config.OpenBoxController.MULTIPLE_MESSAGES_ENDPOINT, body, len(batch), content_type)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+        else:
+            for _, future in batch:
+                future.set_result(None)
+
+    @gen.coroutine
+    def _post(self, url, body, messages_count, content_type=wire_format.JSON):
+        destination = urlparse.urlsplit(url).netloc
+        metrics = self._metrics.setdefault(destination, _DestinationMetrics())
+        lock = self._destinations_locks.get(destination)
+        if lock is None:
+            lock = self._destinations_locks[destination] = Semaphore(config.MessageSender.MAX_IN_FLIGHT)
+
+        headers = {'Content-Type': content_type}
+        metrics.bytes += len(body)
+        threshold = config.MessageSender.COMPRESSION_THRESHOLD
+        if threshold is not None and len(body) > threshold:
+            body = _gzip(body)
+            headers['Content-Encoding'] = 'gzip'
+        metrics.compressed_bytes += len(body)
+
+        with (yield lock.acquire()):
+            metrics.in_flight += 1
+            start = time.time()
+            try:
+                yield self._client.fetch(url, method='POST', user_agent='OBSI', headers=headers, body=body)
+            except Exception:
+                metrics.errors += 1
+                raise
+            finally:
+                latency = time.time() - start
+                metrics.in_flight -= 1
+                metrics.requests += 1
+                metrics.messages += messages_count
+                metrics.total_latency += latency
+                metrics.max_latency = max(metrics.max_latency, latency)
@@ -11,11 +11,65 @@ Messages between OBC and OBI
 
 import json
 
+try:
+    # the fastest available JSON backend
+    import ujson
+
+    def json_dumps(obj):
+        # the default precision of ujson truncates timestamps
+        return ujson.dumps(obj, double_precision=15)
+
+    json_loads = ujson.loads
+except ImportError:
+    json_dumps = json.JSONEncoder().encode
+    json_loads = json.JSONDecoder().decode
+
+_ENCODER_TEMPLATE = """
+def to_dict(self):
+    return {{{fields}}}
+
+def to_json(self):
+    return json_dumps({{'type': {name!r}, {fields}}})
+"""
+
+_DECODER_TEMPLATE = """
+def from_fields(obj):
+    message = new(cls)
+    try:
+{assignments}
+    except KeyError as e:
+        raise MessageParsingError("Field %s, not given" % e.args[0])
+    return message
+"""
+
 
 class MessageParsingError(Exception):
     pass
 
 
+def _next_xid():
+    xid = Message.XID
+    Message.XID += 1
+    return xid
+
+
+def _compile_codec(cls):
+    """
+    Generate the functions encoding and decoding the fields of a message class without going through its __slots__.
+    """
+    fields = ', '.join('{field!r}: self.{field}'.format(field=field) for field in cls.__slots__)
+    namespace = dict(json_dumps=json_dumps)
+    exec _ENCODER_TEMPLATE.format(name=cls.__name__, fields=fields) in namespace
+    encoders = namespace['to_dict'], namespace['to_json']
+
+    assignments = '\n'.join(
+        "        message.xid = obj['xid'] if 'xid' in obj else next_xid()" if field == 'xid' else
+        "        message.{field} = obj[{field!r}]".format(field=field) for field in cls.__slots__) or '        pass'
+    namespace = dict(new=object.__new__, cls=cls, next_xid=_next_xid, MessageParsingError=MessageParsingError)
+    exec _DECODER_TEMPLATE.format(assignments=assignments) in namespace
+    return encoders, namespace['from_fields']
+
+
 class MessageMeta(type):
     def __init__(cls, name, bases, dct):
         if not hasattr(cls, "messages_registry"):
@@ -27,6 +81,14 @@ class MessageMeta(type):
 
         super(MessageMeta, cls).__init__(name, bases, dct)
 
+        # precompiled encoding and decoding, unless the class changes how it's done
+        (to_dict, to_json), from_fields = _compile_codec(cls)
+        if 'to_dict' not in dct and 'to_json' not in dct:
+            cls.to_dict, cls.to_json = to_dict, to_json
+        if any('__init__' in vars(klass) for klass in cls.__mro__[:-2]):
+            from_fields = None
+        cls._from_fields = staticmethod(from_fields) if from_fields else None
+
 
 class Message(object):
     """
@@ -60,8 +122,10 @@ class Message(object):
             # noinspection PyUnresolvedReferences
             clazz = cls.messages_registry[msg_type]
         except KeyError:
-            raise MessageParsingError("Unknown Message Type" % repr(obj))
+            raise MessageParsingError("Unknown Message Type: %s" % repr(obj))
 
+        if clazz._from_fields is not None:
+            return clazz._from_fields(obj)
         try:
             return clazz(**obj)
         except TypeError as e:
@@ -69,17 +133,9 @@ class Message(object):
 
     @classmethod
     def from_json(cls, raw_data):
-        obj = json.loads(raw_data)
+        obj = json_loads(raw_data)
         return cls.from_dict(obj)
 
-    def to_dict(self):
-        return dict((field, getattr(self, field)) for field in self.__slots__)
-
-    def to_json(self):
-        obj_dict = self.to_dict()
-        obj_dict['type'] = self.__class__.__name__
-        return json.dumps(obj_dict)
-
     def __str__(self):
         return self.to_json()
 
@@ -165,6 +221,58 @@ class WriteResponse(MessageResponse):
     __request__ = WriteRequest
 
 
+class CounterHistoryRequest(MessageRequest):
+    # window is the number of seconds to summarize
+    __slots__ = ['xid', 'block_id', 'read_handle', 'window']
+
+
+class CounterHistoryResponse(MessageResponse):
+    __slots__ = ['xid', 'block_id', 'read_handle', 'window', 'history']
+    __copy_request_fields__ = ['xid', 'block_id', 'read_handle', 'window']
+    __request__ = CounterHistoryRequest
+
+
+class BatchReadRequest(MessageRequest):
+    # reads is a list of dicts with the block_id and read_handle of each read
+    __slots__ = ['xid', 'reads']
+
+
+class BatchReadResponse(MessageResponse):
+    # results is a list of dicts with the block_id, read_handle, result and error of each read
+    __slots__ = ['xid', 'results']
+    __request__ = BatchReadRequest
+
+
+class BatchWriteRequest(MessageRequest):
+    # writes is a list of dicts with the block_id, write_handle and value of each write
+    __slots__ = ['xid', 'writes']
+
+
+class BatchWriteResponse(MessageResponse):
+    # results is a list of dicts with the block_id, write_handle and error of each write
+    __slots__ = ['xid', 'results']
+    __request__ = BatchWriteRequest
+
+
+class SubscribeRequest(MessageRequest):
+    # reads is a list of dicts with the block_id and read_handle of each sampled handler, interval is in milliseconds
+    __slots__ = ['xid', 'reads', 'global_stats', 'interval']
+
+
+class SubscribeResponse(MessageResponse):
+    __slots__ = ['xid', 'subscription_id']
+    __request__ = SubscribeRequest
+
+
+class UnsubscribeRequest(MessageRequest):
+    __slots__ = ['xid', 'subscription_id']
+
+
+class UnsubscribeResponse(MessageResponse):
+    __slots__ = ['xid']
+    __request__ = UnsubscribeRequest
+
+
 class SetProcessingGraphRequest(MessageRequest):
     __slots__ = ['xid', 'required_modules', 'blocks', 'connectors']
 
@@ -178,6 +286,11 @@ class BarrierRequest(MessageRequest):
     __slots__ = ['xid']
 
 
+class BarrierResponse(MessageResponse):
+    __slots__ = ['xid']
+    __request__ = BarrierRequest
+
+
 class Error(MessageResponse):
     __slots__ = ['xid', 'error_type', 'error_subtype', 'message', 'extended_message']
 
@@ -208,6 +321,11 @@ class Log(MessageRequest):
     __slots__ = ['xid', 'origin_dpid', 'messages']
 
 
+class Stats(MessageRequest):
+    # samples holds only the reads whose result or error changed since the previous push of the subscription
+    __slots__ = ['xid', 'origin_dpid', 'subscription_id', 'timestamp', 'samples', 'global_stats']
+
+
 class SetParametersRequest(MessageRequest):
     __slots__ = ['xid', 'parameters']
 
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+A registry of counters, gauges and fixed-bucket histograms, rendered in the Prometheus text exposition format.
+
+A metric is created once and kept by the code updating it, so an update is a few arithmetic operations
+without any allocation. Values other components already count are copied into metrics by collectors,
+which are called only when the registry is rendered.
+"""
+from collections import OrderedDict
+# the histogram is kept in the control package, so the control process can use it too
+from control.histogram import Histogram, DEFAULT_BUCKETS
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+COUNTER = 'counter'
+GAUGE = 'gauge'
+HISTOGRAM = 'histogram'
+
+
+def _format_value(value):
+    if isinstance(value, bool):
+        return '1' if value else '0'
+    if isinstance(value, (int, long)):
+        return str(value)
+    value = float(value)
+    if value != value:
+        return 'NaN'
+    if value in (float('inf'), float('-inf')):
+        return '+Inf' if value > 0 else '-Inf'
+    return repr(value)
+
+
+def _escape_label_value(value):
+    return unicode(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n').encode('utf-8')
+
+
+def _sample_line(name, labels, value):
+    if labels:
+        name = '{name}{{{labels}}}'.format(name=name, labels=','.join(
+            '{label}="{value}"'.format(label=label, value=_escape_label_value(value)) for label, value in labels))
+    return '{name} {value}'.format(name=name, value=_format_value(value))
+
+
+class Counter(object):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def inc(self, amount=1):
+        self.value += amount
+
+
+class Gauge(object):
+    __slots__ = ('value',)
+
+    def __init__(self):
+        self.value = 0
+
+    def set(self, value):
+        self.value = value
+
+    def inc(self, amount=1):
+        self.value += amount
+
+    def dec(self, amount=1):
+        self.value -= amount
+
+
+_METRIC_CLASSES = {COUNTER: Counter, GAUGE: Gauge, HISTOGRAM: Histogram}
+
+
+class MetricFamily(object):
+    """
+    The metrics with the same name and different label values.
+    """
+
+    def __init__(self, name, documentation, metric_type, label_names=(), buckets=None):
+        self.name = name
+        self.documentation = documentation
+        self.type = metric_type
+        self.label_names = tuple(label_names)
+        self.buckets = buckets
+        self._metrics = OrderedDict()
+
+    def labels(self, *label_values):
+        """
+        The metric of the label values, created by the first call.
+
+        The metric should be kept by its user, so updating it doesn't need a lookup.
+        """
+        if len(label_values) != len(self.label_names):
+            raise ValueError("Metric {name} has the labels: {labels}".format(name=self.name,
+                                                                             labels=', '.join(self.label_names)))
+        key = tuple(unicode(value) for value in label_values)
+        metric = self._metrics.get(key)
+        if metric is None:
+            if self.type == HISTOGRAM:
+                metric = Histogram(self.buckets)
+            else:
+                metric = _METRIC_CLASSES[self.type]()
+            self._metrics[key] = metric
+        return metric
+
+    def clear(self):
+        """
+        Remove the metrics of all label values, for label values that may disappear
+        """
+        self._metrics.clear()
+
+    def render(self):
+        lines = ['# HELP {name} {doc}'.format(name=self.name, doc=self.documentation.replace('\\', '\\\\')
+                                                .replace('\n', '\\n')),
+                 '# TYPE {name} {type}'.format(name=self.name, type=self.type)]
+        for label_values, metric in self._metrics.iteritems():
+            labels = zip(self.label_names, label_values)
+            if self.type != HISTOGRAM:
+                lines.append(_sample_line(self.name, labels, metric.value))
+                continue
+            cumulative = 0
+            for bound, count in zip(metric.buckets + (float('inf'),), metric.counts):
+                cumulative += count
+                lines.append(_sample_line(self.name + '_bucket', labels + [('le', _format_value(bound))],
+                                          cumulative))
+            lines.append(_sample_line(self.name + '_sum', labels, metric.sum))
+            lines.append(_sample_line(self.name + '_count', labels, metric.count))
+        return lines
+
+
+class MetricsRegistry(object):
+    def __init__(self):
+        self._families = OrderedDict()
+        self._collectors = []
+
+    def counter(self, name, documentation, label_names=()):
+        """
+        :return: A Counter, or its MetricFamily if it has labels
+        """
+        return self._register(MetricFamily(name, documentation, COUNTER, label_names))
+
+    def gauge(self, name, documentation, label_names=()):
+        """
+        :return: A Gauge, or its MetricFamily if it has labels
+        """
+        return self._register(MetricFamily(name, documentation, GAUGE, label_names))
+
+    def histogram(self, name, documentation, buckets=DEFAULT_BUCKETS, label_names=()):
+        """
+        :return: A Histogram, or its MetricFamily if it has labels
+        """
+        return self._register(MetricFamily(name, documentation, HISTOGRAM, label_names, buckets))
+
+    def _register(self, family):
+        if family.name in self._families:
+            raise ValueError("Metric {name} is already registered".format(name=family.name))
+        self._families[family.name] = family
+        return family if family.label_names else family.labels()
+
+    def add_collector(self, collector):
+        """
+        Add a function called without arguments before rendering, to copy values kept elsewhere into metrics
+        """
+        self._collectors.append(collector)
+
+    def render(self):
+        """
+        :return: All the metrics in the Prometheus text exposition format
+        """
+        for collector in self._collectors:
+            collector()
+        lines = []
+        for family in self._families.itervalues():
+            lines.extend(family.render())
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Streaming of custom modules.
+
+The base64 content of an AddCustomModuleRequest is decoded to a file while the request's body arrives,
+and the file is sent to the runner in chunks, so the memory used doesn't depend on the size of the module.
+"""
+import base64
+import binascii
+import hashlib
+import os
+import tempfile
+
+from tornado import gen
+
+from messages import MessageParsingError, json_loads
+
+CHUNK_SIZE = 64 * 1024
+BASE64_WHITESPACE = ' \t\r\n'
+# the escapes a JSON encoder may use inside a base64 string
+JSON_ESCAPES = {'/': '/', 'n': '\n', 'r': '\r', 't': '\t', '\\': '\\'}
+# the longest escape, \uXXXX
+MAX_ESCAPE_LENGTH = 6
+MAX_KEY_LENGTH = 256
+
+
+def sha256_digest_header(sha256):
+    """
+    The value of an RFC 3230 Digest header
+    """
+    return 'SHA-256=' + base64.b64encode(sha256.digest())
+
+
+def check_digest_header(header, sha256):
+    """
+    :return: True if the header has no SHA-256 digest or it matches the given one
+    """
+    for digest in (header or '').split(','):
+        algorithm, _, value = digest.strip().partition('=')
+        if algorithm.upper() == 'SHA-256':
+            return value == base64.b64encode(sha256.digest())
+    return True
+
+
+def module_digest(content):
+    """
+    :param content: A StreamedModule or a base64 string
+    :return: The SHA-256 hex digest of the module
+    :raise MessageParsingError: If the content isn't valid base64
+    """
+    if isinstance(content, StreamedModule):
+        return content.sha256.hexdigest()
+    try:
+        return hashlib.sha256(base64.b64decode(content)).hexdigest()
+    except (TypeError, binascii.Error) as e:
+        raise MessageParsingError("Invalid base64 module content: {error}".format(error=e))
+
+
+class StreamedModule(object):
+    """
+    The content of a custom module that was decoded to a file.
+    """
+
+    def __init__(self, path, size, sha256):
+        self.path = path
+        self.size = size
+        self.sha256 = sha256
+
+    def __nonzero__(self):
+        # like an empty content string
+        return self.size > 0
+
+    @property
+    def digest(self):
+        return sha256_digest_header(self.sha256)
+
+    @gen.coroutine
+    def produce(self, write):
+        """
+        A body producer sending the module in chunks
+        """
+        with open(self.path, 'rb') as f:
+            while True:
+                chunk = f.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                yield write(chunk)
+
+    def remove(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ModuleContentExtractor(object):
+    """
+    Scans a JSON object as it arrives and decodes the base64 string of one of its top level fields to a file.
+
+    The rest of the object is kept with an empty string in place of the field, and is parsed when the body ends.
+    """
+
+    def __init__(self, field, directory=None):
+        """
+        :param field: The name of the top level field holding the base64 content
+        :param directory: The directory of the decoded file, None for the default temporary directory
+        """
+        self.field = field
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='module-', delete=False)
+        self._sha256 = hashlib.sha256()
+        self._size = 0
+        self._rest = []
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._string = []
+        self._last_string = None
+        self._key = None
+        self._expecting_value = False
+        self._extracting = False
+        self._extracted = False
+        self._pending = ''
+        self._base64 = ''
+
+    def feed(self, data):
+        """
+        :raise MessageParsingError: If the content isn't valid, the decoded file is removed
+        """
+        position = 0
+        try:
+            while position < len(data):
+                if self._extracting:
+                    position = self._extract(data, position)
+                else:
+                    position = self._scan(data, position)
+        except MessageParsingError:
+            self.discard()
+            raise
+
+    def _scan(self, data, position):
+        """
+        Scan the structure of the object until the field's string starts.
+
+        :return: The position in data where the scan stopped
+        """
+        start = position
+        while position < len(data):
+            c = data[position]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif c == '\\':
+                    self._escaped = True
+                elif c == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        self._last_string = ''.join(self._string)
+                if self._depth == 1 and self._in_string and len(self._string) < MAX_KEY_LENGTH:
+                    self._string.append(c)
+                position += 1
+                continue
+
+            if c == '"':
+                if self._depth == 1 and self._expecting_value and self._key == self.field:
+                    # the string of the field starts, it's replaced by an empty one
+                    self._rest.append(data[start:position] + '""')
+                    self._expecting_value = False
+                    self._extracting = True
+                    return position + 1
+                self._in_string = True
+                self._string = []
+                self._expecting_value = False
+            elif c in '{[':
+                self._depth += 1
+                self._expecting_value = False
+            elif c in '}]':
+                self._depth -= 1
+            elif c == ':' and self._depth == 1:
+                self._key = self._last_string
+                self._expecting_value = True
+            elif c not in BASE64_WHITESPACE:
+                self._expecting_value = False
+            position += 1
+        self._rest.append(data[start:position])
+        return position
+
+    def _extract(self, data, position):
+        """
+        Decode the field's string until it ends.
+
+        :return: The position in data after the extracted part
+        """
+        if self._pending:
+            # an escape split between chunks
+            needed = (MAX_ESCAPE_LENGTH if self._pending[1:2] == 'u' else 2) - len(self._pending)
+            self._pending += data[position:position + needed]
+            position += needed
+            if self._pending_complete():
+                self._decode(self._unescape(self._pending))
+                self._pending = ''
+            return position
+
+        end = data.find('"', position)
+        escape = data.find('\\', position)
+        stop = len(data) if end == -1 else end
+        if escape != -1 and escape < stop:
+            self._decode(data[position:escape])
+            length = MAX_ESCAPE_LENGTH if data[escape + 1:escape + 2] == 'u' else 2
+            self._pending = data[escape:escape + length]
+            position = escape + len(self._pending)
+            if self._pending_complete():
+                self._decode(self._unescape(self._pending))
+                self._pending = ''
+            return position
+        self._decode(data[position:stop])
+        if end != -1:
+            self._extracting = False
+            self._extracted = True
+            return end + 1
+        return stop
+
+    def _pending_complete(self):
+        if len(self._pending) < 2:
+            return False
+        return len(self._pending) == (MAX_ESCAPE_LENGTH if self._pending[1] == 'u' else 2)
+
+    def _unescape(self, escape):
+        if escape[1] == 'u':
+            try:
+                return unichr(int(escape[2:], 16)).encode('ascii')
+            except (ValueError, UnicodeEncodeError):
+                raise MessageParsingError("Invalid character in the module content")
+        try:
+            return JSON_ESCAPES[escape[1]]
+        except KeyError:
+            raise MessageParsingError("Invalid escape in the module content")
+
+    def _decode(self, text):
+        data = (self._base64 + text).translate(None, BASE64_WHITESPACE)
+        complete = len(data) - len(data) % 4
+        self._base64 = data[complete:]
+        if not complete:
+            return
+        try:
+            decoded = binascii.a2b_base64(data[:complete])
+        except binascii.Error as e:
+            raise MessageParsingError("Invalid base64 module content: {error}".format(error=e))
+        self._file.write(decoded)
+        self._sha256.update(decoded)
+        self._size += len(decoded)
+
+    def finish(self):
+        """
+        :return: The object, with a StreamedModule as the value of the field if it was a string
+        :raise MessageParsingError: If the body isn't a valid object or the content isn't valid base64
+        """
+        self._file.close()
+        if self._extracting or self._base64 or self._pending:
+            self.discard()
+            raise MessageParsingError("Incomplete module content")
+        try:
+            obj = json_loads(''.join(self._rest))
+        except ValueError as e:
+            self.discard()
+            raise MessageParsingError("Invalid message body: {error}".format(error=e))
+        if not isinstance(obj, dict):
+            self.discard()
+            raise MessageParsingError("A message must be an object")
+        if self._extracted:
+            obj[self.field] = StreamedModule(self._file.name, self._size, self._sha256)
+        else:
+            self.discard()
+        return obj
+
+    def discard(self):
+        self._file.close()
+        if os.path.exists(self._file.name):
+            os.remove(self._file.name)
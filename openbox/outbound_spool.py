@@ -0,0 +1,344 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+A bounded on-disk spool of outbound messages that couldn't be delivered.
+
+Messages are appended to segment files, each record is a 4 bytes length followed by a JSON header line
+and the message's encoded body, kept as it would have been sent.
+The position of the next message to deliver (segment number and offset) is kept in a memory-mapped index file,
+so a restarted manager continues draining where it stopped.
+"""
+import json
+import mmap
+import os
+import struct
+import time
+
+from tornado import gen
+from tornado.ioloop import IOLoop
+from tornado.log import app_log
+
+SEGMENT_SUFFIX = '.segment'
+SEGMENT_NAME_PATTERN = '{number:010d}' + SEGMENT_SUFFIX
+INDEX_NAME = 'index'
+INDEX_FORMAT = '!QQ'
+RECORD_HEADER_FORMAT = '!I'
+RECORD_HEADER_SIZE = struct.calcsize(RECORD_HEADER_FORMAT)
+# the errors of reading a corrupted record
+CORRUPT_RECORD_ERRORS = (IOError, ValueError, KeyError, TypeError, struct.error)
+
+
+class OverflowPolicy:
+    # drop the oldest segment of messages to make room for new ones
+    DROP_OLDEST = 'drop_oldest'
+    # don't spool new messages
+    DROP_NEWEST = 'drop_newest'
+
+
+class OutboundSpool(object):
+    """
+    Spools outbound messages and delivers them in order, retrying with an exponential backoff.
+
+    The deliver coroutine is called with the URL, body and content type of each message, it should return True
+    if the message was delivered, False if it was rejected and must not be retried, or raise an exception to retry
+    it later.
+    """
+
+    def __init__(self, directory, deliver, max_size, segment_size, retention, default_retention,
+                 overflow_policy=OverflowPolicy.DROP_OLDEST, retry_interval=1, max_retry_interval=60, sync=False):
+        """
+        :param directory: The directory of the segment and index files
+        :param deliver: A coroutine delivering a spooled message
+        :param max_size: The maximal total size in bytes of the segments
+        :param segment_size: The size in bytes from which a new segment is started
+        :param retention: The number of seconds messages of each type are kept, 0 for not spooling a type
+        :type retention: dict
+        :param default_retention: The retention of message types not in retention, None to keep forever
+        :param overflow_policy: What to do with a new message when the spool is full
+        :param retry_interval: The initial interval in seconds between delivery attempts
+        :param max_retry_interval: The maximal interval in seconds between delivery attempts
+        :param sync: Whether to fsync each spooled message, to keep it also if the machine crashes
+        """
+        self.directory = directory
+        self.deliver = deliver
+        self.max_size = max_size
+        self.segment_size = segment_size
+        self.retention = retention
+        self.default_retention = default_retention
+        self.overflow_policy = overflow_policy
+        self.retry_interval = retry_interval
+        self.max_retry_interval = max_retry_interval
+        self.sync = sync
+
+        self.delivered = 0
+        self.rejected = 0
+        self.expired = 0
+        self.dropped = 0
+        self.corrupted = 0
+        self.last_delivery_lag = None
+        self._draining = False
+        self._closed = False
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        self._open_index()
+        self._load_segments()
+
+    @property
+    def pending(self):
+        return sum(self._pending.itervalues())
+
+    def metrics(self):
+        """
+        The size of the spool and its delivery metrics
+        """
+        try:
+            oldest = self._peek()
+        except CORRUPT_RECORD_ERRORS:
+            oldest = None
+        return dict(size=self._size, segments=len(self._segments), pending=self.pending,
+                    delivered=self.delivered, rejected=self.rejected, expired=self.expired, dropped=self.dropped,
+                    corrupted=self.corrupted, delivery_lag=time.time() - oldest[2] if oldest else 0.0,
+                    last_delivery_lag=self.last_delivery_lag)
+
+    def start(self):
+        if self.pending and not self._draining:
+            self._draining = True
+            IOLoop.current().spawn_callback(self._drain)
+
+    def close(self):
+        self._closed = True
+        self._write_file.close()
+        self._index.close()
+        self._index_file.close()
+
+    def spools(self, message_type):
+        """
+        :return: True if messages of the type are spooled
+        """
+        return self._retention(message_type) != 0
+
+    def append(self, message_type, url, body, content_type):
+        """
+        Spool a message.
+
+        :param body: The encoded body of the message, delivered unchanged
+        :param content_type: The content type of the body
+        :return: True if the message was spooled
+        """
+        if not self.spools(message_type):
+            return False
+        # the header is a single line since JSON escapes line breaks in strings
+        payload = json.dumps(dict(type=message_type, url=url, timestamp=time.time(),
+                                  content_type=content_type)) + '\n' + body
+        record = struct.pack(RECORD_HEADER_FORMAT, len(payload)) + payload
+        while self._size + len(record) > self.max_size:
+            if self.overflow_policy != OverflowPolicy.DROP_OLDEST or not self._drop_oldest_segment():
+                self.dropped += 1
+                return False
+
+        self._write_file.write(record)
+        self._write_file.flush()
+        if self.sync:
+            os.fsync(self._write_file.fileno())
+        self._size += len(record)
+        self._pending[self._segments[-1]] += 1
+        if self._write_file.tell() >= self.segment_size:
+            self._new_segment()
+        self.start()
+        return True
+
+    def _retention(self, message_type):
+        return self.retention.get(message_type, self.default_retention)
+
+    def _segment_path(self, number):
+        return os.path.join(self.directory, SEGMENT_NAME_PATTERN.format(number=number))
+
+    def _open_index(self):
+        path = os.path.join(self.directory, INDEX_NAME)
+        if not os.path.exists(path):
+            with open(path, 'wb') as f:
+                f.write(struct.pack(INDEX_FORMAT, 0, 0))
+        self._index_file = open(path, 'r+b')
+        self._index = mmap.mmap(self._index_file.fileno(), struct.calcsize(INDEX_FORMAT))
+        self._read_segment, self._read_offset = struct.unpack_from(INDEX_FORMAT, self._index)
+
+    def _set_read_position(self, segment, offset):
+        self._read_segment, self._read_offset = segment, offset
+        struct.pack_into(INDEX_FORMAT, self._index, 0, segment, offset)
+
+    def _load_segments(self):
+        self._segments = sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(self.directory)
+                                if name.endswith(SEGMENT_SUFFIX))
+        # segments before the read position were already delivered
+        for number in [number for number in self._segments if number < self._read_segment]:
+            os.remove(self._segment_path(number))
+            self._segments.remove(number)
+        if not self._segments or self._segments[0] != self._read_segment:
+            self._set_read_position(self._segments[0] if self._segments else 0, 0)
+
+        self._pending = {}
+        self._size = 0
+        for number in self._segments:
+            offset = self._read_offset if number == self._read_segment else 0
+            count, end = self._count_records(number, offset)
+            self._pending[number] = count
+            self._size += end
+
+        if self._segments:
+            self._write_file = open(self._segment_path(self._segments[-1]), 'ab')
+        else:
+            self._new_segment()
+
+    def _count_records(self, number, offset):
+        """
+        Count the complete records of a segment from an offset, a partially written record at its end is removed.
+
+        :return: The number of records and the size of the segment
+        """
+        count = 0
+        with open(self._segment_path(number), 'r+b') as f:
+            f.seek(offset)
+            while True:
+                header = f.read(RECORD_HEADER_SIZE)
+                if len(header) < RECORD_HEADER_SIZE:
+                    break
+                length, = struct.unpack(RECORD_HEADER_FORMAT, header)
+                if len(f.read(length)) < length:
+                    break
+                offset = f.tell()
+                count += 1
+            f.truncate(offset)
+        return count, offset
+
+    def _new_segment(self):
+        number = self._segments[-1] + 1 if self._segments else self._read_segment
+        if self._segments:
+            self._write_file.close()
+        self._segments.append(number)
+        self._pending[number] = 0
+        self._write_file = open(self._segment_path(number), 'ab')
+
+    def _remove_segment(self, number):
+        path = self._segment_path(number)
+        self._size -= os.path.getsize(path)
+        os.remove(path)
+        self._segments.remove(number)
+        del self._pending[number]
+
+    def _drop_oldest_segment(self):
+        """
+        :return: True if a segment was dropped
+        """
+        if len(self._segments) == 1:
+            if not self._size:
+                return False
+            self._new_segment()
+        oldest = self._segments[0]
+        self.dropped += self._pending[oldest]
+        app_log.warning("Outbound spool is full, dropping {count} messages".format(count=self._pending[oldest]))
+        self._remove_segment(oldest)
+        self._set_read_position(self._segments[0], 0)
+        return True
+
+    def _peek(self):
+        """
+        Read the next message to deliver.
+
+        :return: The message type, URL, timestamp, body and content type, and the position of the message, or None
+        """
+        while self._pending.get(self._read_segment, 0) == 0:
+            if self._read_segment == self._segments[-1]:
+                return None
+            # all the messages of the segment were delivered
+            self._remove_segment(self._read_segment)
+            self._set_read_position(self._segments[0], 0)
+        with open(self._segment_path(self._read_segment), 'rb') as f:
+            f.seek(self._read_offset)
+            length, = struct.unpack(RECORD_HEADER_FORMAT, f.read(RECORD_HEADER_SIZE))
+            record = f.read(length)
+            end = f.tell()
+        if len(record) < length:
+            raise ValueError("The record's length is beyond the end of the segment")
+        header, _, body = record.partition('\n')
+        header = json.loads(header)
+        if 'content_type' not in header:
+            # spooled before the bodies were kept encoded, the JSON body is in the header
+            body = header['body']
+            header['content_type'] = 'application/json'
+        return (header['type'], header['url'], header['timestamp'], body, header['content_type'],
+                (self._read_segment, self._read_offset, end))
+
+    def _skip_corrupt_record(self):
+        """
+        Skip the record at the read position, or the rest of its segment if the record's length can't be read
+        """
+        segment = self._read_segment
+        path = self._segment_path(segment)
+        end = None
+        with open(path, 'rb') as f:
+            f.seek(self._read_offset)
+            header = f.read(RECORD_HEADER_SIZE)
+            if len(header) == RECORD_HEADER_SIZE:
+                length, = struct.unpack(RECORD_HEADER_FORMAT, header)
+                if self._read_offset + RECORD_HEADER_SIZE + length <= os.path.getsize(path):
+                    end = self._read_offset + RECORD_HEADER_SIZE + length
+        if end is not None:
+            self.corrupted += 1
+            self._pending[segment] -= 1
+            self._set_read_position(segment, end)
+            return
+        self.corrupted += self._pending[segment]
+        self._pending[segment] = 0
+        if segment == self._segments[-1]:
+            # new messages must not be appended after the unreadable part
+            self._new_segment()
+
+    def _advance(self, position):
+        segment, offset, end = position
+        if self._closed or (self._read_segment, self._read_offset) != (segment, offset):
+            # the spool was closed or the message was dropped while it was delivered
+            return
+        self._pending[segment] -= 1
+        self._set_read_position(segment, end)
+
+    @gen.coroutine
+    def _drain(self):
+        retry_interval = self.retry_interval
+        try:
+            while not self._closed:
+                try:
+                    record = self._peek()
+                except CORRUPT_RECORD_ERRORS as e:
+                    app_log.error("Skipping a corrupted spooled message in segment {segment} at offset {offset}: "
+                                  "{error}".format(segment=self._read_segment, offset=self._read_offset, error=e))
+                    self._skip_corrupt_record()
+                    continue
+                if record is None:
+                    break
+                message_type, url, timestamp, body, content_type, position = record
+                retention = self._retention(message_type)
+                if retention is not None and time.time() - timestamp > retention:
+                    self.expired += 1
+                else:
+                    try:
+                        delivered = yield self.deliver(url, body, content_type)
+                    except Exception as e:
+                        app_log.debug("Unable to deliver spooled message: {error}".format(error=e))
+                        yield gen.sleep(retry_interval)
+                        retry_interval = min(retry_interval * 2, self.max_retry_interval)
+                        continue
+                    if delivered:
+                        self.delivered += 1
+                        self.last_delivery_lag = time.time() - timestamp
+                    else:
+                        self.rejected += 1
+                retry_interval = self.retry_interval
+                self._advance(position)
+        finally:
+            self._draining = False
@@ -0,0 +1,154 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Rate limiting and sampling of push messages per origin block and severity.
+"""
+import random
+import time
+
+from manager_exceptions import PushMessageLimitError
+
+RULE_FIELDS = ('origin_block', 'severity', 'rate', 'burst', 'sampling')
+
+
+class TokenBucket(object):
+    def __init__(self, rate, burst, now):
+        self.rate = rate
+        self.burst = burst
+        self._tokens = burst
+        self._time = now
+
+    def consume(self, now):
+        """
+        :return: True if a token was available
+        """
+        self._tokens = min(self.burst, self._tokens + (now - self._time) * self.rate)
+        self._time = now
+        if self._tokens >= 1:
+            self._tokens -= 1
+            return True
+        return False
+
+
+def _check_rule(rule):
+    if not isinstance(rule, dict):
+        raise PushMessageLimitError("A push message limit must be an object")
+    unknown = set(rule) - set(RULE_FIELDS)
+    if unknown:
+        raise PushMessageLimitError("Unknown push message limit fields: {fields}".format(fields=', '.join(unknown)))
+    rate, burst, sampling = rule.get('rate'), rule.get('burst'), rule.get('sampling', 1.0)
+    if rate is not None and (not isinstance(rate, (int, long, float)) or rate < 0):
+        raise PushMessageLimitError("The rate of a push message limit must be a non negative number")
+    if burst is not None and (not isinstance(burst, (int, long, float)) or burst < 1):
+        raise PushMessageLimitError("The burst of a push message limit must be at least 1")
+    if not isinstance(sampling, (int, long, float)) or not 0 <= sampling <= 1:
+        raise PushMessageLimitError("The sampling of a push message limit must be between 0 and 1")
+
+
+def check_limits(limits):
+    """
+    :raises PushMessageLimitError: If the limits are not valid, see PushMessageLimiter.set_limits
+    """
+    if not isinstance(limits, (list, tuple)):
+        raise PushMessageLimitError("Push message limits must be a list")
+    for limit in limits:
+        _check_rule(limit)
+
+
+class PushMessageLimiter(object):
+    """
+    Drops push messages according to a list of limits.
+
+    Each limit may have an origin_block and a severity to match, a missing one matches any value.
+    The first limit matching a message applies to it: a sampling fraction of the messages is kept,
+    and at most rate messages per second, with bursts of up to burst messages, are passed for each
+    origin block and severity. Messages not matching any limit are passed.
+    """
+
+    def __init__(self, limits=(), sample=random.random):
+        """
+        :param limits: The limits, see set_limits
+        :param sample: Returns a random number in [0, 1) for sampling
+        """
+        self.sample = sample
+        self.set_limits(limits)
+
+    def limits(self):
+        return list(self._limits)
+
+    def set_limits(self, limits):
+        """
+        Set the limits, the counters of dropped messages are reset.
+
+        :param limits: A list of dicts with the optional fields origin_block, severity, rate (in messages per second),
+            burst (default to rate, at least 1) and sampling (the fraction of messages kept, default to 1)
+        """
+        check_limits(limits)
+        self._limits = [dict(limit) for limit in limits]
+        self._buckets = {}
+        self._counters = {}
+
+    @property
+    def dropped(self):
+        return sum(counters['rate_limited'] + counters['sampled_out'] for counters in self._counters.itervalues())
+
+    def metrics(self):
+        """
+        The number of passed, rate limited and sampled out messages of each limited origin block and severity
+        """
+        return [dict(origin_block=origin_block, severity=severity, **counters)
+                for (origin_block, severity), counters in sorted(self._counters.iteritems())]
+
+    def filter(self, messages):
+        """
+        :return: The messages that are not dropped
+        """
+        if not self._limits:
+            return messages
+        now = time.time()
+        passed = []
+        for message in messages:
+            origin_block, severity = message.get('origin_block'), message.get('severity')
+            index = self._match(origin_block, severity)
+            if index is None:
+                passed.append(message)
+                continue
+            limit = self._limits[index]
+            try:
+                counters = self._counters[(origin_block, severity)]
+            except KeyError:
+                counters = self._counters[(origin_block, severity)] = dict(passed=0, rate_limited=0, sampled_out=0)
+            except TypeError:
+                # an unhashable origin block or severity, it can't be limited
+                passed.append(message)
+                continue
+            if self.sample() >= limit.get('sampling', 1.0):
+                counters['sampled_out'] += 1
+            elif not self._consume(index, origin_block, severity, now):
+                counters['rate_limited'] += 1
+            else:
+                counters['passed'] += 1
+                passed.append(message)
+        return passed
+
+    def _match(self, origin_block, severity):
+        for index, limit in enumerate(self._limits):
+            if limit.get('origin_block', origin_block) == origin_block and limit.get('severity', severity) == severity:
+                return index
+        return None
+
+    def _consume(self, index, origin_block, severity, now):
+        limit = self._limits[index]
+        if limit.get('rate') is None:
+            return True
+        key = (index, origin_block, severity)
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            burst = limit.get('burst') or max(limit['rate'], 1)
+            bucket = self._buckets[key] = TokenBucket(limit['rate'], burst, now)
+        return bucket.consume(now)
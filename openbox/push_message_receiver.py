@@ -11,58 +11,177 @@ An implementation of an Execution Engine Push Message Receiver.
 import json
 import socket
 import time
+from collections import OrderedDict, deque
 
-from tornado import gen, locks
+from tornado import gen
 from tornado.iostream import IOStream
 from tornado.ioloop import IOLoop
+from tornado.log import app_log
+
+# The maximal number of bytes read from the socket at once
+READ_CHUNK_SIZE = 64 * 1024
+
+
+def decode_json_lines(lines):
+    """
+    Decode a batch of JSON documents, one per line, in a single pass.
+    If the batch can't be decoded, each line is decoded on its own and bad lines are skipped.
+    """
+    try:
+        return json.loads('[' + ','.join(lines) + ']')
+    except ValueError:
+        decoded = []
+        for line in lines:
+            try:
+                decoded.append(json.loads(line))
+            except ValueError:
+                app_log.error("Unable to decode push message: {line}".format(line=line))
+        return decoded
 
 
 class PushMessageHandler(object):
-    def __init__(self, sender, buffer_size=1, buffer_timeout=0):
+    """
+    Buffers push messages and sends them in batches.
+
+    A batch is sent when the buffer holds buffer_size messages or buffer_timeout seconds after
+    a message was buffered, with at most max_in_flight batches sent at the same time.
+    Under load the batch size grows up to max_buffer_size, and shrinks back when batches are sent by timeout.
+    Messages dropped by the limiter are not buffered, and neither are messages arriving when the buffer
+    already holds max_buffer_size messages, those are counted as dropped.
+    """
+
+    def __init__(self, sender, buffer_size=1, buffer_timeout=0, max_buffer_size=None, max_in_flight=1, limiter=None):
         self.sender = sender
         self.buffer_size = buffer_size
         self.buffer_timeout = buffer_timeout
-        self._buffered_messages = []
-        self._buffered_messages_lock = locks.Lock()
+        self.max_buffer_size = max_buffer_size
+        self.max_in_flight = max_in_flight
+        self.limiter = limiter
+        self._buffered_messages = deque()
+        self._in_flight = 0
         self._flush_timer = None
         self._id = 0
+        self.dropped = 0
+        self._overflowing = False
+
+    def metrics(self):
+        """
+        The number of buffered messages, the current batch size, the number of batches being sent
+        and the number of messages dropped since the buffer was full
+        """
+        return dict(buffered=len(self._buffered_messages), batch_size=self._batch_size, in_flight=self._in_flight,
+                    dropped=self.dropped)
 
+    @property
+    def buffer_size(self):
+        return self._buffer_size
+
+    @buffer_size.setter
+    def buffer_size(self, buffer_size):
+        self._buffer_size = buffer_size
+        self._batch_size = buffer_size
 
     @gen.coroutine
     def add(self, message):
-        # after decoding the JSON we get a dict with the message, specific format is different for each type
-        # We need to add an ID and timestamp for the message
-        message = json.loads(message)
-        message['timestamp'] = time.time()
-        message['id'] = self._id
-        self._id += 1
-        with (yield self._buffered_messages_lock.acquire()):
-            self._buffered_messages.append(message)
-            need_to_flush = len(self._buffered_messages) >= self.buffer_size
-            first_message = len(self._buffered_messages) == 1
-        if need_to_flush:
-            yield self._flush_buffer()
-        elif first_message:
-            self._flush_timer = IOLoop.current().call_later(self.buffer_timeout, self._flush_buffer)
+        yield self.add_batch([message])
 
     @gen.coroutine
+    def add_batch(self, messages):
+        # after decoding the JSON we get a dict with each message, specific format is different for each type
+        self.add_messages([message for message in decode_json_lines(messages) if isinstance(message, dict)])
+
+    def add_messages(self, messages):
+        """
+        Buffer already decoded messages.
+        """
+        if self.limiter is not None:
+            messages = self.limiter.filter(messages)
+        if self.max_buffer_size is not None:
+            room = max(self.max_buffer_size - len(self._buffered_messages), 0)
+            if len(messages) > room:
+                if not self._overflowing:
+                    # warn once until the buffer has room again
+                    app_log.warning("Push messages buffer is full, dropping messages")
+                    self._overflowing = True
+                self.dropped += len(messages) - room
+                messages = messages[:room]
+            else:
+                self._overflowing = False
+        # We need to add an ID and timestamp for each message
+        if not messages:
+            return
+        timestamp = time.time()
+        for message in messages:
+            message['timestamp'] = timestamp
+            message['id'] = self._id
+            self._id += 1
+        self._buffered_messages.extend(messages)
+        self._schedule_flush()
+
+    def _schedule_flush(self):
+        if not self._buffered_messages:
+            return
+        if len(self._buffered_messages) >= self._batch_size:
+            if self._in_flight < self.max_in_flight:
+                self._flush_buffer()
+            # otherwise the buffer is flushed when a batch in flight is sent
+        elif self._flush_timer is None:
+            self._flush_timer = IOLoop.current().call_later(self.buffer_timeout, self._flush_by_timeout)
+
+    def _flush_by_timeout(self):
+        self._flush_timer = None
+        if self._in_flight < self.max_in_flight:
+            # the load is low, use smaller batches
+            self._batch_size = max(self._batch_size // 2, self.buffer_size)
+            self._flush_buffer()
+
     def _flush_buffer(self):
-        if self._flush_timer:
+        if self._flush_timer is not None:
             IOLoop.current().remove_timeout(self._flush_timer)
-        with (yield self._buffered_messages_lock.acquire()):
-            messages = self._buffered_messages[:]
-            self._buffered_messages = []
+            self._flush_timer = None
+        if not self._buffered_messages:
+            return
+        if len(self._buffered_messages) <= self._batch_size:
+            # the buffer is swapped, no copying or locking is needed since everything runs in the IOLoop
+            messages, self._buffered_messages = list(self._buffered_messages), deque()
+        else:
+            messages = [self._buffered_messages.popleft() for _ in xrange(self._batch_size)]
+        self._in_flight += 1
+        IOLoop.current().add_future(self.sender(messages), self._batch_sent)
+        # the rest of the messages are sent in the following batches
+        self._schedule_flush()
 
-        yield self.sender(messages)
+    def _batch_sent(self, future):
+        self._in_flight -= 1
+        try:
+            future.result()
+        except Exception as e:
+            app_log.error("Unable to send push messages: {error}".format(error=e))
+        if len(self._buffered_messages) >= self._batch_size:
+            # messages arrived faster than they were sent, use larger batches
+            self._batch_size = max(min(self._batch_size * 2, self.max_buffer_size), self.buffer_size)
+            self._flush_buffer()
+        else:
+            self._schedule_flush()
 
     def close(self):
-        IOLoop.current().remove_timeout(self._flush_timer)
+        if self._flush_timer is not None:
+            IOLoop.current().remove_timeout(self._flush_timer)
+            self._flush_timer = None
 
 
 class PushMessageReceiver(object):
+    """
+    Receives push messages from the engine, one JSON message per line.
+
+    Messages are read in large chunks and decoded together,
+    the handler of each message type is called once per chunk with the contents of all its messages.
+    """
+
     def __init__(self):
         self.connected = False
         self._stream = None
+        self._partial_line = ''
         self.address = None
         self.family = None
         self.delayed_call = None
@@ -111,19 +230,33 @@ class PushMessageReceiver(object):
             self.connect(self.address, self.family)
 
     def _handle_greeting(self, greetings):
-        self._stream.read_until('\n', self._handle_message)
+        self._partial_line = ''
+        self._stream.read_bytes(READ_CHUNK_SIZE, self._handle_chunk, partial=True)
 
-    def _handle_message(self, raw_message):
-        message = json.loads(raw_message.strip())
+    def _handle_chunk(self, chunk):
         try:
-            handler = self._registered_handlers[message['type']]
-            handler(message['content'])
-        except KeyError:
-            pass
+            lines = (self._partial_line + chunk).split('\n')
+            # the last line is incomplete, it is completed by the next chunk
+            self._partial_line = lines.pop()
+            lines = [line for line in (line.strip() for line in lines) if line]
+            if lines:
+                self._handle_messages(decode_json_lines(lines))
         finally:
             # continue getting messages as long as we are connected
             if self.connected:
-                self._stream.read_until('\n', self._handle_message)
+                self._stream.read_bytes(READ_CHUNK_SIZE, self._handle_chunk, partial=True)
+
+    def _handle_messages(self, messages):
+        contents = OrderedDict()
+        for message in messages:
+            try:
+                contents.setdefault(message['type'], []).append(message['content'])
+            except (KeyError, TypeError):
+                pass
+        for message_type, type_contents in contents.iteritems():
+            handler = self._registered_handlers.get(message_type)
+            if handler:
+                handler(type_contents)
 
     def close(self):
         if self._stream:
@@ -134,8 +267,9 @@ class PushMessageReceiver(object):
 if __name__ == "__main__":
     receiver = PushMessageReceiver()
 
-    def log_handler(msg):
-        print msg
+    def log_handler(msgs):
+        for msg in msgs:
+            print msg
 
     receiver.register_message_handler('LOG', log_handler)
     receiver.connect(address=('127.0.0.1', 7001))
@@ -0,0 +1,127 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Coalesces concurrent reads of the same engine handler into a single read.
+"""
+import time
+from tornado.concurrent import Future
+
+
+class ReadCoalescer(object):
+    """
+    Shares a single in-flight engine read among all the concurrent readers of the same handler.
+
+    If a TTL is given, the value of a handler is also served to reads arriving up to TTL seconds
+    after it was read from the engine.
+    """
+
+    def __init__(self, fetch, ttl=0, handlers_ttl=None, etag=None):
+        """
+        :param fetch: A coroutine reading the value of an engine handler, called with the read key's items
+        :param ttl: The default number of seconds a read value is served to later reads, 0 to not keep values
+        :param handlers_ttl: The TTL of specific handlers by their name
+        :type handlers_ttl: dict
+        :param etag: A function computing the ETag of a read value, kept with the value while it's served
+        """
+        self.fetch = fetch
+        self.ttl = ttl
+        self.handlers_ttl = handlers_ttl or {}
+        self.etag = etag
+        self._in_flight = {}
+        self._cache = {}
+        self._generation = 0
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.reads = 0
+        self.engine_reads = 0
+        self.coalesced_reads = 0
+        self.cached_reads = 0
+
+    def hit_ratio(self):
+        """
+        The fraction of reads that didn't cause an engine read
+        """
+        if not self.reads:
+            return 0.0
+        return float(self.coalesced_reads + self.cached_reads) / self.reads
+
+    def stats(self):
+        return dict(reads=self.reads, engine_reads=self.engine_reads, coalesced_reads=self.coalesced_reads,
+                    cached_reads=self.cached_reads, hit_ratio=self.hit_ratio())
+
+    @property
+    def generation(self):
+        """
+        The number of times the read values were invalidated
+        """
+        return self._generation
+
+    def invalidate(self):
+        """
+        Forget all read values, reads started before this call are not shared with later reads.
+        """
+        self._generation += 1
+        self._in_flight.clear()
+        self._cache.clear()
+
+    def _cached(self, key, ttl):
+        """
+        :return: The read time, value and ETag of the key if they are still served, otherwise None
+        """
+        if ttl > 0 and key in self._cache:
+            cached = self._cache[key]
+            if time.time() - cached[0] <= ttl:
+                return cached
+        return None
+
+    def cached_etag(self, key, handler_name=None):
+        """
+        The ETag of the value a read of the key would be served now without reading the engine.
+
+        :return: The ETag, None if the value isn't kept or there's no ETag function
+        """
+        cached = self._cached(key, self.handlers_ttl.get(handler_name, self.ttl))
+        return cached[2] if cached else None
+
+    def read(self, key, handler_name=None):
+        """
+        Read the value of an engine handler.
+
+        :param key: The engine element and handler names
+        :type key: tuple
+        :param handler_name: The name used to find the handler's TTL
+        :rtype: Future
+        """
+        self.reads += 1
+        ttl = self.handlers_ttl.get(handler_name, self.ttl)
+        cached = self._cached(key, ttl)
+        if cached:
+            self.cached_reads += 1
+            future = Future()
+            future.set_result(cached[1])
+            return future
+
+        if key in self._in_flight:
+            self.coalesced_reads += 1
+            return self._in_flight[key]
+
+        self.engine_reads += 1
+        future = self.fetch(*key)
+        self._in_flight[key] = future
+        generation = self._generation
+
+        def _done(_):
+            if self._in_flight.get(key) is future:
+                del self._in_flight[key]
+            if ttl > 0 and generation == self._generation and future.exception() is None:
+                value = future.result()
+                self._cache[key] = (time.time(), value, self.etag(value) if self.etag else None)
+
+        future.add_done_callback(_done)
+        return future
@@ -8,11 +8,20 @@
 """
 Endpoint handlers for the REST server
 """
+import hashlib
+import socket
+
+from tornado import gen, httpclient
 from tornado.log import app_log
-from tornado.web import RequestHandler, HTTPError
-from tornado.escape import json_decode
+from tornado.web import RequestHandler, HTTPError, stream_request_body
+from tornado.escape import json_decode, json_encode
 import config
 from messages import Message, MessageParsingError
+from module_streaming import ModuleContentExtractor, StreamedModule, check_digest_header
+from manager_exceptions import MessageLaneFullError, MessageRouterNotRunningError, CounterHistoryError, \
+    UnsupportedWireFormatError, EngineNotRunningError, ProcessingGraphNotSetError
+import wire_format
+import metrics
 
 
 class BaseRequestHandler(RequestHandler):
@@ -36,14 +45,228 @@ class MessageRequestHandler(BaseRequestHandler):
     def post(self, message_type):
         if config.RestServer.LOG_RECEIVED_MESSAGES:
             app_log.debug("Received message from controller:\n%s" % self.request.body)
-        message_dict = self._decoode_json_body()
+        if not self.request.body:
+            raise HTTPError(400, reason="Received no body content")
         try:
-            message = Message.from_dict(message_dict)
+            message = wire_format.decode(self.request.body,
+                                         wire_format.content_type(self.request.headers.get('Content-Type')))
+        except UnsupportedWireFormatError as e:
+            raise HTTPError(415, reason=e.message)
         except MessageParsingError as e:
             raise HTTPError(500, reason=e.message)
+        self._put_message(message_type, message)
+
+    def _put_message(self, message_type, message):
+        """
+        :return: True if the message was put on the message router
+        """
         if message_type != message.type:
             raise HTTPError(500, reason="Request message type {body_type} "
                                         "doesn't match URL {url_type}".format(body_type=message.type,
                                                                               url_type=message_type))
-        self.manager.message_router.put_message(message)
+        try:
+            self.manager.message_router.put_message(message)
+            return True
+        except MessageLaneFullError as e:
+            # HTTPError can't be used since sending an error clears the headers
+            self.set_status(429, reason="Too Many Requests")
+            self.set_header('Retry-After', e.retry_after)
+            self.finish(e.message)
+        except MessageRouterNotRunningError as e:
+            self.set_status(503, reason="Service Unavailable")
+            self.set_header('Retry-After', config.RestServer.RETRY_AFTER)
+            self.finish(e.message)
+        return False
+
+
+@stream_request_body
+class StreamedModuleRequestHandler(MessageRequestHandler):
+    """
+    Receives an AddCustomModuleRequest while its body arrives.
+
+    The base64 module content of a JSON body is decoded to a file on the way, so a large module is never held in
+    memory. A SHA-256 Digest header, when given, is checked against the body. Other wire formats are buffered.
+    """
+
+    def prepare(self):
+        self.request.connection.set_max_body_size(config.RestServer.MAX_MODULE_MESSAGE_SIZE)
+        self._body_sha256 = hashlib.sha256()
+        self._body_size = 0
+        self._chunks = []
+        self._extractor = None
+        if wire_format.content_type(self.request.headers.get('Content-Type')) == wire_format.JSON:
+            self._extractor = ModuleContentExtractor('module_content', config.RestServer.MODULES_DIRECTORY)
+        self._error = None
+
+    def data_received(self, chunk):
+        self._body_sha256.update(chunk)
+        self._body_size += len(chunk)
+        if self._extractor is None:
+            self._chunks.append(chunk)
+        elif self._error is None:
+            try:
+                self._extractor.feed(chunk)
+            except MessageParsingError as e:
+                # the rest of the body is drained before answering
+                self._error = e
+
+    def post(self, message_type):
+        if self._extractor is None:
+            self.request.body = ''.join(self._chunks)
+            if check_digest_header(self.request.headers.get('Digest'), self._body_sha256):
+                return super(StreamedModuleRequestHandler, self).post(message_type)
+            raise HTTPError(400, reason="The message doesn't match its digest")
+
+        if not self._body_size:
+            self._extractor.discard()
+            raise HTTPError(400, reason="Received no body content")
+        if self._error is not None:
+            raise HTTPError(500, reason=self._error.message)
+        try:
+            obj = self._extractor.finish()
+        except MessageParsingError as e:
+            raise HTTPError(500, reason=e.message)
+        module = obj.get('module_content')
+        put = False
+        try:
+            if not check_digest_header(self.request.headers.get('Digest'), self._body_sha256):
+                raise HTTPError(400, reason="The message doesn't match its digest")
+            try:
+                message = Message.from_dict(obj)
+            except MessageParsingError as e:
+                raise HTTPError(500, reason=e.message)
+            put = self._put_message(message_type, message)
+        finally:
+            if not put and isinstance(module, StreamedModule):
+                module.remove()
+
+    def on_connection_close(self):
+        if self._extractor is not None and not self._finished:
+            self._extractor.discard()
+
+
+class MessageLanesRequestHandler(BaseRequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_encode(self.manager.message_router.metrics()))
+
+
+class MessageSenderRequestHandler(BaseRequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_encode(self.manager.message_sender.metrics()))
+
+
+class OutboundSpoolRequestHandler(BaseRequestHandler):
+    def get(self):
+        spool = self.manager.message_sender.spool
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_encode(spool.metrics() if spool is not None else None))
+
+
+class PushMessagesRequestHandler(BaseRequestHandler):
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_encode(self.manager.push_messages_metrics()))
+
+
+class CounterHistoryRequestHandler(BaseRequestHandler):
+    def get(self, block_id, read_handle):
+        # the whole history by default
+        default_window = config.CounterHistory.INTERVAL * config.CounterHistory.SIZE / 1000.0
+        try:
+            window = float(self.get_query_argument('window', default_window))
+        except ValueError:
+            raise HTTPError(400, reason="Illegal window")
+        try:
+            history = self.manager.counter_history.query(block_id, read_handle, window)
+        except CounterHistoryError as e:
+            raise HTTPError(404, reason=e.message)
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_encode(history))
+
+
+# The GET requests of the local read endpoints are answered with 304 Not Modified when their If-None-Match
+# header matches the ETag of the value, and the values are reused for a while so repeated scrapes are cheap
+
+def json_etag(value):
+    """
+    The ETag of the JSON body of a value, the same as the one computed by the RequestHandler writing it
+    """
+    return '"{digest}"'.format(digest=hashlib.sha1(json_encode(value)).hexdigest())
+
+
+class LocalReadRequestHandler(BaseRequestHandler):
+    """
+    The ETag of a local read is computed from its JSON body. The ETag of a reused value is kept with it,
+    so a matching request is answered without reading the value again.
+    """
+
+    def not_modified(self, etag):
+        """
+        :param etag: The ETag of the reused value, None if the value must be read
+        :return: True if the request was answered with 304 Not Modified
+        """
+        if etag is None:
+            return False
+        self.set_header('Etag', etag)
+        if self.check_etag_header():
+            self.set_status(304)
+            return True
+        self.clear_header('Etag')
+        return False
+
+
+class BlockValueRequestHandler(LocalReadRequestHandler):
+    @gen.coroutine
+    def get(self, block_name, handler_name):
+        if self.not_modified(self.manager.local_block_value_etag(block_name, handler_name)):
+            return
+        try:
+            value = yield self.manager.local_block_value(block_name, handler_name)
+        except EngineNotRunningError:
+            raise HTTPError(503, reason="Engine is not running")
+        except ProcessingGraphNotSetError:
+            raise HTTPError(503, reason="Processing graph is not set")
+        except (KeyError, ValueError) as e:
+            raise HTTPError(404, reason=str(e))
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_encode(value))
+
+
+class GlobalStatsRequestHandler(LocalReadRequestHandler):
+    @gen.coroutine
+    def get(self):
+        if self.not_modified(self.manager.local_global_stats_etag()):
+            return
+        try:
+            stats = yield self.manager.local_global_stats()
+        except (httpclient.HTTPError, socket.error) as e:
+            raise HTTPError(503, reason="Engine runner is unreachable: {error}".format(error=e))
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_encode(stats))
+
+
+class CompiledConfigRequestHandler(BaseRequestHandler):
+    def compute_etag(self):
+        # the config's digest is kept with it, a matching request is answered without encoding it
+        return '"{digest}"'.format(digest=self.manager.compiled_config()[1])
+
+    def get(self):
+        engine_config, digest = self.manager.compiled_config()
+        if engine_config is None:
+            raise HTTPError(404, reason="Processing graph is not set")
+        self.set_etag_header()
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+        self.set_header('Content-Type', 'application/json')
+        self.write(json_encode(dict(config=engine_config, digest=digest)))
+
 
+class MetricsRequestHandler(BaseRequestHandler):
+    @gen.coroutine
+    def get(self):
+        yield self.manager.metrics.collect_engine_metrics()
+        self.set_header('Content-Type', metrics.CONTENT_TYPE)
+        self.write(self.manager.metrics.render())
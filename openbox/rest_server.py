@@ -10,13 +10,27 @@ The REST Server used to get messages
 """
 import config
 from tornado.web import Application
-from request_handlers import (RunnerAlertRequestHandler, MessageRequestHandler)
+from request_handlers import (RunnerAlertRequestHandler, MessageRequestHandler, MessageLanesRequestHandler,
+                              CounterHistoryRequestHandler, MessageSenderRequestHandler,
+                              OutboundSpoolRequestHandler, PushMessagesRequestHandler,
+                              StreamedModuleRequestHandler, BlockValueRequestHandler, GlobalStatsRequestHandler,
+                              CompiledConfigRequestHandler, MetricsRequestHandler)
 
 
 def start(manager):
     application = Application([
         (config.RestServer.Endpoints.RUNNER_ALERT, RunnerAlertRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.MODULE_MESSAGE, StreamedModuleRequestHandler, dict(manager=manager)),
         (config.RestServer.Endpoints.MESSAGE, MessageRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.MESSAGE_LANES, MessageLanesRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.COUNTER_HISTORY, CounterHistoryRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.MESSAGE_SENDER, MessageSenderRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.OUTBOUND_SPOOL, OutboundSpoolRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.PUSH_MESSAGES, PushMessagesRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.BLOCK_VALUE, BlockValueRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.GLOBAL_STATS, GlobalStatsRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.COMPILED_CONFIG, CompiledConfigRequestHandler, dict(manager=manager)),
+        (config.RestServer.Endpoints.METRICS, MetricsRequestHandler, dict(manager=manager)),
 
     ], debug=config.RestServer.DEBUG)
     application.listen(config.RestServer.PORT)
\ No newline at end of file
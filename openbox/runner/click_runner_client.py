@@ -6,29 +6,52 @@
 #####################################################################
 
 import glob
+import hashlib
 import psutil
+import re
+import shutil
 import subprocess
 import os
 import time
 from runner_exceptions import EngineClientError
 
+SHA256_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+FILE_CHUNK_SIZE = 64 * 1024
+
+
+def _file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(FILE_CHUNK_SIZE), ''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
 
 class ClickRunnerClient(object):
     CLICK_BIN = r'/usr/local/bin/click'
     CLICK_PATH = r'/usr/local/lib'
     CHATTER_SOCKET_PATTERN = 'ChatterSocket({proto}, {port}, RETRIES 3, RETRY_WARNINGS false, {keywords});\n'
     CONTROL_SOCKET_PATTERN = 'ControlSocket({proto}, {port}, RETRIES 3, RETRY_WARNINGS false);\n'
-
-    def __init__(self, click_bin=CLICK_BIN, allow_reconfigure=True, click_path=None):
+    # the directory of the module store, relative to the click path
+    MODULES_DIRECTORY = '.modules'
+
+    def __init__(self, click_bin=CLICK_BIN, allow_reconfigure=True, click_path=None, modules_path=None):
+        """
+        :param modules_path: The directory where every version of a package is stored by its SHA-256,
+            MODULES_DIRECTORY in the click path by default
+        """
         self.click_bin = click_bin
         self.allow_reconfigure = allow_reconfigure
         self.click_path = click_path or self.CLICK_PATH
+        self.modules_path = modules_path or os.path.join(self.click_path, self.MODULES_DIRECTORY)
+        self._package_digests = {}
         self.expression = None
         self.control_socket_type = None
         self.control_socket_endpoint = None
         self.push_messages_type = None
         self.push_messages_endpoint = None
         self.push_messages_channel = None
+        self.push_messages_channels = None
         self.nthreads = None
         self._process = None
         self._error_messages = None
@@ -36,11 +59,17 @@ class ClickRunnerClient(object):
         self._startup_time = None
 
     def start(self, processing_graph=None, control_socket_type=None, control_socket_endpoint=None,
-              nthreads=None, push_messages_type=None, push_messages_endpoint=None, push_messages_channel=None):
+              nthreads=None, push_messages_type=None, push_messages_endpoint=None, push_messages_channel=None,
+              push_messages_channels=None):
+        """
+        :param push_messages_channels: The name and endpoint of each ChatterSocket channel, a ChatterSocket
+            is added for each of them instead of the push_messages_endpoint and push_messages_channel one
+        """
         self.expression = processing_graph
         self.control_socket_type = control_socket_type
         self.control_socket_endpoint = control_socket_endpoint
         self.push_messages_channel = push_messages_channel
+        self.push_messages_channels = push_messages_channels
         self.nthreads = nthreads
         if self.control_socket_type and (self.control_socket_type not in ('TCP', 'UNIX') or
                                                  self.control_socket_endpoint is None):
@@ -51,7 +80,8 @@ class ClickRunnerClient(object):
         self.push_messages_type = push_messages_type
         self.push_messages_endpoint = push_messages_endpoint
         if self.push_messages_type and (self.push_messages_type not in ('TCP', 'UNIX') or
-                                                self.push_messages_endpoint is None):
+                                                (self.push_messages_endpoint is None and
+                                                 not self.push_messages_channels)):
             raise ValueError("PushMessage must be of type TCP or UNIX and with a valid endpoint")
         else:
             self._add_chatter_socket_element()
@@ -90,10 +120,82 @@ class ClickRunnerClient(object):
         lib_names = glob.glob(os.path.join(self.click_path, '*.uo'))
         return [os.path.splitext(os.path.basename(lib_name))[0] for lib_name in lib_names]
 
+    def package_path(self, name):
+        return os.path.join(self.click_path, name + '.uo')
+
+    def stored_package_path(self, sha256):
+        return os.path.join(self.modules_path, sha256 + '.uo')
+
+    def package_digest(self, name):
+        """
+        :return: The SHA-256 hex digest of an installed package, None if it isn't installed
+        """
+        if name not in self._package_digests:
+            path = self.package_path(name)
+            if not os.path.exists(path):
+                return None
+            self._package_digests[name] = _file_sha256(path)
+        return self._package_digests[name]
+
     def install_package(self, name, data):
-        lib_name = os.path.join(self.click_path, name + '.uo')
-        with open(lib_name, 'wb') as f:
-            f.write(data)
+        sha256 = hashlib.sha256(data).hexdigest()
+        stored = self.stored_package_path(sha256)
+        if not os.path.exists(stored):
+            self._make_modules_path()
+            temporary = stored + '.tmp'
+            with open(temporary, 'wb') as f:
+                f.write(data)
+            os.rename(temporary, stored)
+        self._link_package(name, sha256)
+
+    def install_package_file(self, name, path, sha256=None):
+        """
+        Install a package written to a file, it's moved to the store unless the store already has it.
+
+        :param sha256: The SHA-256 hex digest of the file if it's known
+        """
+        sha256 = sha256 or _file_sha256(path)
+        stored = self.stored_package_path(sha256)
+        if os.path.exists(stored):
+            os.remove(path)
+        else:
+            self._make_modules_path()
+            shutil.move(path, stored)
+        self._link_package(name, sha256)
+
+    def install_stored_package(self, name, sha256):
+        """
+        Install a package from the store by its SHA-256 hex digest.
+
+        :return: True if the package is installed, False if the store doesn't have it
+        """
+        if not SHA256_PATTERN.match(sha256 or ''):
+            raise EngineClientError("Invalid SHA-256 digest: {sha256}".format(sha256=sha256))
+        if not os.path.exists(self.stored_package_path(sha256)):
+            return False
+        self._link_package(name, sha256)
+        return True
+
+    def _make_modules_path(self):
+        if not os.path.isdir(self.modules_path):
+            os.makedirs(self.modules_path)
+
+    def _link_package(self, name, sha256):
+        """
+        Install a stored package under its name, replacing an installed version atomically
+        """
+        if self.package_digest(name) == sha256:
+            return
+        temporary = os.path.join(self.click_path, '.{name}.{sha256}.tmp'.format(name=name, sha256=sha256))
+        if os.path.exists(temporary):
+            os.remove(temporary)
+        try:
+            os.link(self.stored_package_path(sha256), temporary)
+        except OSError:
+            # the store is on another file system
+            shutil.copyfile(self.stored_package_path(sha256), temporary)
+        os.rename(temporary, self.package_path(name))
+        self._package_digests[name] = sha256
 
     def _run(self):
         cmd = self._build_run_command()
@@ -212,7 +314,13 @@ class ClickRunnerClient(object):
 
     def _add_chatter_socket_element(self):
         if self.expression and 'ChatterSocket' not in self.expression:
-            if self.push_messages_channel:
+            if self.push_messages_channels:
+                chatter_socket = ''.join(self.CHATTER_SOCKET_PATTERN.format(proto=self.push_messages_type,
+                                                                            port=channel['endpoint'],
+                                                                            keywords="CHANNEL {channel}".format(
+                                                                                channel=channel['name']))
+                                         for channel in self.push_messages_channels)
+            elif self.push_messages_channel:
                 chatter_socket = self.CHATTER_SOCKET_PATTERN.format(proto=self.push_messages_type,
                                                                     port=self.push_messages_endpoint,
                                                                     keywords="CHANNEL {channel}".format(
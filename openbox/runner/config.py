@@ -16,10 +16,13 @@ ENGINES = {'click': (ClickRunnerClient, dict(click_bin=r'/usr/local/bin/click',
 
 class RestServer:
     ENGINE_START_PARAMETERS = ('processing_graph', 'control_socket_type', 'control_socket_endpoint', 'nthreads',
-                               'push_messages_type', 'push_messages_endpoint', 'push_messages_channel')
+                               'push_messages_type', 'push_messages_endpoint', 'push_messages_channel',
+                               'push_messages_channels')
     PORT = 9001
     DEBUG = True
     CLIENT_RUN_POLLING_INTERVAL = 500  # Milliseconds
+    # the maximal size of a package streamed to INSTALL_STREAM
+    MAX_PACKAGE_SIZE = 1024 * 1024 * 1024  # Bytes
 
     class Endpoints:
         ENGINES = '/runner/engines'
@@ -32,5 +35,7 @@ class RestServer:
         CPU = '/runner/cpu'
         UPTIME = '/runner/uptime'
         INSTALL = '/runner/install_package'
+        INSTALL_STREAM = '/runner/install_package/(.+)'
+        INSTALL_STORED = '/runner/install_stored_package/(.+)'
         REGISTER_ALERT_URL = '/runner/register_alert_url'
 
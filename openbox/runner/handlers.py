@@ -5,6 +5,11 @@
 # The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
 #####################################################################
 
+import base64
+import hashlib
+import os
+import tempfile
+
 import tornado.web
 import tornado.escape
 import config
@@ -154,6 +159,67 @@ class InstallPackageRequestHandler(BaseRunnerRequestHandler):
             raise tornado.web.HTTPError(400, reason=e.message)
 
 
+@tornado.web.stream_request_body
+class StreamedInstallPackageRequestHandler(BaseRunnerRequestHandler):
+    """
+    Installs a package streamed as the raw request body.
+
+    The package is written to a temporary file next to the installed packages while it arrives,
+    and is moved in place only if it matches the SHA-256 of the request's Digest header.
+    """
+
+    def prepare(self):
+        self._file = None
+        self.request.connection.set_max_body_size(config.RestServer.MAX_PACKAGE_SIZE)
+        name = self.path_args[0]
+        if name != os.path.basename(name) or name in ('.', '..'):
+            raise tornado.web.HTTPError(400, reason="Invalid package name: %s" % name)
+        directory = os.path.dirname(self._engine().package_path(name))
+        self._file = tempfile.NamedTemporaryFile(dir=directory, prefix='.' + name + '-', delete=False)
+        self._sha256 = hashlib.sha256()
+
+    def data_received(self, chunk):
+        self._file.write(chunk)
+        self._sha256.update(chunk)
+
+    def post(self, name):
+        self._file.close()
+        if not self._digest_matches(self.request.headers.get('Digest')):
+            raise tornado.web.HTTPError(400, reason="The package doesn't match its digest")
+        try:
+            self._engine().install_package_file(name, self._file.name, self._sha256.hexdigest())
+        except EngineClientError as e:
+            raise tornado.web.HTTPError(400, reason=e.message)
+
+    def _digest_matches(self, header):
+        for digest in (header or '').split(','):
+            algorithm, _, value = digest.strip().partition('=')
+            if algorithm.upper() == 'SHA-256':
+                return value == base64.b64encode(self._sha256.digest())
+        return True
+
+    def _remove_file(self):
+        if self._file is not None:
+            self._file.close()
+            if os.path.exists(self._file.name):
+                os.remove(self._file.name)
+
+    def on_finish(self):
+        self._remove_file()
+
+    def on_connection_close(self):
+        self._remove_file()
+
+
+class StoredPackageRequestHandler(BaseRunnerRequestHandler):
+    def post(self, name):
+        sha256 = self._decode_json_body()
+        try:
+            self._write(self._engine().install_stored_package(name, sha256))
+        except EngineClientError as e:
+            raise tornado.web.HTTPError(400, reason=e.message)
+
+
 class RegisterAlertUrlRequestHandler(BaseRunnerRequestHandler):
     def post(self, *args, **kwargs):
         body = self.request.body
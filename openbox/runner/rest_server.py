@@ -13,7 +13,8 @@ from tornado.escape import json_encode
 
 from handlers import (EnginesRequestHandler, StartRequestHandler, StopRequestHandler, SuspendRequestHandler,
                       ResumeRequestHandler, RunningRequestHandler, MemoryRequestHandler, CpuRequestHandler,
-                      RegisterAlertUrlRequestHandler, InstallPackageRequestHandler, UptimeRequestHandler)
+                      RegisterAlertUrlRequestHandler, InstallPackageRequestHandler, UptimeRequestHandler,
+                      StreamedInstallPackageRequestHandler, StoredPackageRequestHandler)
 from config import RestServer, ENGINES
 
 
@@ -61,6 +62,8 @@ def run(port, debug=False):
         (RestServer.Endpoints.CPU, CpuRequestHandler, dict(runner=server_runner)),
         (RestServer.Endpoints.UPTIME, UptimeRequestHandler, dict(runner=server_runner)),
         (RestServer.Endpoints.INSTALL, InstallPackageRequestHandler, dict(runner=server_runner)),
+        (RestServer.Endpoints.INSTALL_STREAM, StreamedInstallPackageRequestHandler, dict(runner=server_runner)),
+        (RestServer.Endpoints.INSTALL_STORED, StoredPackageRequestHandler, dict(runner=server_runner)),
         (RestServer.Endpoints.REGISTER_ALERT_URL, RegisterAlertUrlRequestHandler, dict(runner=server_runner)),
     ], debug=debug)
     sched = tornado.ioloop.PeriodicCallback(server_runner.alert_engine_is_not_running,
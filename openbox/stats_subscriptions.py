@@ -0,0 +1,163 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Periodic sampling of block handlers and global stats for the controller's subscriptions.
+"""
+import itertools
+import math
+import time
+from collections import OrderedDict
+
+from tornado import gen
+from tornado.ioloop import PeriodicCallback
+from tornado.log import app_log
+
+from manager_exceptions import BadSubscriptionError, UnknownSubscriptionError, EngineNotRunningError, \
+    ProcessingGraphNotSetError
+
+
+class _Subscription(object):
+    def __init__(self, subscription_id, reads, global_stats, ticks, next_tick):
+        self.subscription_id = subscription_id
+        self.reads = reads
+        self.global_stats = global_stats
+        self.ticks = ticks
+        # the tick the subscription is due on
+        self.next_tick = next_tick
+        # the last pushed result and error of each read
+        self.last = {}
+
+
+class StatsSubscriptions(object):
+    """
+    Samples the block handlers and global stats of each subscription and pushes
+    the values that changed since the previous push of the subscription.
+
+    All subscriptions are sampled on a common tick: the handlers of every subscription due
+    on a tick are read once, in a single engine sequence, and share the same timestamp.
+    Ticks passing while a sample is in flight are not sampled, the subscriptions that became due meanwhile
+    are sampled as soon as it ends.
+    """
+
+    def __init__(self, read_block_values, get_global_stats, send_stats, tick):
+        """
+        :param read_block_values: A coroutine reading a list of block handlers
+        :param get_global_stats: A coroutine returning the global stats
+        :param send_stats: A coroutine pushing the samples of a subscription,
+                           called with the subscription ID, timestamp, samples and global stats
+        :param tick: The interval in milliseconds between sampling ticks
+        """
+        self.read_block_values = read_block_values
+        self.get_global_stats = get_global_stats
+        self.send_stats = send_stats
+        self.tick = tick
+        self._subscriptions = OrderedDict()
+        self._ids = itertools.count(1)
+        self._ticks = 0
+        self._sampling = False
+        self._periodic_callback = None
+
+    def subscribe(self, reads, global_stats, interval):
+        """
+        Add a subscription.
+
+        :param reads: The block_id and read_handle of each sampled handler
+        :param global_stats: Whether to sample the global stats
+        :param interval: The interval in milliseconds between samples, rounded up to a multiple of the tick
+        :return: The subscription ID
+        """
+        reads = reads or []
+        if not reads and not global_stats:
+            raise BadSubscriptionError("A subscription must sample block handlers or global stats")
+        if not isinstance(interval, (int, long, float)) or interval <= 0:
+            raise BadSubscriptionError("Illegal subscription interval: {interval}".format(interval=interval))
+        if not isinstance(reads, (list, tuple)):
+            raise BadSubscriptionError("The subscribed reads must be a list")
+        for read in reads:
+            if not isinstance(read, dict) or not isinstance(read.get('block_id'), basestring) or \
+                    not isinstance(read.get('read_handle'), basestring):
+                raise BadSubscriptionError("Each subscribed read must have a string block_id and read_handle")
+        subscription_id = next(self._ids)
+        ticks = max(1, int(math.ceil(float(interval) / self.tick)))
+        self._subscriptions[subscription_id] = _Subscription(subscription_id, reads, global_stats, ticks,
+                                                             self._ticks + ticks)
+        if self._periodic_callback is None:
+            self._periodic_callback = PeriodicCallback(self._sample, self.tick)
+            self._periodic_callback.start()
+        return subscription_id
+
+    def unsubscribe(self, subscription_id):
+        try:
+            del self._subscriptions[subscription_id]
+        except KeyError:
+            raise UnknownSubscriptionError("Unknown subscription: {id}".format(id=subscription_id))
+        if not self._subscriptions:
+            self.stop()
+
+    def stop(self):
+        if self._periodic_callback is not None:
+            self._periodic_callback.stop()
+            self._periodic_callback = None
+
+    @gen.coroutine
+    def _sample(self):
+        self._ticks += 1
+        if self._sampling:
+            # the sample in flight samples the subscriptions due on this tick when it ends
+            return
+
+        self._sampling = True
+        try:
+            while True:
+                due = [subscription for subscription in self._subscriptions.itervalues()
+                       if subscription.next_tick <= self._ticks]
+                if not due:
+                    break
+                for subscription in due:
+                    subscription.next_tick = self._ticks + subscription.ticks
+                try:
+                    yield self._sample_subscriptions(due)
+                except (EngineNotRunningError, ProcessingGraphNotSetError):
+                    # the subscriptions are sampled again once the engine runs a processing graph
+                    pass
+                except Exception as e:
+                    app_log.error("Unable to sample subscriptions: {error}".format(error=e))
+        finally:
+            self._sampling = False
+
+    @gen.coroutine
+    def _sample_subscriptions(self, subscriptions):
+        # handlers shared by several subscriptions are read once
+        reads = OrderedDict()
+        for subscription in subscriptions:
+            for read in subscription.reads:
+                reads[(read['block_id'], read['read_handle'])] = None
+        timestamp = time.time()
+        results = []
+        if reads:
+            results = yield self.read_block_values([dict(block_id=block_id, read_handle=read_handle)
+                                                    for block_id, read_handle in reads])
+        global_stats = None
+        if any(subscription.global_stats for subscription in subscriptions):
+            global_stats = yield self.get_global_stats()
+        results = dict(((result['block_id'], result['read_handle']), result) for result in results)
+
+        sends = []
+        for subscription in subscriptions:
+            samples = []
+            for read in subscription.reads:
+                key = (read['block_id'], read['read_handle'])
+                result = results[key]
+                value = (result['result'], result['error'])
+                if subscription.last.get(key) != value:
+                    subscription.last[key] = value
+                    samples.append(result)
+            subscription_stats = global_stats if subscription.global_stats else None
+            if samples or subscription_stats:
+                sends.append(self.send_stats(subscription.subscription_id, timestamp, samples, subscription_stats))
+        yield sends
@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+The wire formats of the messages between OBC and OBSI, selected by the Content-Type of a request.
+
+JSON is always supported. MessagePack is supported when the msgpack package is installed,
+the packets of push messages are carried in it as raw bytes instead of hex strings.
+"""
+import binascii
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+from messages import Message, MessageParsingError, json_loads
+from manager_exceptions import UnsupportedWireFormatError
+
+JSON = 'application/json'
+MSGPACK = 'application/x-msgpack'
+
+# other names of the MessagePack content type
+MSGPACK_ALIASES = ('application/msgpack', 'application/vnd.msgpack')
+# a request of a binary content type that isn't supported is rejected instead of being read as JSON
+BINARY_CONTENT_TYPES = (MSGPACK, 'application/octet-stream', 'application/x-protobuf', 'application/cbor')
+
+# the fields of push message entries holding hex dumps of packets
+PACKET_FIELDS = ('packet', 'packets')
+
+
+def supported_formats():
+    return [JSON, MSGPACK] if msgpack is not None else [JSON]
+
+
+def check_format(wire_format):
+    if wire_format not in supported_formats():
+        raise UnsupportedWireFormatError("Unsupported wire format {format}, supported formats are: {formats}".format(
+            format=wire_format, formats=', '.join(supported_formats())))
+
+
+def content_type(header):
+    """
+    The wire format of a Content-Type header.
+
+    Controllers sending JSON don't always set its Content-Type, so anything but a binary content type is read as JSON.
+    """
+    wire_format = (header or JSON).split(';')[0].strip().lower()
+    if wire_format in MSGPACK_ALIASES:
+        return MSGPACK
+    return wire_format if wire_format in BINARY_CONTENT_TYPES else JSON
+
+
+def _packet_bytes(packet):
+    try:
+        return binascii.unhexlify(packet.replace(' ', ''))
+    except (AttributeError, TypeError):
+        # not a hex dump
+        return packet
+
+
+def _packets_to_bytes(entry):
+    if not isinstance(entry, dict) or not any(field in entry for field in PACKET_FIELDS):
+        return entry
+    entry = dict(entry)
+    if 'packet' in entry:
+        entry['packet'] = _packet_bytes(entry['packet'])
+    if isinstance(entry.get('packets'), list):
+        entry['packets'] = [_packet_bytes(packet) for packet in entry['packets']]
+    return entry
+
+
+def _to_msgpack_dict(message):
+    obj = message.to_dict()
+    obj['type'] = message.type
+    if isinstance(obj.get('messages'), list):
+        obj['messages'] = [_packets_to_bytes(entry) for entry in obj['messages']]
+    return obj
+
+
+def encode(message, wire_format):
+    """
+    :return: The body of a message in a wire format
+    """
+    if wire_format == JSON:
+        return message.to_json()
+    check_format(wire_format)
+    return msgpack.packb(_to_msgpack_dict(message), use_bin_type=True)
+
+
+def encode_many(messages, wire_format):
+    """
+    :return: The body of a list of messages in a wire format
+    """
+    if wire_format == JSON:
+        return '[{messages}]'.format(messages=','.join(message.to_json() for message in messages))
+    check_format(wire_format)
+    return msgpack.packb([_to_msgpack_dict(message) for message in messages], use_bin_type=True)
+
+
+def decode(body, wire_format):
+    """
+    :return: The message in a body of a wire format
+    :raise UnsupportedWireFormatError: If the wire format is not supported
+    :raise MessageParsingError: If the body is not a valid message
+    """
+    check_format(wire_format)
+    try:
+        if wire_format == JSON:
+            obj = json_loads(body)
+        else:
+            obj = msgpack.unpackb(body, raw=False)
+    except ValueError as e:
+        # the errors of msgpack are also ValueErrors
+        raise MessageParsingError("Invalid message body: {error}".format(error=e))
+    if not isinstance(obj, dict):
+        raise MessageParsingError("A message must be an object")
+    return Message.from_dict(obj)
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Measures the encoding and decoding of every message type.
+
+The generic codec is the one before the precompiled encoders and decoders: a dict built over __slots__ and
+json.dumps for encoding, json.loads and the constructor's keyword arguments for decoding.
+
+Run from the openbox directory:
+    PYTHONPATH=. python ../tests/benchmark_messages.py [iterations]
+"""
+import json
+import sys
+import timeit
+
+import messages
+from messages import Message
+
+
+def _generic_to_json(message):
+    obj_dict = dict((field, getattr(message, field)) for field in message.__slots__)
+    obj_dict['type'] = message.__class__.__name__
+    return json.dumps(obj_dict)
+
+
+def _generic_from_json(raw_data):
+    obj = json.loads(raw_data)
+    clazz = Message.messages_registry[obj.pop('type')]
+    return clazz(**obj)
+
+
+def _sample(clazz):
+    values = dict(block_id='from_device', read_handle='count', result='12345', dpid=1,
+                  messages=[dict(origin_block='alert', message='Alert', severity=3, packet='45 00 00 3c')])
+    return clazz(**dict((field, values.get(field, field)) for field in clazz.__slots__ if field != 'xid'))
+
+
+def _measure(function, argument, iterations):
+    return min(timeit.repeat(lambda: function(argument), number=iterations, repeat=3)) / iterations * 1e6
+
+
+def main(iterations):
+    print "JSON backend: {backend}".format(backend=messages.json_dumps.__module__ or 'json')
+    print "{name:<28} {old:>10} {new:>10} {old_decode:>10} {new_decode:>10}  (microseconds)".format(
+        name='message', old='encode', new='compiled', old_decode='decode', new_decode='compiled')
+    totals = [0.0] * 4
+    for name, clazz in sorted(Message.messages_registry.iteritems()):
+        message = _sample(clazz)
+        raw_data = message.to_json()
+        times = [_measure(_generic_to_json, message, iterations),
+                 _measure(lambda m: m.to_json(), message, iterations),
+                 _measure(_generic_from_json, raw_data, iterations),
+                 _measure(Message.from_json, raw_data, iterations)]
+        totals = [total + time for total, time in zip(totals, times)]
+        print "{name:<28} {0:>10.2f} {1:>10.2f} {2:>10.2f} {3:>10.2f}".format(*times, name=name)
+    print "{name:<28} {0:>10.2f} {1:>10.2f} {2:>10.2f} {3:>10.2f}".format(*totals, name='total')
+    print "Encoding {encode:.1f}x, decoding {decode:.1f}x faster".format(encode=totals[0] / totals[1],
+                                                                       decode=totals[2] / totals[3])
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+"""
+Measures the rate of push messages ingestion, from the engine's socket to the handlers' buffers.
+
+The per line receiver is the receiver before bulk reading: a read, a callback and two JSON decodings per message.
+
+Run from the openbox directory:
+    PYTHONPATH=. python ../tests/benchmark_push_message_receiver.py [messages]
+"""
+import json
+import socket
+import sys
+import time
+
+from tornado import gen, locks
+from tornado.ioloop import IOLoop
+from tornado.tcpserver import TCPServer
+from tornado.testing import bind_unused_port
+
+from push_message_receiver import PushMessageReceiver, PushMessageHandler
+
+BUFFER_SIZE = 1000
+
+
+class _Engine(TCPServer):
+    def __init__(self, data):
+        super(_Engine, self).__init__()
+        self.data = data
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        yield stream.write('Click::ControlSocket/1.3\n')
+        yield stream.write(self.data)
+
+
+class _PerLineReceiver(PushMessageReceiver):
+    def _handle_greeting(self, greetings):
+        self._stream.read_until('\n', self._handle_line)
+
+    def _handle_line(self, raw_message):
+        message = json.loads(raw_message.strip())
+        handler = self._registered_handlers.get(message['type'])
+        if handler:
+            handler(message['content'])
+        if self.connected:
+            self._stream.read_until('\n', self._handle_line)
+
+
+class _PerLineHandler(PushMessageHandler):
+    def __init__(self, *args, **kwargs):
+        super(_PerLineHandler, self).__init__(*args, **kwargs)
+        self._lock = locks.Lock()
+        self._list = []
+
+    @gen.coroutine
+    def add(self, message):
+        message = json.loads(message)
+        message['timestamp'] = time.time()
+        message['id'] = self._id
+        self._id += 1
+        with (yield self._lock.acquire()):
+            self._list.append(message)
+            need_to_flush = len(self._list) >= self.buffer_size
+        if need_to_flush:
+            with (yield self._lock.acquire()):
+                messages = self._list[:]
+                self._list = []
+            yield self.sender(messages)
+
+
+def _alerts(count):
+    content = json.dumps(dict(origin_block='alert', message='Alert raised by a suspicious packet', severity=3,
+                              packet='45 00 00 3c 1c 46 40 00 40 06 b1 e6 ac 10 00 01 ac 10 00 02'))
+    line = json.dumps(dict(type='ALERT', content=content)) + '\n'
+    return line * count
+
+
+@gen.coroutine
+def _measure(receiver, handler_class, handler_method, data, count):
+    @gen.coroutine
+    def sender(messages):
+        pass
+
+    server_socket, port = bind_unused_port()
+    engine = _Engine(data)
+    engine.add_socket(server_socket)
+    handler = handler_class(sender, buffer_size=BUFFER_SIZE, buffer_timeout=60)
+    receiver.register_message_handler('ALERT', getattr(handler, handler_method))
+    start = time.time()
+    receiver.connect(('127.0.0.1', port), socket.AF_INET)
+    # each message gets an ID when it is added to the handler's buffer
+    while handler._id < count:
+        yield gen.sleep(0.001)
+    elapsed = time.time() - start
+    receiver.close()
+    engine.stop()
+    raise gen.Return(count / elapsed)
+
+
+@gen.coroutine
+def main(count):
+    data = _alerts(count)
+    before = yield _measure(_PerLineReceiver(), _PerLineHandler, 'add', data, count)
+    after = yield _measure(PushMessageReceiver(), PushMessageHandler, 'add_batch', data, count)
+    print "Per line receiver: {rate:,.0f} messages/second".format(rate=before)
+    print "Bulk receiver:     {rate:,.0f} messages/second ({speedup:.1f}x)".format(rate=after, speedup=after / before)
+
+
+if __name__ == '__main__':
+    messages_count = int(sys.argv[1]) if len(sys.argv) > 1 else 100 * BUFFER_SIZE
+    IOLoop.current().run_sync(lambda: main(messages_count))
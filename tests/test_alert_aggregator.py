@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import json
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+from alert_aggregator import AlertAggregator
+from push_message_limiter import PushMessageLimiter
+
+
+def _alert(message, severity=1, packet='00'):
+    return json.dumps(dict(origin_block='alert', message=message, severity=severity, packet=packet))
+
+
+class TestAlertAggregator(AsyncTestCase):
+    def setUp(self):
+        super(TestAlertAggregator, self).setUp()
+        self.emitted = []
+
+    def test_no_window(self):
+        aggregator = AlertAggregator(self.emitted.extend, 0, 3)
+        aggregator.add_batch([_alert('a'), _alert('a')])
+        self.assertEqual(len(self.emitted), 2)
+        self.assertNotIn('count', self.emitted[0])
+
+    def test_aggregation(self):
+        aggregator = AlertAggregator(self.emitted.extend, 10, 2)
+        aggregator.add_batch([_alert('a', packet='01'), _alert('b'), _alert('a', packet='02')])
+        aggregator.add_batch([_alert('a', packet='03'), _alert('a', severity=2)])
+        self.assertEqual(self.emitted, [])
+        aggregator.flush()
+        self.assertEqual([(alert['message'], alert['severity'], alert['count']) for alert in self.emitted],
+                         [('a', 1, 3), ('b', 1, 1), ('a', 2, 1)])
+        self.assertEqual(self.emitted[0]['packets'], ['01', '02'])
+        self.assertEqual(self.emitted[0]['packet'], '01')
+        self.assertLessEqual(self.emitted[0]['first_timestamp'], self.emitted[0]['last_timestamp'])
+        self.assertEqual((aggregator.received, aggregator.emitted), (5, 3))
+
+    @gen_test
+    def test_window(self):
+        aggregator = AlertAggregator(self.emitted.extend, 0.01, 2)
+        aggregator.add_batch([_alert('a'), _alert('a')])
+        yield gen.sleep(0.05)
+        self.assertEqual([alert['count'] for alert in self.emitted], [2])
+        aggregator.add_batch([_alert('a')])
+        yield gen.sleep(0.05)
+        self.assertEqual([alert['count'] for alert in self.emitted], [2, 1])
+
+    def test_limited_before_aggregation(self):
+        limiter = PushMessageLimiter([dict(rate=0, burst=2)])
+        aggregator = AlertAggregator(self.emitted.extend, 10, 2, limiter)
+        aggregator.add_batch([_alert('a') for _ in xrange(5)])
+        aggregator.flush()
+        self.assertEqual([alert['count'] for alert in self.emitted], [2])
+        self.assertEqual(limiter.dropped, 3)
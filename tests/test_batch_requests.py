@@ -0,0 +1,61 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+import config
+from manager import Manager
+
+
+class TestBatchRequests(AsyncTestCase):
+    def setUp(self):
+        super(TestBatchRequests, self).setUp()
+        spool_enabled, config.OutboundSpool.ENABLED = config.OutboundSpool.ENABLED, False
+        self.manager = Manager()
+        config.OutboundSpool.ENABLED = spool_enabled
+        processing_graph = dict(requirements=['openbox'],
+                                blocks=[
+                                    dict(name='from_device', type='FromDevice', config=dict(devname='eth0')),
+                                    dict(name='discard', type='Discard', config={}),
+                                ],
+                                connections=[
+                                    dict(src='from_device', dst='discard', src_port=0, dst_port=0),
+                                ])
+        config_builder = self.manager.config_builder
+        self.manager._engine_config_builder = config_builder.engine_config_builder_from_dict(processing_graph)
+        self.manager._engine_running = True
+        self.manager._processing_graph_set = True
+        self.operations = []
+        self.manager._run_engine_operations = self._run_engine_operations
+
+    @gen.coroutine
+    def _run_engine_operations(self, operations):
+        self.operations.append(operations)
+        raise gen.Return({'from_device@_@counter.count': '10', 'from_device@_@counter.byte_count': False,
+                          'from_device@_@counter.reset_counts': 200})
+
+    @gen_test
+    def test_batch_read(self):
+        results = yield self.manager.read_block_values([dict(block_id='from_device', read_handle='count'),
+                                                        dict(block_id='from_device', read_handle='byte_count'),
+                                                        dict(block_id='missing', read_handle='count')])
+        self.assertEqual(len(self.operations), 1)
+        self.assertEqual([operation['handler_name'] for operation in self.operations[0]], ['count', 'byte_count'])
+        self.assertEqual(results[0], dict(block_id='from_device', read_handle='count', result=10, error=None))
+        self.assertIsNone(results[1]['result'])
+        self.assertIn('failed reading', results[1]['error'])
+        self.assertEqual(results[2]['error'], 'Unknown block named: missing')
+
+    @gen_test
+    def test_batch_write(self):
+        results = yield self.manager.write_block_values([dict(block_id='from_device', write_handle='reset_counts',
+                                                              value=''),
+                                                         dict(block_id='from_device', write_handle='unknown')])
+        self.assertEqual(self.operations[0], [dict(type='WRITE', element_name='from_device@_@counter',
+                                                   handler_name='reset_counts', params='')])
+        self.assertIsNone(results[0]['error'])
+        self.assertEqual(results[1]['error'], 'Unknown handler name: unknown')
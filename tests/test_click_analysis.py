@@ -0,0 +1,79 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import unittest
+from configuration_builder import ConfigurationBuilder
+from configuration_builder.click_configuration_builder import ClickConfigurationBuilder
+from configuration_builder.click_analysis import analyze, element_weight, ELEMENT_WEIGHTS
+from configuration_builder.click_configuration import ClickConfiguration
+from configuration_builder.click_elements import Element
+from configuration_builder.connection import Connection
+from manager import Manager
+from manager_exceptions import BadProcessingGraphBudgetError
+
+
+class TestAnalyze(unittest.TestCase):
+    def setUp(self):
+        self.elements = [Element.from_dict(dict(name='from_device', type='FromDevice', config=dict(devname='eth0'))),
+                         Element.from_dict(dict(name='classifier', type='Classifier',
+                                                config=dict(pattern=['12/0800', '-']))),
+                         Element.from_dict(dict(name='regex', type='RegexMatcher',
+                                                config=dict(pattern=['ab', 'cde']))),
+                         Element.from_dict(dict(name='discard', type='Discard', config={}))]
+        self.connections = [Connection('from_device', 'classifier', 0, 0),
+                            Connection('classifier', 'regex', 0, 0),
+                            Connection('classifier', 'discard', 1, 0),
+                            Connection('regex', 'discard', 0, 0),
+                            Connection('regex', 'discard', 1, 0)]
+        self.click_config = ClickConfiguration(['openbox'], self.elements, self.connections)
+
+    def test_counts(self):
+        cost = analyze(self.click_config)
+        self.assertEqual(cost['elements'], 4)
+        self.assertEqual(cost['longest_path'], 4)
+        self.assertEqual(cost['classifier_patterns'], 2)
+        self.assertEqual(cost['regex_patterns'], 2)
+        self.assertEqual(cost['regex_patterns_size'], 5)
+
+    def test_packet_cost_of_heaviest_path(self):
+        cost = analyze(self.click_config)
+        self.assertEqual(cost['packet_cost'], sum(element_weight(element) for element in self.elements))
+        self.assertEqual(element_weight(self.elements[1]), ELEMENT_WEIGHTS['Classifier'] + 2)
+
+    def test_cycles_are_ignored(self):
+        self.connections.append(Connection('regex', 'classifier', 2, 0))
+        cost = analyze(ClickConfiguration(['openbox'], self.elements, self.connections))
+        self.assertEqual(cost['longest_path'], 4)
+
+    def test_long_chain(self):
+        elements = [Element.from_dict(dict(name='from_device', type='FromDevice', config=dict(devname='eth0')))]
+        connections = []
+        for i in xrange(5000):
+            elements.append(Element.from_dict(dict(name='queue%d' % i, type='Queue', config={})))
+            connections.append(Connection(elements[-2].name, elements[-1].name, 0, 0))
+        cost = analyze(ClickConfiguration(['openbox'], elements, connections))
+        self.assertEqual(cost['longest_path'], 5001)
+
+    def test_builder_analysis(self):
+        config = dict(requirements=['openbox'],
+                      blocks=[dict(name='from_device', type='FromDevice', config=dict(devname='eth0')),
+                              dict(name='discard', type='Discard', config={})],
+                      connections=[dict(src='from_device', dst='discard', src_port=0, dst_port=0)])
+        builder = ConfigurationBuilder(ClickConfigurationBuilder).engine_config_builder_from_dict(config)
+        self.assertEqual(builder.analyze()['elements'], 4)
+        self.assertEqual(builder.analyze()['longest_path'], 4)
+
+
+class TestProcessingGraphBudgetParameter(unittest.TestCase):
+    def test_valid(self):
+        Manager._check_processing_graph_budget_parameter({})
+        Manager._check_processing_graph_budget_parameter(dict(elements=100, packet_cost=12.5, longest_path=None))
+
+    def test_invalid(self):
+        for budget in ([1], 'elements', dict(nodes=1), dict(elements='100'), dict(elements=-1),
+                       dict(elements=True)):
+            self.assertRaises(BadProcessingGraphBudgetError, Manager._check_processing_graph_budget_parameter, budget)
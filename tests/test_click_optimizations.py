@@ -0,0 +1,189 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import unittest
+from configuration_builder import ConfigurationBuilder
+from configuration_builder.click_configuration_builder import ClickConfigurationBuilder
+from configuration_builder.connection import Connection
+
+
+def _types(click_config):
+    return [element.__class__.__name__ for element in click_config.elements]
+
+
+class TestShareMatchers(unittest.TestCase):
+    def setUp(self):
+        self.config = dict(requirements=['openbox'],
+                           blocks=[
+                               dict(name='from_device', type='FromDevice', config=dict(devname='eth0')),
+                               dict(name='hc', type='HeaderClassifier',
+                                    config=dict(match=[dict(IPV4_PROTO='6'), dict(IPV4_PROTO='17'), {}])),
+                               dict(name='sc1', type='StringClassifier', config=dict(pattern=['evil', 'bad'])),
+                               dict(name='sc2', type='StringClassifier', config=dict(pattern=['evil', 'bad'])),
+                               dict(name='sc3', type='StringClassifier', config=dict(pattern=['other'])),
+                               dict(name='rc1', type='RegexClassifier', config=dict(pattern=['evil'])),
+                               dict(name='rc2', type='RegexClassifier', config=dict(pattern=['evil'])),
+                               dict(name='discard', type='Discard', config={}),
+                           ],
+                           connections=[
+                               dict(src='from_device', dst='hc', src_port=0, dst_port=0),
+                               dict(src='hc', dst='sc1', src_port=0, dst_port=0),
+                               dict(src='hc', dst='sc2', src_port=1, dst_port=0),
+                               dict(src='hc', dst='rc1', src_port=2, dst_port=0),
+                               dict(src='sc1', dst='sc3', src_port=0, dst_port=0),
+                               dict(src='sc1', dst='rc2', src_port=1, dst_port=0),
+                               dict(src='sc1', dst='discard', src_port=2, dst_port=0),
+                               dict(src='sc2', dst='discard', src_port=0, dst_port=0),
+                               dict(src='sc2', dst='discard', src_port=1, dst_port=0),
+                               dict(src='sc2', dst='discard', src_port=2, dst_port=0),
+                               dict(src='sc3', dst='discard', src_port=0, dst_port=0),
+                               dict(src='sc3', dst='discard', src_port=1, dst_port=0),
+                               dict(src='rc1', dst='discard', src_port=0, dst_port=0),
+                               dict(src='rc2', dst='discard', src_port=0, dst_port=0),
+                           ])
+        self.builder = ConfigurationBuilder(ClickConfigurationBuilder).engine_config_builder_from_dict(self.config)
+        self.click_config = self.builder.click_config
+
+    def test_single_shared_element(self):
+        # sc1 and sc2 share an element and so do rc1 and rc2
+        self.assertEqual(_types(self.click_config).count('StringClassifier'), 2)
+        self.assertEqual(_types(self.click_config).count('RegexClassifier'), 1)
+        self.assertEqual(_types(self.click_config).count('Paint'), 4)
+        self.assertEqual(_types(self.click_config).count('PaintSwitch'), 4)
+
+    def test_dispatch_to_original_destinations(self):
+        connections = self.click_config.connections
+        shared = 'openbox_shared@_@stringclassifier_0'
+        self.assertIn(Connection('sc1@_@string_classifier_paint', shared, 0, 0), connections)
+        self.assertIn(Connection('sc2@_@string_classifier_paint', shared, 0, 0), connections)
+        self.assertIn(Connection(shared, shared + '_dispatch_0', 0, 0), connections)
+        self.assertIn(Connection(shared + '_dispatch_0', 'sc1@_@counter', 0, 0), connections)
+        self.assertIn(Connection(shared + '_dispatch_0', 'sc2@_@counter', 1, 0), connections)
+        self.assertIn(Connection(shared + '_dispatch_2', 'sc2@_@counter', 1, 2), connections)
+
+    def test_read_handler_of_shared_element(self):
+        element, handler, _ = self.builder.translate_block_read_handler('sc2', 'count')
+        self.assertEqual(element, 'sc2@_@counter')
+
+    def test_regex_elements_shared(self):
+        config = dict(requirements=['openbox'],
+                      blocks=[dict(name='from_device', type='FromDevice', config=dict(devname='eth0')),
+                              dict(name='hc', type='HeaderClassifier',
+                                   config=dict(match=[dict(IPV4_PROTO='6'), dict(IPV4_PROTO='17'), {}])),
+                              dict(name='rc1', type='RegexClassifier', config=dict(pattern=['abc', 'def'])),
+                              dict(name='rc2', type='RegexClassifier', config=dict(pattern=['abc', 'def'])),
+                              dict(name='rm1', type='RegexMatcher', config=dict(pattern=['abc'])),
+                              dict(name='rm2', type='RegexMatcher', config=dict(pattern=['abc'])),
+                              dict(name='discard', type='Discard', config={})],
+                      connections=[dict(src='from_device', dst='hc', src_port=0, dst_port=0),
+                                   dict(src='hc', dst='rc1', src_port=0, dst_port=0),
+                                   dict(src='hc', dst='rc2', src_port=1, dst_port=0),
+                                   dict(src='hc', dst='discard', src_port=2, dst_port=0),
+                                   dict(src='rc1', dst='rm1', src_port=0, dst_port=0),
+                                   dict(src='rc1', dst='discard', src_port=1, dst_port=0),
+                                   dict(src='rc2', dst='rm2', src_port=0, dst_port=0),
+                                   dict(src='rc2', dst='discard', src_port=1, dst_port=0),
+                                   dict(src='rm1', dst='discard', src_port=0, dst_port=0),
+                                   dict(src='rm1', dst='discard', src_port=1, dst_port=0),
+                                   dict(src='rm2', dst='discard', src_port=0, dst_port=0),
+                                   dict(src='rm2', dst='discard', src_port=1, dst_port=0)])
+        builder = ConfigurationBuilder(ClickConfigurationBuilder).engine_config_builder_from_dict(config)
+        # a single automaton for each pair of blocks
+        self.assertEqual(_types(builder.click_config).count('RegexClassifier'), 1)
+        self.assertEqual(_types(builder.click_config).count('RegexMatcher'), 1)
+        element, handler, _ = builder.translate_block_read_handler('rc2', 'payload_only')
+        self.assertEqual(element, 'openbox_shared@_@regexclassifier_0')
+
+        # only the handlers of the shared element can't be written
+        self.assertRaises(ValueError, builder.translate_block_write_handler, 'rc1', 'payload_only')
+        self.assertRaises(ValueError, builder.translate_block_write_handler, 'rm2', 'match_all')
+        element, handler, _ = builder.translate_block_write_handler('rc1', 'reset_counts')
+        self.assertEqual(element, 'rc1@_@counter')
+
+
+class TestGraphOptimizations(unittest.TestCase):
+    def setUp(self):
+        self.config = dict(requirements=['openbox'],
+                           blocks=[
+                               dict(name='from_device', type='FromDevice', config=dict(devname='eth0')),
+                               dict(name='hc1', type='HeaderClassifier',
+                                    config=dict(match=[dict(ETH_TYPE='0x0800'),
+                                                       dict(ETH_TYPE='0x0800', IPV4_PROTO='6'),
+                                                       {}],
+                                                allow_vlan=False)),
+                               dict(name='hc2', type='HeaderClassifier',
+                                    config=dict(match=[dict(IPV4_PROTO='6'), dict(IPV4_PROTO='17')],
+                                                allow_vlan=False)),
+                               dict(name='all', type='HeaderClassifier', config=dict(match=[{}])),
+                               dict(name='dead', type='Discard', config={}),
+                               dict(name='discard', type='Discard', config={}),
+                           ],
+                           connections=[
+                               dict(src='from_device', dst='hc1', src_port=0, dst_port=0),
+                               dict(src='hc1', dst='hc2', src_port=0, dst_port=0),
+                               dict(src='hc1', dst='dead', src_port=1, dst_port=0),
+                               dict(src='hc1', dst='all', src_port=2, dst_port=0),
+                               dict(src='all', dst='discard', src_port=0, dst_port=0),
+                               dict(src='hc2', dst='discard', src_port=0, dst_port=0),
+                               dict(src='hc2', dst='discard', src_port=1, dst_port=0),
+                           ])
+
+    def _builder(self):
+        return ConfigurationBuilder(ClickConfigurationBuilder).engine_config_builder_from_dict(self.config)
+
+    def test_dead_elements_removed(self):
+        builder = self._builder()
+        names = [element.name for element in builder.click_config.elements]
+        self.assertNotIn('dead@_@discard', names)
+        self.assertIn(Connection('hc1@_@counter', 'openbox_optimized@_@idle', 1, 0), builder.click_config.connections)
+        self.assertRaises(ValueError, builder.translate_block_read_handler, 'dead', 'count')
+
+    def test_pass_through_collapsed(self):
+        builder = self._builder()
+        self.assertEqual(builder.removed_elements(), {'dead@_@discard': None, 'all@_@classifier': None,
+                                                      'hc2@_@classifier': 'hc1@_@classifier'})
+        self.assertIn(Connection('hc1@_@counter', 'all@_@counter', 2, 0), builder.click_config.connections)
+        element, _, _ = builder.translate_block_read_handler('all', 'count')
+        self.assertEqual(element, 'all@_@counter')
+
+    def test_counters_kept(self):
+        self.assertEqual(_types(self._builder().click_config).count('MultiCounter'), 3)
+
+    def test_classifiers_fused(self):
+        builder = self._builder()
+        classifiers = [element for element in builder.click_config.elements if element.name == 'hc1@_@classifier']
+        self.assertEqual(_types(builder.click_config).count('Classifier'), 1)
+        # the third pattern keeps packets rejected by hc2 from reaching the match all rule of hc1
+        self.assertEqual(classifiers[0].pattern, ['12/0800 23/06', '12/0800 23/11', '12/0800', '-'])
+        connections = builder.click_config.connections
+        # hc1's counter still counts every packet of its first rule, on ports of its own
+        self.assertIn(Connection('hc1@_@classifier', 'hc1@_@counter', 1, 3), connections)
+        self.assertIn(Connection('hc1@_@counter', 'hc2@_@counter', 3, 1), connections)
+        self.assertIn(Connection('hc1@_@classifier', 'hc1@_@counter', 2, 4), connections)
+        self.assertIn(Connection('hc1@_@counter', 'hc1@_@counter_discard', 4, 0), connections)
+
+    def test_fused_counter_read(self):
+        builder = self._builder()
+        element, handler, transform_function = builder.translate_block_read_handler('hc1', 'count')
+        self.assertEqual((element, handler), ('hc1@_@counter', 'count'))
+        self.assertEqual(transform_function('[1,0,2,3,4]'), '[8,0,2]')
+        self.assertEqual(transform_function('<error>'), '<error>')
+        element, handler, transform_function = builder.translate_block_read_handler('hc2', 'count')
+        self.assertEqual(transform_function('[1,2]'), '[1,2]')
+
+    def test_removed_counters_read_zero(self):
+        # hc2 is only fed by a rule of hc1 that can never match
+        self.config['blocks'][1]['config']['match'] = [{}, dict(ETH_TYPE='0x0800'), dict(IPV4_PROTO='6')]
+        self.config['connections'][1] = dict(src='hc1', dst='hc2', src_port=1, dst_port=0)
+        self.config['connections'][2] = dict(src='hc1', dst='dead', src_port=0, dst_port=0)
+        builder = self._builder()
+        self.assertIn('hc2@_@counter', builder.removed_elements())
+        element, handler, transform_function = builder.translate_block_read_handler('hc2', 'count')
+        self.assertIsNone(element)
+        self.assertEqual(handler, 'count')
+        self.assertEqual(transform_function(None), '[0,0]')
+        self.assertRaises(ValueError, builder.translate_block_write_handler, 'hc2', 'reset_counts')
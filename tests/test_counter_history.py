@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import unittest
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+import config
+import counter_history
+from counter_history import RingBuffer, CounterHistory, counter_value
+from manager import Manager
+from manager_exceptions import CounterHistoryError, PushMessageLimitError
+
+
+class TestRingBuffer(unittest.TestCase):
+    def test_overwrite_oldest(self):
+        buffer = RingBuffer(3)
+        for i in xrange(5):
+            buffer.append(i, i * 10)
+        self.assertEqual(len(buffer), 3)
+        self.assertEqual(buffer.since(0), [(2, 20), (3, 30), (4, 40)])
+        self.assertEqual(buffer.since(3.5), [(4, 40)])
+
+
+class _Clock(object):
+    def __init__(self, now):
+        self.now = now
+
+    def time(self):
+        return self.now
+
+
+class TestCounterValue(unittest.TestCase):
+    def test_values(self):
+        self.assertEqual(counter_value('[1,2,3]'), 6)
+        self.assertEqual(counter_value('[]'), 0)
+        self.assertEqual(counter_value('17'), 17)
+        self.assertEqual(counter_value(2.5), 2.5)
+        for value in ('<error>', '[1,', None, True, '[1,"a"]'):
+            self.assertRaises(ValueError, counter_value, value)
+
+
+class TestCounterHistorySampling(AsyncTestCase):
+    def setUp(self):
+        super(TestCounterHistorySampling, self).setUp()
+        spool_enabled, config.OutboundSpool.ENABLED = config.OutboundSpool.ENABLED, False
+        self.manager = Manager()
+        config.OutboundSpool.ENABLED = spool_enabled
+        processing_graph = dict(requirements=['openbox'],
+                                blocks=[
+                                    dict(name='from_device', type='FromDevice', config=dict(devname='eth0')),
+                                    dict(name='hc', type='HeaderClassifier',
+                                         config=dict(match=[dict(IPV4_PROTO='6'), {}])),
+                                    dict(name='discard', type='Discard', config={}),
+                                ],
+                                connections=[
+                                    dict(src='from_device', dst='hc', src_port=0, dst_port=0),
+                                    dict(src='hc', dst='discard', src_port=0, dst_port=0),
+                                    dict(src='hc', dst='discard', src_port=1, dst_port=0),
+                                ])
+        config_builder = self.manager.config_builder
+        self.manager._engine_config_builder = config_builder.engine_config_builder_from_dict(processing_graph)
+        self.manager._engine_running = True
+        self.manager._processing_graph_set = True
+        self.manager._run_engine_operations = self._run_engine_operations
+        self.history = self.manager.counter_history
+        self.history.set_handlers([dict(block_id='hc', read_handle='count')])
+        self.clock = _Clock(1000.0)
+        self.time, counter_history.time = counter_history.time, self.clock
+        self.value = None
+
+    def tearDown(self):
+        counter_history.time = self.time
+        self.history.stop()
+        super(TestCounterHistorySampling, self).tearDown()
+
+    @gen.coroutine
+    def _run_engine_operations(self, operations):
+        raise gen.Return({'hc@_@counter.count': self.value})
+
+    @gen_test
+    def test_multi_counter_sampled(self):
+        # the engine's MultiCounter formats the count of each port
+        for value in ('[0,0]', '[10,10]', '[20,20]', '<error>', '[5,0]', '[15,10]'):
+            self.clock.now += 1
+            self.value = value
+            yield self.history._sample()
+        result = self.history.query('hc', 'count', 10)
+        self.assertEqual(result['samples'], 5)
+        self.assertEqual(result['last'], 25)
+        self.assertEqual(result['value'], dict(min=0, max=40, avg=18, p99=40))
+        # the counter reset between the third and fourth samples, the failed read has no sample
+        self.assertEqual(result['rate'], dict(min=20, max=20, avg=20, p99=20))
+
+    @gen_test
+    def test_rejected_handlers_not_applied(self):
+        handlers = config.CounterHistory.HANDLERS
+        with self.assertRaises(CounterHistoryError):
+            yield self.manager.set_parameters(dict(counter_history_handlers=[dict(block_id='hc')]))
+        self.assertEqual(config.CounterHistory.HANDLERS, handlers)
+        self.assertEqual(self.history.handlers(), [dict(block_id='hc', read_handle='count')])
+
+    @gen_test
+    def test_rejected_limits_not_applied(self):
+        with self.assertRaises(PushMessageLimitError):
+            yield self.manager.set_parameters(dict(counter_history_handlers=[],
+                                                   alert_messages_limits=[dict(rate=-1)]))
+        self.assertEqual(self.history.handlers(), [dict(block_id='hc', read_handle='count')])
+
+
+class TestCounterHistory(unittest.TestCase):
+    def setUp(self):
+        self.history = CounterHistory(None, size=100, interval=1000, max_handlers=2)
+        self.history.set_handlers([dict(block_id='b', read_handle='count')])
+
+    def tearDown(self):
+        self.history.stop()
+
+    def test_empty_window(self):
+        self.assertEqual(self.history.query('b', 'count', 10), dict(samples=0, last=None, value=None, rate=None))
+
+    def test_bounded_handlers(self):
+        self.assertRaises(CounterHistoryError, self.history.set_handlers,
+                          [dict(block_id=str(i), read_handle='count') for i in xrange(3)])
+        self.assertRaises(CounterHistoryError, self.history.query, 'other', 'count', 10)
+
+    def test_history_kept_for_remaining_handlers(self):
+        buffer = self.history._buffers[('b', 'count')]
+        self.history.set_handlers([dict(block_id='b', read_handle='count'), dict(block_id='b', read_handle='rate')])
+        self.assertIs(self.history._buffers[('b', 'count')], buffer)
+        self.assertEqual(self.history.handlers(), [dict(block_id='b', read_handle='count'),
+                                                   dict(block_id='b', read_handle='rate')])
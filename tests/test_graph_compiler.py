@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import copy
+import os
+import threading
+import time
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+from configuration_builder import ConfigurationBuilder
+from configuration_builder.click_configuration_builder import ClickConfigurationBuilder
+from graph_compiler import GraphCompiler
+from manager_exceptions import GraphCompilationError, GraphCompilationCancelledError
+
+PROCESSING_GRAPH = dict(requirements=['openbox'],
+                        blocks=[
+                            dict(name='from_device', type='FromDevice', config=dict(devname='eth0')),
+                            dict(name='hc', type='HeaderClassifier',
+                                 config=dict(match=[dict(TCP_DST='80'), dict(TCP_DST='80'), {}])),
+                            dict(name='hpc', type='HeaderPayloadClassifier',
+                                 config=dict(match=[dict(type='HeaderPayloadMatch',
+                                                         header_match=dict(TCP_DST='80'),
+                                                         payload_match=[dict(type='PayloadPattern',
+                                                                             pattern='evil')])])),
+                            dict(name='discard', type='Discard', config={}),
+                        ],
+                        connections=[
+                            dict(src='from_device', dst='hc', src_port=0, dst_port=0),
+                            dict(src='hc', dst='hpc', src_port=0, dst_port=0),
+                            dict(src='hc', dst='discard', src_port=1, dst_port=0),
+                            dict(src='hc', dst='discard', src_port=2, dst_port=0),
+                            dict(src='hpc', dst='discard', src_port=0, dst_port=0),
+                        ])
+
+
+class _UnpicklableError(Exception):
+    def __init__(self):
+        super(_UnpicklableError, self).__init__("unpicklable")
+        self.lock = threading.Lock()
+
+
+class _DyingBuilder(ClickConfigurationBuilder):
+    @classmethod
+    def compile_block(cls, block_config, custom_modules=None):
+        os._exit(1)
+
+
+class _SlowBuilder(ClickConfigurationBuilder):
+    @classmethod
+    def compile_block(cls, block_config, custom_modules=None):
+        time.sleep(60)
+
+
+class _UnpicklableErrorBuilder(ClickConfigurationBuilder):
+    @classmethod
+    def compile_block(cls, block_config, custom_modules=None):
+        raise _UnpicklableError()
+
+
+class _UnpicklableResultBuilder(ClickConfigurationBuilder):
+    @classmethod
+    def compile_block(cls, block_config, custom_modules=None):
+        return threading.Lock()
+
+
+class TestGraphCompiler(AsyncTestCase):
+    def setUp(self):
+        super(TestGraphCompiler, self).setUp()
+        self.config_builder = ConfigurationBuilder(ClickConfigurationBuilder)
+        self.compiler = GraphCompiler(self.config_builder, processes=2, timeout=30)
+        self.compiler.start()
+
+    def tearDown(self):
+        self.compiler.stop()
+        super(TestGraphCompiler, self).tearDown()
+
+    @gen_test(timeout=30)
+    def test_same_as_inline_compilation(self):
+        builder = yield self.compiler.compile(copy.deepcopy(PROCESSING_GRAPH))
+        expected = self.config_builder.engine_config_builder_from_dict(copy.deepcopy(PROCESSING_GRAPH))
+        self.assertEqual(builder.to_engine_config(), expected.to_engine_config())
+        self.assertEqual(builder.removed_rules(), expected.removed_rules())
+
+    @gen_test(timeout=30)
+    def test_block_error(self):
+        graph = copy.deepcopy(PROCESSING_GRAPH)
+        graph['blocks'][1]['config'] = {}
+        with self.assertRaises(ValueError):
+            yield self.compiler.compile(graph)
+
+    def _failing_compiler(self, engine_builder):
+        self.compiler.stop()
+        self.compiler = GraphCompiler(ConfigurationBuilder(engine_builder), processes=2, timeout=None)
+        self.compiler.start()
+
+    @gen_test(timeout=30)
+    def test_worker_died(self):
+        self._failing_compiler(_DyingBuilder)
+        with self.assertRaises(GraphCompilationError):
+            yield self.compiler.compile(copy.deepcopy(PROCESSING_GRAPH))
+
+    @gen_test(timeout=30)
+    def test_unpicklable_error(self):
+        self._failing_compiler(_UnpicklableErrorBuilder)
+        with self.assertRaisesRegexp(GraphCompilationError, 'unpicklable'):
+            yield self.compiler.compile(copy.deepcopy(PROCESSING_GRAPH))
+
+    @gen_test(timeout=30)
+    def test_unpicklable_result(self):
+        self._failing_compiler(_UnpicklableResultBuilder)
+        with self.assertRaises(GraphCompilationError):
+            yield self.compiler.compile(copy.deepcopy(PROCESSING_GRAPH))
+
+    @gen_test(timeout=30)
+    def test_cancelled_by_newer_graph(self):
+        self._failing_compiler(_SlowBuilder)
+        first = self.compiler.compile(copy.deepcopy(PROCESSING_GRAPH))
+        yield gen.sleep(0.1)
+        self.compiler.cancel(GraphCompilationCancelledError("newer graph"))
+        with self.assertRaises(GraphCompilationCancelledError):
+            yield first
+        # the workers running the cancelled compilation were replaced
+        self.compiler.config_builder = self.config_builder
+        builder = yield self.compiler.compile(copy.deepcopy(PROCESSING_GRAPH))
+        self.assertIsNotNone(builder)
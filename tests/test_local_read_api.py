@@ -0,0 +1,107 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import json
+import socket
+from tornado import gen
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+import config
+from manager import Manager
+from request_handlers import BlockValueRequestHandler, GlobalStatsRequestHandler, CompiledConfigRequestHandler, \
+    json_etag
+
+
+class TestLocalReadApi(AsyncHTTPTestCase):
+    def get_app(self):
+        spool_enabled, config.OutboundSpool.ENABLED = config.OutboundSpool.ENABLED, False
+        self.manager = Manager()
+        config.OutboundSpool.ENABLED = spool_enabled
+        processing_graph = dict(requirements=['openbox'],
+                                blocks=[dict(name='from_device', type='FromDevice', config=dict(devname='eth0'))],
+                                connections=[])
+        config_builder = self.manager.config_builder
+        self.manager._engine_config_builder = config_builder.engine_config_builder_from_dict(processing_graph)
+        self.manager._engine_running = True
+        self.manager._processing_graph_set = True
+        self.engine_reads = []
+        self.engine_value = '10'
+        self.manager._read_coalescer.fetch = self._read_engine_handler
+        return Application([
+            (config.RestServer.Endpoints.BLOCK_VALUE, BlockValueRequestHandler, dict(manager=self.manager)),
+            (config.RestServer.Endpoints.GLOBAL_STATS, GlobalStatsRequestHandler, dict(manager=self.manager)),
+            (config.RestServer.Endpoints.COMPILED_CONFIG, CompiledConfigRequestHandler, dict(manager=self.manager)),
+        ])
+
+    @gen.coroutine
+    def _read_engine_handler(self, element, handler):
+        self.engine_reads.append((element, handler))
+        raise gen.Return(self.engine_value)
+
+    def test_block_value_not_modified(self):
+        response = self.fetch('/obsi/block/from_device/count')
+        self.assertEqual(response.code, 200)
+        self.assertEqual(json.loads(response.body), 10)
+        response = self.fetch('/obsi/block/from_device/count', headers={'If-None-Match': response.headers['Etag']})
+        self.assertEqual(response.code, 304)
+        self.assertEqual(self.engine_reads, [('from_device@_@counter', 'count')])
+
+    def test_block_value_errors(self):
+        self.assertEqual(self.fetch('/obsi/block/missing/count').code, 404)
+        self.manager._processing_graph_set = False
+        self.assertEqual(self.fetch('/obsi/block/from_device/count').code, 503)
+
+    def test_compiled_config(self):
+        self.assertEqual(self.fetch('/obsi/compiled_config').code, 404)
+        self.manager._compiled_config, self.manager._compiled_config_digest = 'Discard;', 'abc'
+        response = self.fetch('/obsi/compiled_config')
+        self.assertEqual(json.loads(response.body), dict(config='Discard;', digest='abc'))
+        self.assertEqual(response.headers['Etag'], '"abc"')
+        response = self.fetch('/obsi/compiled_config', headers={'If-None-Match': '"abc"'})
+        self.assertEqual(response.code, 304)
+
+    def test_global_stats(self):
+        calls = []
+
+        @gen.coroutine
+        def get_engine_global_stats():
+            calls.append(None)
+            raise gen.Return(dict(uptime=1))
+
+        self.manager._local_global_stats.fetch = get_engine_global_stats
+        first = self.fetch('/obsi/global_stats')
+        self.assertEqual(json.loads(first.body), dict(uptime=1))
+        self.assertEqual(self.fetch('/obsi/global_stats', headers={'If-None-Match': first.headers['Etag']}).code,
+                         304)
+        self.assertEqual(len(calls), 1)
+
+    def test_not_modified_without_reading(self):
+        self.manager._local_reads.ttl = 3600
+        response = self.fetch('/obsi/block/from_device/count')
+        headers = {'If-None-Match': response.headers['Etag']}
+        self.assertEqual(response.headers['Etag'], json_etag(10))
+        self.assertEqual(self.fetch('/obsi/block/from_device/count', headers=headers).code, 304)
+        self.assertEqual(len(self.engine_reads), 1)
+        # once the value isn't reused it's read again, the same value is still not modified
+        self.manager._invalidate_reads()
+        self.assertEqual(self.fetch('/obsi/block/from_device/count', headers=headers).code, 304)
+        self.assertEqual(len(self.engine_reads), 2)
+        # the ETag follows the value
+        self.manager._invalidate_reads()
+        self.engine_value = '20'
+        response = self.fetch('/obsi/block/from_device/count', headers=headers)
+        self.assertEqual(response.code, 200)
+        self.assertEqual(response.headers['Etag'], json_etag(20))
+        self.assertEqual(len(self.engine_reads), 3)
+
+    def test_global_stats_runner_unreachable(self):
+        @gen.coroutine
+        def get_engine_global_stats():
+            raise socket.error("Connection refused")
+
+        self.manager._local_global_stats.fetch = get_engine_global_stats
+        self.assertEqual(self.fetch('/obsi/global_stats').code, 503)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import json
+import os
+import shutil
+import socket
+import tempfile
+from tornado import gen
+from tornado.iostream import StreamClosedError
+from tornado.tcpserver import TCPServer
+from tornado.testing import AsyncTestCase, gen_test, bind_unused_port
+from manager_exceptions import LogSinkError
+import log_sinks
+
+
+def _log(message, severity=3):
+    return dict(origin_block='log', severity=severity, message=message, timestamp=0, id=1)
+
+
+class _Collector(TCPServer):
+    def __init__(self):
+        super(_Collector, self).__init__()
+        self.lines = []
+
+    @gen.coroutine
+    def handle_stream(self, stream, address):
+        try:
+            while True:
+                line = yield stream.read_until('\n')
+                self.lines.append(json.loads(line))
+        except StreamClosedError:
+            pass
+
+
+class TestLogSinks(AsyncTestCase):
+    def test_syslog_format(self):
+        line = log_sinks.format_syslog_message(_log(u'bad "packet"', severity=2), 'my host', 'obsi', 7)
+        header, text = line.split(' \xef\xbb\xbf')
+        self.assertEqual(text, 'bad "packet"')
+        self.assertTrue(header.startswith('<130>1 1970-01-01T00:00:00Z myhost obsi '))
+        self.assertTrue(header.endswith(' log [obsi@32473 origin_dpid="7" origin_block="log" id="1"]'))
+
+    @gen_test
+    def test_syslog_udp(self):
+        collector = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        collector.bind(('127.0.0.1', 0))
+        collector.settimeout(1)
+        sink = log_sinks.SyslogUdpSink('127.0.0.1', collector.getsockname()[1], 1, 'host')
+        yield sink.send([_log('a'), _log('b')])
+        self.assertTrue(collector.recv(2048).endswith('a'))
+        self.assertTrue(collector.recv(2048).endswith('b'))
+        sink.close()
+        collector.close()
+
+    @gen_test
+    def test_ndjson_tcp(self):
+        server_socket, port = bind_unused_port()
+        collector = _Collector()
+        collector.add_socket(server_socket)
+        sink = log_sinks.NdjsonTcpSink('127.0.0.1', port, 1)
+        yield sink.send([_log('a'), _log('b')])
+        yield sink.send([_log('c')])
+        yield gen.sleep(0.05)
+        self.assertEqual([line['message'] for line in collector.lines], ['a', 'b', 'c'])
+        self.assertEqual(collector.lines[0]['origin_dpid'], 1)
+        sink.close()
+        collector.stop()
+
+    @gen_test
+    def test_rotating_file(self):
+        directory = tempfile.mkdtemp()
+        try:
+            path = os.path.join(directory, 'obsi.log')
+            sink = log_sinks.RotatingFileSink(path, 1, max_bytes=150, backup_count=1)
+            for message in ('a', 'b', 'c'):
+                written = yield sink.send([_log(message)])
+                self.assertTrue(written)
+            yield sink.close()
+            with open(path) as f:
+                self.assertEqual([json.loads(line)['message'] for line in f], ['c'])
+            with open(path + '.1') as f:
+                self.assertEqual([json.loads(line)['message'] for line in f], ['b'])
+            self.assertFalse(os.path.exists(path + '.2'))
+        finally:
+            shutil.rmtree(directory)
+
+    def test_check_sink(self):
+        log_sinks.check_sink(None)
+        log_sinks.check_sink(dict(type='file', path='/tmp/obsi.log'))
+        for sink in (dict(type='unknown'), dict(type='syslog', address='127.0.0.1'),
+                     dict(type='ndjson', address='127.0.0.1', port=1, unknown=1), 'syslog'):
+            self.assertRaises(LogSinkError, log_sinks.check_sink, sink)
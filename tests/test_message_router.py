@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+from tornado import gen, locks
+from tornado.testing import AsyncTestCase, gen_test
+import config
+import messages
+from message_router import MessageRouter
+from manager_exceptions import MessageLaneFullError
+
+
+class FakeSender(object):
+    def __init__(self):
+        self.sent = []
+
+    @gen.coroutine
+    def send_message_ignore_response(self, message):
+        self.sent.append(message)
+        raise gen.Return(True)
+
+
+class TestMessageRouter(AsyncTestCase):
+    def setUp(self):
+        super(TestMessageRouter, self).setUp()
+        self.sender = FakeSender()
+        self.router = MessageRouter(self.sender, pools=dict(ReadRequest='read', SetProcessingGraphRequest='config',
+                                                            AddCustomModuleRequest='config'),
+                                    concurrency=dict(read=4))
+        self.handled = []
+        self.graph_set = locks.Event()
+        self.router.register_message_handler(messages.ReadRequest, self._handle_read)
+        self.router.register_message_handler(messages.SetProcessingGraphRequest, self._handle_graph)
+        self.router.register_message_handler(messages.AddCustomModuleRequest, self._handle_module)
+        self.router.register_message_handler(messages.BarrierRequest, self._handle_barrier)
+        self.router.start()
+
+    def tearDown(self):
+        self.router.stop()
+        super(TestMessageRouter, self).tearDown()
+
+    @gen.coroutine
+    def _handle_read(self, message):
+        self.handled.append(message.type)
+
+    @gen.coroutine
+    def _handle_graph(self, message):
+        yield self.graph_set.wait()
+        self.handled.append(message.type)
+
+    @gen.coroutine
+    def _handle_module(self, message):
+        self.handled.append(message.type)
+
+    @gen.coroutine
+    def _handle_barrier(self, message):
+        self.handled.append(message.type)
+
+    def _graph_request(self):
+        return messages.SetProcessingGraphRequest(required_modules=[], blocks=[], connectors=[])
+
+    def _module_request(self):
+        return messages.AddCustomModuleRequest(module_name='m', module_content='', content_type='',
+                                               content_transfer_encoding='', translation={})
+
+    def _read_request(self):
+        return messages.ReadRequest(block_id='b', read_handle='count')
+
+    @gen_test
+    def test_reads_not_blocked_by_graph_change(self):
+        self.router.put_message(self._graph_request())
+        self.router.put_message(self._read_request())
+        yield gen.sleep(0.01)
+        self.assertEqual(self.handled, ['ReadRequest'])
+        self.graph_set.set()
+        yield gen.sleep(0.01)
+        self.assertEqual(self.handled, ['ReadRequest', 'SetProcessingGraphRequest'])
+
+    @gen_test
+    def test_configuration_serialized(self):
+        self.router.put_message(self._graph_request())
+        self.router.put_message(self._module_request())
+        yield gen.sleep(0.01)
+        self.assertEqual(self.handled, [])
+        self.graph_set.set()
+        yield gen.sleep(0.01)
+        self.assertEqual(self.handled, ['SetProcessingGraphRequest', 'AddCustomModuleRequest'])
+
+    @gen_test
+    def test_barrier_waits_for_earlier_messages(self):
+        self.router.put_message(self._graph_request())
+        self.router.put_message(messages.BarrierRequest())
+        self.router.put_message(self._read_request())
+        yield gen.sleep(0.01)
+        self.assertEqual(self.handled, [])
+        self.graph_set.set()
+        yield gen.sleep(0.01)
+        self.assertEqual(self.handled, ['SetProcessingGraphRequest', 'BarrierRequest', 'ReadRequest'])
+
+    @gen_test
+    def test_error_response(self):
+        self.router.register_message_handler(messages.ReadRequest, self._fail)
+        self.router.put_message(self._read_request())
+        yield gen.sleep(0.01)
+        self.assertEqual([message.type for message in self.sender.sent], ['Error'])
+
+    @gen.coroutine
+    def _fail(self, message):
+        raise ValueError('Unknown block')
+
+    @gen_test
+    def test_queued_hook(self):
+        queued = []
+        self.router.register_queued_hook(messages.SetProcessingGraphRequest, queued.append)
+        self.router.put_message(self._graph_request())
+        self.router.put_message(self._graph_request())
+        # the second graph waits for the first one, but its hook is called as soon as it's queued
+        self.assertEqual(len(queued), 2)
+        self.assertEqual(self.handled, [])
+        self.graph_set.set()
+
+
+class TestMessageLanes(AsyncTestCase):
+    def setUp(self):
+        super(TestMessageLanes, self).setUp()
+        self.router = MessageRouter(FakeSender(), pools=dict(ReadRequest='work', GlobalStatsRequest='work',
+                                                             SetProcessingGraphRequest='work'),
+                                    lanes=dict(ReadRequest='data', GlobalStatsRequest='stats',
+                                               SetProcessingGraphRequest='configuration'),
+                                    concurrency=dict(work=2),
+                                    lanes_sizes=dict(data=2),
+                                    lanes_priorities=['configuration', 'data', 'stats'])
+        self.handled = []
+        self.release = locks.Event()
+        for message in (messages.ReadRequest, messages.GlobalStatsRequest, messages.SetProcessingGraphRequest):
+            self.router.register_message_handler(message, self._handle)
+        self.router.start()
+
+    def tearDown(self):
+        self.router.stop()
+        super(TestMessageLanes, self).tearDown()
+
+    @gen.coroutine
+    def _handle(self, message):
+        yield self.release.wait()
+        self.handled.append(message.type)
+
+    def _read_request(self):
+        return messages.ReadRequest(block_id='b', read_handle='count')
+
+    @gen_test
+    def test_lane_full(self):
+        # the first reads are being handled and the others wait in the lane
+        for _ in xrange(2):
+            self.router.put_message(self._read_request())
+        yield gen.moment
+        for _ in xrange(2):
+            self.router.put_message(self._read_request())
+        with self.assertRaises(MessageLaneFullError) as cm:
+            self.router.put_message(self._read_request())
+        self.assertEqual(cm.exception.lane, 'data')
+        self.assertEqual(cm.exception.retry_after, 1)
+        metrics = self.router.metrics()['data']
+        self.assertEqual(metrics['depth'], 2)
+        self.assertEqual(metrics['rejected'], 1)
+        self.release.set()
+        yield gen.sleep(0.01)
+        self.assertEqual(self.router.metrics()['data']['depth'], 0)
+        self.assertEqual(self.router.metrics()['data']['dispatched'], 4)
+
+    @gen_test
+    def test_barriers_bounded_by_lane(self):
+        router = MessageRouter(FakeSender(), default_handler=self._handle, lanes_sizes=dict(default=2))
+        router.start()
+        try:
+            router.put_message(messages.BarrierRequest())
+            yield gen.moment
+            # the first barrier is being handled and the others wait in its lane
+            for _ in xrange(2):
+                router.put_message(messages.BarrierRequest())
+            with self.assertRaises(MessageLaneFullError) as cm:
+                router.put_message(messages.BarrierRequest())
+            self.assertEqual(cm.exception.lane, 'default')
+            self.assertEqual(router.metrics()['default']['depth'], 2)
+            self.release.set()
+            yield gen.sleep(0.01)
+            self.assertEqual(self.handled, ['BarrierRequest'] * 3)
+            self.assertEqual(router.metrics()['default']['depth'], 0)
+        finally:
+            router.stop()
+
+    @gen_test
+    def test_priority(self):
+        for _ in xrange(2):
+            self.router.put_message(self._read_request())
+        yield gen.moment
+        self.router.put_message(messages.GlobalStatsRequest())
+        self.router.put_message(self._read_request())
+        self.router.put_message(messages.SetProcessingGraphRequest(required_modules=[], blocks=[], connectors=[]))
+        self.release.set()
+        yield gen.sleep(0.01)
+        self.assertEqual(self.handled, ['ReadRequest', 'ReadRequest', 'SetProcessingGraphRequest', 'ReadRequest',
+                                        'GlobalStatsRequest'])
+
+    @gen_test
+    def test_serial_pool_keeps_order_across_lanes(self):
+        router = MessageRouter(FakeSender(), default_handler=self._handle, pools=config.MessageRouter.POOLS,
+                               concurrency=config.MessageRouter.CONCURRENCY, lanes=config.MessageRouter.LANES,
+                               lanes_priorities=config.MessageRouter.LANES_PRIORITIES)
+        router.start()
+        try:
+            router.put_message(messages.AddCustomModuleRequest(xid=1, module_name='m', module_content='',
+                                                               content_type='', content_transfer_encoding='',
+                                                               translation={}))
+            router.put_message(messages.SetProcessingGraphRequest(xid=2, required_modules=[], blocks=[],
+                                                                  connectors=[]))
+            router.put_message(messages.SetParametersRequest(xid=3, parameters={}))
+            self.release.set()
+            yield gen.sleep(0.01)
+        finally:
+            router.stop()
+        self.assertEqual(self.handled, ['AddCustomModuleRequest', 'SetProcessingGraphRequest',
+                                        'SetParametersRequest'])
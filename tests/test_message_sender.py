@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import shutil
+import tempfile
+from tornado import gen
+from tornado.escape import json_decode
+from tornado.testing import AsyncHTTPTestCase, gen_test
+from tornado.web import Application, RequestHandler
+import config
+import messages
+from message_sender import MessageSender
+
+
+class _ControllerHandler(RequestHandler):
+    def initialize(self, received):
+        self.received = received
+
+    def post(self, *args):
+        self.received.append((self.request.path, self.request.headers.get('Content-Encoding'),
+                              json_decode(self.request.body)))
+
+
+class TestMessageSender(AsyncHTTPTestCase):
+    def setUp(self):
+        self.received = []
+        super(TestMessageSender, self).setUp()
+        self._config = (config.OpenBoxController.MESSAGE_ENDPOINT_PATTERN,
+                        config.OpenBoxController.MULTIPLE_MESSAGES_ENDPOINT,
+                        config.MessageSender.COMPRESSION_THRESHOLD)
+        config.OpenBoxController.MESSAGE_ENDPOINT_PATTERN = self.get_url('/message/{message}')
+        self.sender = MessageSender()
+
+    def tearDown(self):
+        (config.OpenBoxController.MESSAGE_ENDPOINT_PATTERN,
+         config.OpenBoxController.MULTIPLE_MESSAGES_ENDPOINT,
+         config.MessageSender.COMPRESSION_THRESHOLD) = self._config
+        super(TestMessageSender, self).tearDown()
+
+    def get_app(self):
+        return Application([(r'/message/(.*)', _ControllerHandler, dict(received=self.received)),
+                            (r'/messages', _ControllerHandler, dict(received=self.received))])
+
+    def get_httpserver_options(self):
+        return dict(decompress_request=True)
+
+    @gen_test
+    def test_single_messages(self):
+        sent = yield self.sender.send_message_ignore_response(messages.KeepAlive(dpid=1))
+        self.assertTrue(sent)
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual(self.received[0][:2], ('/message/KeepAlive', None))
+        self.assertEqual(self.received[0][2]['dpid'], 1)
+        metrics = self.sender.metrics()['127.0.0.1:{port}'.format(port=self.get_http_port())]
+        self.assertEqual(metrics['requests'], 1)
+        self.assertEqual(metrics['errors'], 0)
+
+    @gen_test
+    def test_batched_messages(self):
+        config.OpenBoxController.MULTIPLE_MESSAGES_ENDPOINT = self.get_url('/messages')
+        results = yield [self.sender.send_message_ignore_response(messages.KeepAlive(dpid=i)) for i in xrange(3)]
+        self.assertEqual(results, [True] * 3)
+        self.assertEqual(len(self.received), 1)
+        self.assertEqual([message['dpid'] for message in self.received[0][2]], [0, 1, 2])
+        metrics = self.sender.metrics().values()[0]
+        self.assertEqual((metrics['requests'], metrics['messages']), (1, 3))
+
+    @gen_test
+    def test_compressed_messages(self):
+        config.MessageSender.COMPRESSION_THRESHOLD = 10
+        yield self.sender.send_message_ignore_response(messages.Log(origin_dpid=1, messages=['a' * 1000]))
+        self.assertEqual(self.received[0][2]['messages'], ['a' * 1000])
+        metrics = self.sender.metrics().values()[0]
+        self.assertLess(metrics['compressed_bytes'], metrics['bytes'])
+
+    @gen_test
+    def test_errors_counted(self):
+        sent = yield self.sender.send_message_ignore_response(messages.KeepAlive(dpid=1), self.get_url('/unknown'))
+        self.assertFalse(sent)
+        self.assertEqual(self.sender.metrics().values()[0]['errors'], 1)
+
+    @gen_test
+    def test_unreachable_messages_spooled(self):
+        directory = tempfile.mkdtemp()
+        try:
+            sender = MessageSender(directory)
+            sender.spool.retry_interval = 0.01
+            sent = yield sender.send_message_ignore_response(messages.Alert(origin_dpid=1, messages=[]),
+                                                             'http://127.0.0.1:1/message/Alert')
+            self.assertTrue(sent)
+            self.assertEqual(sender.spool.pending, 1)
+            # later messages wait behind the spooled ones
+            yield sender.send_message_ignore_response(messages.Alert(origin_dpid=2, messages=[]))
+            self.assertEqual(sender.spool.pending, 2)
+            self.assertEqual(self.received, [])
+            # messages that aren't spooled don't wait
+            sent = yield sender.send_message_ignore_response(messages.KeepAlive(dpid=1))
+            self.assertTrue(sent)
+            self.assertEqual([path for path, _, _ in self.received], ['/message/KeepAlive'])
+            self.assertEqual(sender.spool.pending, 2)
+            sender.spool.close()
+            yield gen.sleep(0.05)
+        finally:
+            shutil.rmtree(directory)
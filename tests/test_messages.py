@@ -0,0 +1,52 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import json
+import unittest
+import messages
+from messages import Message, MessageParsingError
+
+
+def _sample(clazz):
+    return clazz(**dict((field, [field, 1.5]) for field in clazz.__slots__ if field != 'xid'))
+
+
+class TestMessages(unittest.TestCase):
+    def test_encoding(self):
+        for clazz in Message.messages_registry.itervalues():
+            message = _sample(clazz)
+            expected = dict((field, getattr(message, field)) for field in clazz.__slots__)
+            self.assertEqual(message.to_dict(), expected)
+            expected['type'] = clazz.__name__
+            self.assertEqual(json.loads(message.to_json()), expected)
+
+    def test_decoding(self):
+        for clazz in Message.messages_registry.itervalues():
+            message = _sample(clazz)
+            decoded = Message.from_json(message.to_json())
+            self.assertIs(type(decoded), clazz)
+            self.assertEqual(decoded.to_dict(), message.to_dict())
+
+    def test_decoding_missing_fields(self):
+        xid = Message.XID
+        message = Message.from_dict(dict(type='KeepAlive', dpid=1))
+        self.assertEqual(message.xid, xid)
+        self.assertEqual(Message.XID, xid + 1)
+        self.assertRaises(MessageParsingError, Message.from_dict, dict(type='KeepAlive', xid=1))
+
+    def test_custom_init(self):
+        class CustomMessage(messages.MessageRequest):
+            __slots__ = ['xid', 'value']
+
+            def __init__(self, **kwargs):
+                kwargs.setdefault('value', 0)
+                super(CustomMessage, self).__init__(**kwargs)
+
+        try:
+            self.assertEqual(Message.from_dict(dict(type='CustomMessage', xid=1)).value, 0)
+        finally:
+            del Message.messages_registry['CustomMessage']
@@ -0,0 +1,128 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import unittest
+import config
+from manager import Manager
+from metrics import MetricsRegistry, Histogram
+from control import click_control_client
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def test_counter_and_gauge(self):
+        registry = MetricsRegistry()
+        counter = registry.counter('requests_total', "Requests")
+        gauge = registry.gauge('depth', "Depth", ['lane'])
+        counter.inc()
+        counter.inc(2)
+        gauge.labels('control').set(3)
+        gauge.labels('data "plane"').dec()
+        self.assertEqual(registry.render(), '\n'.join([
+            '# HELP requests_total Requests',
+            '# TYPE requests_total counter',
+            'requests_total 3',
+            '# HELP depth Depth',
+            '# TYPE depth gauge',
+            'depth{lane="control"} 3',
+            'depth{lane="data \\"plane\\""} -1',
+        ]) + '\n')
+
+    def test_histogram(self):
+        registry = MetricsRegistry()
+        histogram = registry.histogram('latency_seconds', "Latency", buckets=(0.1, 1.0))
+        for value in (0.05, 0.1, 0.5, 2.0):
+            histogram.observe(value)
+        self.assertEqual(histogram.counts, [2, 1, 1])
+        self.assertIn('latency_seconds_bucket{le="0.1"} 2', registry.render())
+        self.assertIn('latency_seconds_bucket{le="1.0"} 3', registry.render())
+        self.assertIn('latency_seconds_bucket{le="+Inf"} 4', registry.render())
+        self.assertIn('latency_seconds_sum 2.65', registry.render())
+        self.assertIn('latency_seconds_count 4', registry.render())
+
+    def test_histogram_load(self):
+        histogram = Histogram()
+        histogram.load(dict(buckets=[1.0], counts=[1, 2], sum=5.5, count=3))
+        self.assertEqual((histogram.buckets, histogram.counts, histogram.count), ((1.0,), [1, 2], 3))
+        self.assertRaises(ValueError, histogram.load, dict(buckets=[1.0], counts=[1], sum=0, count=1))
+
+    def test_histogram_snapshot(self):
+        histogram = Histogram([1.0])
+        histogram.observe(0.5)
+        histogram.observe(2)
+        loaded = Histogram()
+        loaded.load(histogram.snapshot())
+        self.assertEqual((loaded.buckets, loaded.counts, loaded.sum, loaded.count), ((1.0,), [1, 1], 2.5, 2))
+
+    def test_invalid(self):
+        registry = MetricsRegistry()
+        family = registry.gauge('depth', "Depth", ['lane'])
+        self.assertRaises(ValueError, registry.counter, 'depth', "Depth")
+        self.assertRaises(ValueError, family.labels)
+
+    def test_collector(self):
+        registry = MetricsRegistry()
+        gauge = registry.gauge('value', "Value")
+        registry.add_collector(lambda: gauge.set(7))
+        self.assertIn('value 7', registry.render())
+
+
+class TestManagerMetrics(unittest.TestCase):
+    def test_render(self):
+        spool_enabled, config.OutboundSpool.ENABLED = config.OutboundSpool.ENABLED, False
+        manager = Manager()
+        config.OutboundSpool.ENABLED = spool_enabled
+        manager.metrics.graph_compile_time.observe(0.2)
+        text = manager.metrics.render()
+        for lane in config.MessageRouter.LANES_PRIORITIES:
+            self.assertIn('obsi_message_lane_depth{{lane="{lane}"}} 0'.format(lane=lane), text)
+        self.assertIn('obsi_push_messages_dropped_total{type="alert"} 0', text)
+        self.assertIn('obsi_graph_compile_seconds_count 1', text)
+        self.assertIn('obsi_engine_reads_total 0', text)
+
+
+if __name__ == '__main__':
+    unittest.main()
+
+
+class _Clock(object):
+    now = 0.0
+
+    @classmethod
+    def time(cls):
+        return cls.now
+
+
+class _ControlSocket(object):
+    """
+    Answers the commands of a control client with a chunk of the response per recv, each taking a second
+    """
+
+    def __init__(self, chunks):
+        self.chunks = list(chunks)
+
+    def send(self, data):
+        return len(data)
+
+    def recv(self, size):
+        _Clock.now += 1
+        return self.chunks.pop(0)
+
+
+class TestControlSocketLatency(unittest.TestCase):
+    def setUp(self):
+        self.time, click_control_client.time = click_control_client.time, _Clock
+        _Clock.now = 0.0
+        self.client = click_control_client.ClickControlClient()
+
+    def tearDown(self):
+        click_control_client.time = self.time
+
+    def test_read_latency_includes_data(self):
+        self.client._socket = _ControlSocket(["200 Read handler 'counter.count' OK\r\n", 'DATA 2\r\n', '10'])
+        self.assertEqual(self.client.read_handler('counter', 'count'), '10')
+        latency = self.client.metrics()['control_socket_latency']
+        self.assertEqual((latency['count'], latency['sum']), (1, 3))
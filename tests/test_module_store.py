@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+# the runner is a separate process with its own modules
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'openbox', 'runner'))
+
+from click_runner_client import ClickRunnerClient
+from runner_exceptions import EngineClientError
+
+
+def _read(path):
+    with open(path, 'rb') as f:
+        return f.read()
+
+
+class TestModuleStore(unittest.TestCase):
+    def setUp(self):
+        self.click_path = tempfile.mkdtemp()
+        self.client = ClickRunnerClient(click_path=self.click_path)
+
+    def tearDown(self):
+        shutil.rmtree(self.click_path)
+
+    def test_install(self):
+        self.client.install_package('m', 'v1')
+        self.assertEqual(_read(self.client.package_path('m')), 'v1')
+        self.assertEqual(self.client.installed_packages(), ['m'])
+        self.assertEqual(self.client.package_digest('m'), hashlib.sha256('v1').hexdigest())
+
+    def test_upgrade_keeps_versions(self):
+        self.client.install_package('m', 'v1')
+        self.client.install_package('m', 'v2')
+        self.assertEqual(_read(self.client.package_path('m')), 'v2')
+        self.assertEqual(sorted(os.listdir(self.client.modules_path)),
+                         sorted(hashlib.sha256(v).hexdigest() + '.uo' for v in ('v1', 'v2')))
+        self.assertTrue(self.client.install_stored_package('m', hashlib.sha256('v1').hexdigest()))
+        self.assertEqual(_read(self.client.package_path('m')), 'v1')
+
+    def test_same_content_is_not_rewritten(self):
+        self.client.install_package('m', 'v1')
+        os.utime(self.client.package_path('m'), (1000, 1000))
+        self.client.install_package('m', 'v1')
+        self.assertEqual(os.stat(self.client.package_path('m')).st_mtime, 1000)
+
+    def test_install_file(self):
+        path = os.path.join(self.click_path, 'upload')
+        with open(path, 'wb') as f:
+            f.write('v1')
+        self.client.install_package_file('m', path)
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(_read(self.client.package_path('m')), 'v1')
+
+        # a module already stored isn't stored again
+        with open(path, 'wb') as f:
+            f.write('v1')
+        self.client.install_package_file('other', path, hashlib.sha256('v1').hexdigest())
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(len(os.listdir(self.client.modules_path)), 1)
+        self.assertEqual(_read(self.client.package_path('other')), 'v1')
+
+    def test_install_stored(self):
+        self.assertFalse(self.client.install_stored_package('m', hashlib.sha256('v1').hexdigest()))
+        self.assertRaises(EngineClientError, self.client.install_stored_package, 'm', '../../etc/passwd')
+
+    def test_digest_of_package_installed_before_store(self):
+        with open(self.client.package_path('m'), 'wb') as f:
+            f.write('v0')
+        self.assertEqual(self.client.package_digest('m'), hashlib.sha256('v0').hexdigest())
+        self.assertIsNone(self.client.package_digest('missing'))
+
+
+if __name__ == '__main__':
+    unittest.main()
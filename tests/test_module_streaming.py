@@ -0,0 +1,144 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import base64
+import hashlib
+import json
+import unittest
+
+from tornado.testing import AsyncHTTPTestCase
+from tornado.web import Application
+
+import config
+import messages
+from messages import MessageParsingError
+from module_streaming import ModuleContentExtractor, StreamedModule, sha256_digest_header, check_digest_header, \
+    module_digest
+from request_handlers import StreamedModuleRequestHandler
+
+MODULE = ''.join(chr(i % 256) for i in xrange(10000))
+
+
+def _request(content):
+    return dict(type='AddCustomModuleRequest', xid=7, module_name='m', module_content=content,
+                content_type='application/octet-stream', content_transfer_encoding='base64',
+                translation={'Block': {'config': 'x'}})
+
+
+def _extract(body, chunk_size):
+    extractor = ModuleContentExtractor('module_content')
+    for i in xrange(0, len(body), chunk_size):
+        extractor.feed(body[i:i + chunk_size])
+    return extractor.finish()
+
+
+def _read(module):
+    with open(module.path, 'rb') as f:
+        return f.read()
+
+
+class TestModuleContentExtractor(unittest.TestCase):
+    def _check(self, body, chunk_size):
+        obj = _extract(body, chunk_size)
+        module = obj['module_content']
+        try:
+            self.assertIsInstance(module, StreamedModule)
+            self.assertEqual(_read(module), MODULE)
+            self.assertEqual(module.size, len(MODULE))
+            self.assertEqual(module.sha256.digest(), hashlib.sha256(MODULE).digest())
+            self.assertEqual(obj['module_name'], 'm')
+            self.assertEqual(obj['translation'], {'Block': {'config': 'x'}})
+        finally:
+            module.remove()
+
+    def test_chunks(self):
+        body = json.dumps(_request(base64.b64encode(MODULE)))
+        for chunk_size in (1, 3, 7, 1000, len(body)):
+            self._check(body, chunk_size)
+
+    def test_escapes(self):
+        # an encoder may escape slashes and keep the line breaks of MIME base64
+        content = base64.encodestring(MODULE).replace('/', '\\/').replace('+', '\\u002b').replace('\n', '\\n')
+        body = json.dumps(_request('')).replace('"module_content": ""', '"module_content": "' + content + '"')
+        for chunk_size in (1, 5, len(body)):
+            self._check(body, chunk_size)
+
+    def test_nested_field_is_not_extracted(self):
+        obj = _extract(json.dumps(dict(translation={'module_content': 'AAAA'}, module_content=None)), 2)
+        self.assertEqual(obj, dict(translation={'module_content': 'AAAA'}, module_content=None))
+
+    def test_invalid(self):
+        for body in ('{"module_content": "AAA"}', '{"module_content": "AAAA', '["module_content"]',
+                     '{"module_content": "A\\qAA"}', '{"module_content": "AAAA",'):
+            self.assertRaises(MessageParsingError, _extract, body, 2)
+
+    def test_digest_header(self):
+        sha256 = hashlib.sha256(MODULE)
+        self.assertTrue(check_digest_header(None, sha256))
+        self.assertTrue(check_digest_header('MD5=x, ' + sha256_digest_header(sha256), sha256))
+        self.assertFalse(check_digest_header(sha256_digest_header(hashlib.sha256('other')), sha256))
+
+    def test_module_digest(self):
+        body = json.dumps(_request(base64.b64encode(MODULE)))
+        module = _extract(body, 1000)['module_content']
+        try:
+            self.assertEqual(module_digest(module), hashlib.sha256(MODULE).hexdigest())
+        finally:
+            module.remove()
+        self.assertEqual(module_digest(base64.b64encode(MODULE)), hashlib.sha256(MODULE).hexdigest())
+        self.assertRaises(MessageParsingError, module_digest, 'AAA')
+
+
+class _Router(object):
+    def __init__(self):
+        self.messages = []
+
+    def put_message(self, message):
+        self.messages.append(message)
+
+
+class _Manager(object):
+    def __init__(self):
+        self.message_router = _Router()
+
+
+class TestStreamedModuleRequestHandler(AsyncHTTPTestCase):
+    def get_app(self):
+        self.manager = _Manager()
+        return Application([(config.RestServer.Endpoints.MODULE_MESSAGE, StreamedModuleRequestHandler,
+                             dict(manager=self.manager))])
+
+    def _post(self, body, **headers):
+        headers['Content-Type'] = 'application/json'
+        return self.fetch('/message/AddCustomModuleRequest', method='POST', body=body, headers=headers)
+
+    def test_streamed(self):
+        body = json.dumps(_request(base64.b64encode(MODULE)))
+        response = self._post(body, Digest=sha256_digest_header(hashlib.sha256(body)))
+        self.assertEqual(response.code, 200)
+        message, = self.manager.message_router.messages
+        self.assertIsInstance(message, messages.AddCustomModuleRequest)
+        self.assertEqual(message.xid, 7)
+        try:
+            self.assertEqual(_read(message.module_content), MODULE)
+        finally:
+            message.module_content.remove()
+
+    def test_digest_mismatch(self):
+        body = json.dumps(_request(base64.b64encode(MODULE)))
+        response = self._post(body, Digest=sha256_digest_header(hashlib.sha256('other')))
+        self.assertEqual(response.code, 400)
+        self.assertEqual(self.manager.message_router.messages, [])
+
+    def test_invalid_content(self):
+        response = self._post(json.dumps(_request('not base64!')))
+        self.assertEqual(response.code, 500)
+        self.assertEqual(self.manager.message_router.messages, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,142 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import os
+import shutil
+import struct
+import tempfile
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+from outbound_spool import OutboundSpool, OverflowPolicy
+
+
+class TestOutboundSpool(AsyncTestCase):
+    def setUp(self):
+        super(TestOutboundSpool, self).setUp()
+        self.directory = tempfile.mkdtemp()
+        self.delivered = []
+        self.content_types = []
+        self.reachable = False
+        self.spool = self._spool()
+
+    def tearDown(self):
+        self.spool.close()
+        self.io_loop.run_sync(lambda: gen.sleep(0.05))
+        shutil.rmtree(self.directory)
+        super(TestOutboundSpool, self).tearDown()
+
+    def _spool(self, **kwargs):
+        params = dict(max_size=2000, segment_size=300, retention=dict(KeepAlive=0, Stats=10), default_retention=None,
+                      retry_interval=0.01, max_retry_interval=0.02)
+        params.update(kwargs)
+        return OutboundSpool(self.directory, self._deliver, **params)
+
+    @gen.coroutine
+    def _deliver(self, url, body, content_type):
+        if not self.reachable:
+            raise IOError("Controller unreachable")
+        self.delivered.append(body)
+        self.content_types.append(content_type)
+        raise gen.Return(True)
+
+    @gen_test
+    def test_drain_in_order(self):
+        for i in xrange(10):
+            self.assertTrue(self.spool.append('Alert', 'url', str(i), 'application/json'))
+        yield gen.sleep(0.05)
+        self.assertEqual(self.spool.pending, 10)
+        self.assertGreater(self.spool.metrics()['segments'], 1)
+        self.reachable = True
+        yield gen.sleep(0.1)
+        self.assertEqual(self.delivered, [str(i) for i in xrange(10)])
+        metrics = self.spool.metrics()
+        self.assertEqual((metrics['pending'], metrics['delivered'], metrics['segments']), (0, 10, 1))
+
+    @gen_test
+    def test_encoded_body_kept(self):
+        body = '\x82\xa4type\xa5Alert\n\xff\x00'
+        self.spool.append('Alert', 'url', body, 'application/x-msgpack')
+        self.reachable = True
+        yield gen.sleep(0.05)
+        self.assertEqual(self.delivered, [body])
+        self.assertEqual(self.content_types, ['application/x-msgpack'])
+
+    def test_retention(self):
+        self.assertFalse(self.spool.append('KeepAlive', 'url', 'body', 'application/json'))
+        self.assertEqual(self.spool.pending, 0)
+
+    def test_overflow(self):
+        for i in xrange(30):
+            self.spool.append('Alert', 'url', str(i), 'application/json')
+        metrics = self.spool.metrics()
+        self.assertLessEqual(metrics['size'], 2000)
+        self.assertGreater(metrics['dropped'], 0)
+        self.assertEqual(metrics['pending'] + metrics['dropped'], 30)
+
+    def test_overflow_drop_newest(self):
+        self.spool.overflow_policy = OverflowPolicy.DROP_NEWEST
+        results = [self.spool.append('Alert', 'url', str(i), 'application/json') for i in xrange(30)]
+        self.assertTrue(results[0])
+        self.assertFalse(results[-1])
+        self.assertEqual(self.spool.pending + self.spool.dropped, 30)
+
+    @gen_test
+    def test_restart(self):
+        for i in xrange(10):
+            self.spool.append('Alert', 'url', str(i), 'application/json')
+        self.reachable = True
+        yield gen.sleep(0)
+        self.reachable = False
+        yield gen.sleep(0.01)
+        delivered = len(self.delivered)
+        self.spool.close()
+        # a partially written record is removed
+        with open(os.path.join(self.directory, sorted(os.listdir(self.directory))[-2]), 'ab') as f:
+            f.write('\x00\x00')
+        self.spool = self._spool()
+        self.assertEqual(self.spool.pending, 10 - delivered)
+        self.reachable = True
+        self.spool.start()
+        yield gen.sleep(0.1)
+        self.assertEqual(self.delivered, [str(i) for i in xrange(10)])
+
+    @gen_test
+    def test_corrupted_records_skipped(self):
+        for i in xrange(3):
+            self.spool.append('Alert', 'url', str(i), 'application/json')
+        self.spool.close()
+        segment = os.path.join(self.directory, sorted(os.listdir(self.directory))[0])
+        with open(segment, 'r+b') as f:
+            first_length, = struct.unpack('!I', f.read(4))
+            f.seek(4 + first_length)
+            second_length, = struct.unpack('!I', f.read(4))
+            # the payload of the second message isn't JSON
+            f.write('x' * second_length)
+        self.spool = self._spool()
+        self.reachable = True
+        self.spool.start()
+        yield gen.sleep(0.1)
+        self.assertEqual(self.delivered, ['0', '2'])
+        self.assertEqual(self.spool.metrics()['corrupted'], 1)
+
+        self.reachable = False
+        for i in xrange(3, 5):
+            self.spool.append('Alert', 'url', str(i), 'application/json')
+        yield gen.sleep(0.01)
+        self.assertEqual(self.spool.metrics()['segments'], 1)
+        with open(self.spool._segment_path(self.spool._read_segment), 'r+b') as f:
+            # the length of the next message is beyond the end of the segment, the rest of it is skipped
+            f.seek(self.spool._read_offset)
+            f.write('\xff\xff\xff\xff')
+        self.reachable = True
+        yield gen.sleep(0.1)
+        self.assertEqual(self.delivered, ['0', '2'])
+        self.assertEqual((self.spool.metrics()['corrupted'], self.spool.pending), (3, 0))
+        # new messages are delivered after the skipped segment
+        self.spool.append('Alert', 'url', '5', 'application/json')
+        yield gen.sleep(0.1)
+        self.assertEqual(self.delivered, ['0', '2', '5'])
@@ -0,0 +1,36 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import unittest
+import config
+from manager import Manager
+
+
+class TestPushMessageChannels(unittest.TestCase):
+    def setUp(self):
+        self._channels = config.Engine.PUSH_MESSAGES_CHANNELS
+        config.Engine.PUSH_MESSAGES_CHANNELS = [dict(name='alerts', endpoint=1, types=['ALERT']),
+                                                dict(name='logs', endpoint=2, types=['LOG'])]
+        spool_enabled, config.OutboundSpool.ENABLED = config.OutboundSpool.ENABLED, False
+        self.manager = Manager()
+        config.OutboundSpool.ENABLED = spool_enabled
+
+    def tearDown(self):
+        config.Engine.PUSH_MESSAGES_CHANNELS = self._channels
+
+    def test_receiver_per_channel(self):
+        receivers = self.manager.push_messages_receivers
+        self.assertEqual(sorted(receivers), ['alerts', 'logs'])
+        self.assertIs(self.manager.push_messages_receiver('ALERT'), receivers['alerts'])
+        self.assertIs(self.manager.push_messages_receiver('LOG'), receivers['logs'])
+        # a type without a channel of its own goes to the first channel
+        self.assertIs(self.manager.push_messages_receiver('OTHER'), receivers['alerts'])
+
+    def test_default_channels(self):
+        types = [message_type for channel in self._channels for message_type in channel['types']]
+        self.assertEqual(sorted(types), ['ALERT', 'LOG'])
+        self.assertEqual(len(set(channel['endpoint'] for channel in self._channels)), len(self._channels))
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import unittest
+from manager_exceptions import PushMessageLimitError
+from push_message_limiter import PushMessageLimiter, TokenBucket
+
+
+def _messages(origin_block, count, severity=1):
+    return [dict(origin_block=origin_block, severity=severity, message=str(i)) for i in xrange(count)]
+
+
+class TestTokenBucket(unittest.TestCase):
+    def test_refill(self):
+        bucket = TokenBucket(rate=2, burst=2, now=0)
+        self.assertEqual([bucket.consume(0) for _ in xrange(3)], [True, True, False])
+        self.assertTrue(bucket.consume(0.5))
+        self.assertFalse(bucket.consume(0.5))
+
+
+class TestPushMessageLimiter(unittest.TestCase):
+    def test_no_limits(self):
+        messages = _messages('log', 10)
+        self.assertEqual(PushMessageLimiter().filter(messages), messages)
+
+    def test_rate_limit_per_origin_block(self):
+        limiter = PushMessageLimiter([dict(rate=0, burst=3)])
+        passed = limiter.filter(_messages('a', 5) + _messages('b', 5))
+        self.assertEqual([message['origin_block'] for message in passed], ['a'] * 3 + ['b'] * 3)
+        self.assertEqual(limiter.dropped, 4)
+        self.assertEqual(limiter.metrics()[0], dict(origin_block='a', severity=1, passed=3, rate_limited=2,
+                                                    sampled_out=0))
+
+    def test_first_matching_limit(self):
+        limiter = PushMessageLimiter([dict(origin_block='a', severity=2, sampling=0), dict(origin_block='a', rate=0)])
+        self.assertEqual(limiter.filter(_messages('a', 2, severity=2)), [])
+        # rate 0 with the default burst of 1
+        self.assertEqual(len(limiter.filter(_messages('a', 2))), 1)
+        self.assertEqual(len(limiter.filter(_messages('b', 2))), 2)
+        self.assertEqual([(metrics['severity'], metrics['sampled_out'], metrics['rate_limited'])
+                          for metrics in limiter.metrics()], [(1, 0, 1), (2, 2, 0)])
+
+    def test_sampling(self):
+        samples = iter([0.1, 0.6, 0.4, 0.9])
+        limiter = PushMessageLimiter([dict(sampling=0.5)], sample=lambda: next(samples))
+        self.assertEqual([message['message'] for message in limiter.filter(_messages('a', 4))], ['0', '2'])
+
+    def test_bad_limits(self):
+        limiter = PushMessageLimiter()
+        for limits in (dict(rate=1), [1], [dict(rate=-1)], [dict(sampling=2)], [dict(burst=0)], [dict(unknown=1)]):
+            self.assertRaises(PushMessageLimitError, limiter.set_limits, limits)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import json
+from tornado import gen
+from tornado.testing import AsyncTestCase, gen_test
+from push_message_receiver import PushMessageReceiver, PushMessageHandler, decode_json_lines
+
+
+def _line(message_type, content):
+    return json.dumps(dict(type=message_type, content=json.dumps(content))) + '\n'
+
+
+class TestPushMessageReceiver(AsyncTestCase):
+    def setUp(self):
+        super(TestPushMessageReceiver, self).setUp()
+        self.receiver = PushMessageReceiver()
+        self.received = []
+        self.receiver.register_message_handler('ALERT', lambda contents: self.received.append(('ALERT', contents)))
+        self.receiver.register_message_handler('LOG', lambda contents: self.received.append(('LOG', contents)))
+
+    def test_batch_per_type(self):
+        self.receiver._handle_chunk(_line('ALERT', dict(id=1)) + _line('LOG', dict(id=2)) + _line('ALERT', dict(id=3)))
+        self.assertEqual([(message_type, len(contents)) for message_type, contents in self.received],
+                         [('ALERT', 2), ('LOG', 1)])
+
+    def test_lines_split_between_chunks(self):
+        data = _line('ALERT', dict(id=1)) + _line('ALERT', dict(id=2))
+        self.receiver._handle_chunk(data[:10])
+        self.assertEqual(self.received, [])
+        self.receiver._handle_chunk(data[10:-5])
+        self.receiver._handle_chunk(data[-5:])
+        self.assertEqual([json.loads(content)['id'] for _, contents in self.received for content in contents], [1, 2])
+
+    def test_bad_lines_skipped(self):
+        self.receiver._handle_chunk(_line('ALERT', dict(id=1)) + '{bad\n' + _line('UNKNOWN', {}) +
+                                    _line('ALERT', dict(id=2)))
+        self.assertEqual(len(self.received[0][1]), 2)
+
+
+class TestPushMessageHandler(AsyncTestCase):
+    @gen_test
+    def test_add_batch(self):
+        sent = []
+
+        @gen.coroutine
+        def sender(messages):
+            sent.append(messages)
+
+        handler = PushMessageHandler(sender, buffer_size=3, buffer_timeout=10)
+        yield handler.add_batch([json.dumps(dict(message='a')), json.dumps(dict(message='b'))])
+        self.assertEqual(sent, [])
+        yield handler.add_batch([json.dumps(dict(message='c')), 'bad'])
+        self.assertEqual([message['message'] for message in sent[0]], ['a', 'b', 'c'])
+        self.assertEqual([message['id'] for message in sent[0]], [0, 1, 2])
+
+    def test_decode_json_lines(self):
+        self.assertEqual(decode_json_lines(['1', '{"a": 2}']), [1, dict(a=2)])
+        self.assertEqual(decode_json_lines(['1', '{', '3']), [1, 3])
+
+    @gen_test
+    def test_timer_rearmed(self):
+        sent = []
+
+        @gen.coroutine
+        def sender(messages):
+            sent.append(messages)
+
+        handler = PushMessageHandler(sender, buffer_size=10, buffer_timeout=0.01)
+        yield handler.add(json.dumps(dict(message='a')))
+        yield gen.sleep(0.05)
+        yield handler.add(json.dumps(dict(message='b')))
+        yield gen.sleep(0.05)
+        self.assertEqual([[message['message'] for message in messages] for messages in sent], [['a'], ['b']])
+        handler.close()
+
+    @gen_test
+    def test_max_in_flight_and_adaptive_batch_size(self):
+        sent = []
+
+        @gen.coroutine
+        def sender(messages):
+            sent.append(len(messages))
+            yield gen.sleep(0.01)
+
+        handler = PushMessageHandler(sender, buffer_size=2, buffer_timeout=10, max_buffer_size=8, max_in_flight=1)
+        for i in xrange(6):
+            yield handler.add(json.dumps(dict(message=i)))
+        # the first batch is in flight, the rest wait for it
+        self.assertEqual(sent, [2])
+        yield gen.sleep(0.05)
+        self.assertEqual(sent, [2, 4])
+        self.assertEqual(handler._batch_size, 4)
+        handler.close()
+
+    @gen_test
+    def test_flood_while_in_flight(self):
+        sent = []
+
+        @gen.coroutine
+        def sender(messages):
+            sent.append(len(messages))
+            yield gen.sleep(0.01)
+
+        handler = PushMessageHandler(sender, buffer_size=2, buffer_timeout=10, max_buffer_size=8, max_in_flight=1)
+        for i in xrange(100):
+            yield handler.add(json.dumps(dict(message=i)))
+        # the first batch is in flight, the buffer keeps at most max_buffer_size messages
+        self.assertEqual(sent, [2])
+        self.assertEqual(handler.metrics()['buffered'], 8)
+        self.assertEqual(handler.dropped, 90)
+        yield gen.sleep(0.1)
+        # no batch is larger than the batch size
+        self.assertEqual(sent, [2, 4, 4])
+        self.assertEqual(sum(sent) + handler.dropped, 100)
+        handler.close()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+from tornado import gen, locks
+from tornado.testing import AsyncTestCase, gen_test
+from read_coalescer import ReadCoalescer
+
+
+class TestReadCoalescer(AsyncTestCase):
+    def setUp(self):
+        super(TestReadCoalescer, self).setUp()
+        self.fetched = []
+        self.release = locks.Event()
+        self.coalescer = ReadCoalescer(self._fetch)
+
+    @gen.coroutine
+    def _fetch(self, element, handler):
+        self.fetched.append((element, handler))
+        value = len(self.fetched)
+        yield self.release.wait()
+        if handler == 'bad':
+            raise ValueError(handler)
+        raise gen.Return(value)
+
+    @gen_test
+    def test_concurrent_reads_coalesced(self):
+        futures = [self.coalescer.read(('e', 'count')) for _ in xrange(3)]
+        other = self.coalescer.read(('e', 'byte_count'))
+        self.release.set()
+        values = yield futures
+        self.assertEqual(values, [1, 1, 1])
+        self.assertEqual((yield other), 2)
+        self.assertEqual(self.coalescer.engine_reads, 2)
+        self.assertEqual(self.coalescer.coalesced_reads, 2)
+        self.assertEqual(self.coalescer.hit_ratio(), 0.5)
+
+    @gen_test
+    def test_no_cache_without_ttl(self):
+        self.release.set()
+        yield self.coalescer.read(('e', 'count'))
+        yield self.coalescer.read(('e', 'count'))
+        self.assertEqual(len(self.fetched), 2)
+
+    @gen_test
+    def test_cache_with_ttl(self):
+        self.coalescer.handlers_ttl = dict(count=60)
+        self.release.set()
+        yield self.coalescer.read(('e', 'count'), 'count')
+        self.assertEqual((yield self.coalescer.read(('e', 'count'), 'count')), 1)
+        self.assertEqual(self.coalescer.cached_reads, 1)
+        self.coalescer.invalidate()
+        self.assertEqual((yield self.coalescer.read(('e', 'count'), 'count')), 2)
+
+    @gen_test
+    def test_etag_kept_with_value(self):
+        self.coalescer.ttl = 60
+        self.coalescer.etag = lambda value: '"{value}"'.format(value=value)
+        self.assertIsNone(self.coalescer.cached_etag(('e', 'count')))
+        self.release.set()
+        yield self.coalescer.read(('e', 'count'))
+        self.assertEqual(self.coalescer.cached_etag(('e', 'count')), '"1"')
+        self.coalescer.invalidate()
+        self.assertIsNone(self.coalescer.cached_etag(('e', 'count')))
+
+    @gen_test
+    def test_errors_not_cached(self):
+        self.coalescer.ttl = 60
+        futures = [self.coalescer.read(('e', 'bad')) for _ in xrange(2)]
+        self.release.set()
+        for future in futures:
+            with self.assertRaises(ValueError):
+                yield future
+        with self.assertRaises(ValueError):
+            yield self.coalescer.read(('e', 'bad'))
+        self.assertEqual(len(self.fetched), 2)
+
+    @gen_test
+    def test_invalidate_during_read(self):
+        first = self.coalescer.read(('e', 'count'))
+        self.coalescer.invalidate()
+        second = self.coalescer.read(('e', 'count'))
+        self.release.set()
+        self.assertEqual((yield first), 1)
+        self.assertEqual((yield second), 2)
+        self.assertEqual(self.coalescer.engine_reads, 2)
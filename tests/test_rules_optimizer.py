@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import unittest
+from configuration_builder.open_box_blocks import OpenBoxBlock
+from configuration_builder.click_blocks import ClickBlock
+from configuration_builder.connection import Connection
+from configuration_builder.matching import HeaderMatch
+from configuration_builder.rules_optimizer import optimize_header_matches, RemovalReason
+
+
+class TestOptimizeHeaderMatches(unittest.TestCase):
+    def test_no_removal(self):
+        matches = [dict(TCP_DST='80'), dict(TCP_DST='443')]
+        kept, removed = optimize_header_matches(matches)
+        self.assertEqual(kept, [(0, HeaderMatch(TCP_DST='80')), (1, HeaderMatch(TCP_DST='443'))])
+        self.assertEqual(removed, [])
+
+    def test_shadowed_by_less_specific(self):
+        matches = [dict(IPV4_PROTO='6'), dict(IPV4_PROTO='6', TCP_DST='80'), dict(IPV4_PROTO='17')]
+        kept, removed = optimize_header_matches(matches)
+        self.assertEqual([number for number, _ in kept], [0, 2])
+        self.assertEqual(removed, [dict(rule=1, reason=RemovalReason.SHADOWED, covered_by=[0])])
+
+    def test_shadowed_by_match_all(self):
+        kept, removed = optimize_header_matches([{}, dict(TCP_DST='80')])
+        self.assertEqual([number for number, _ in kept], [0])
+        self.assertEqual(removed[0]['reason'], RemovalReason.SHADOWED)
+
+    def test_shadowed_by_mask(self):
+        matches = [dict(IPV4_SRC='10.0.0.0%255.0.0.0'), dict(IPV4_SRC='10.1.2.3')]
+        kept, removed = optimize_header_matches(matches)
+        self.assertEqual([number for number, _ in kept], [0])
+
+    def test_not_shadowed_by_more_specific(self):
+        matches = [dict(IPV4_SRC='10.1.2.3'), dict(IPV4_SRC='10.0.0.0%255.0.0.0')]
+        kept, removed = optimize_header_matches(matches)
+        self.assertEqual([number for number, _ in kept], [0, 1])
+
+    def test_unreachable_by_union(self):
+        matches = [dict(TCP_DST='80'), dict(TCP_DST='81'), dict(TCP_DST='80%65534'), dict(TCP_DST='82')]
+        kept, removed = optimize_header_matches(matches)
+        self.assertEqual([number for number, _ in kept], [0, 1, 3])
+        self.assertEqual(removed, [dict(rule=2, reason=RemovalReason.UNREACHABLE, covered_by=[0, 1])])
+
+    def test_merge_adjacent_same_target(self):
+        matches = [dict(IPV4_DST='10.0.0.2'), dict(IPV4_DST='10.0.0.3'), dict(IPV4_DST='10.0.0.4')]
+        kept, removed = optimize_header_matches(matches, targets=['a', 'a', 'b'])
+        self.assertEqual(kept, [(0, HeaderMatch(IPV4_DST='10.0.0.2%255.255.255.254')),
+                                (2, HeaderMatch(IPV4_DST='10.0.0.4'))])
+        self.assertEqual(removed, [dict(rule=1, reason=RemovalReason.MERGED, covered_by=[0])])
+
+    def test_no_merge_for_different_targets(self):
+        matches = [dict(IPV4_DST='10.0.0.2'), dict(IPV4_DST='10.0.0.3')]
+        kept, removed = optimize_header_matches(matches)
+        self.assertEqual(len(kept), 2)
+        self.assertEqual(removed, [])
+
+
+class TestHeaderClassifierOptimization(unittest.TestCase):
+    def setUp(self):
+        obb = OpenBoxBlock.from_dict(dict(name='hc', type='HeaderClassifier',
+                                          config=dict(match=[dict(TCP_DST='80'), dict(TCP_DST='80'), {}],
+                                                      allow_vlan=False)))
+        self.cb = ClickBlock.from_open_box_block(obb)
+
+    def test_removed_rules(self):
+        self.assertEqual(self.cb.removed_rules(), [dict(rule=1, reason=RemovalReason.SHADOWED, covered_by=[0])])
+
+    def test_rule_numbers_kept(self):
+        connections = self.cb.connections()
+        self.assertIn(Connection('hc@_@classifier', 'hc@_@counter', 0, 0), connections)
+        self.assertIn(Connection('hc@_@classifier', 'hc@_@counter', 1, 2), connections)
+        self.assertIn(Connection('hc@_@idle', 'hc@_@counter', 0, 1), connections)
@@ -0,0 +1,120 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import logging
+from tornado import gen, locks
+from tornado.log import app_log
+from tornado.testing import AsyncTestCase, gen_test
+from stats_subscriptions import StatsSubscriptions
+from manager_exceptions import BadSubscriptionError, UnknownSubscriptionError, EngineNotRunningError
+
+
+class TestStatsSubscriptions(AsyncTestCase):
+    def setUp(self):
+        super(TestStatsSubscriptions, self).setUp()
+        self.reads = []
+        self.sent = []
+        self.values = dict(count=1, byte_count=100)
+        self.engine_released = None
+        self.engine_error = None
+        self.subscriptions = StatsSubscriptions(self._read_block_values, self._get_global_stats, self._send_stats,
+                                                tick=10)
+
+    def tearDown(self):
+        self.subscriptions.stop()
+        super(TestStatsSubscriptions, self).tearDown()
+
+    @gen.coroutine
+    def _read_block_values(self, reads):
+        self.reads.append(reads)
+        if self.engine_error is not None:
+            raise self.engine_error
+        if self.engine_released is not None:
+            yield self.engine_released.wait()
+        raise gen.Return([dict(block_id=read['block_id'], read_handle=read['read_handle'],
+                               result=self.values[read['read_handle']], error=None) for read in reads])
+
+    @gen.coroutine
+    def _get_global_stats(self):
+        raise gen.Return(dict(uptime=1))
+
+    @gen.coroutine
+    def _send_stats(self, subscription_id, timestamp, samples, global_stats):
+        self.sent.append((subscription_id, timestamp, samples, global_stats))
+
+    @gen_test
+    def test_shared_reads_sampled_once(self):
+        first = self.subscriptions.subscribe([dict(block_id='b', read_handle='count')], False, 10)
+        second = self.subscriptions.subscribe([dict(block_id='b', read_handle='count'),
+                                               dict(block_id='b', read_handle='byte_count')], True, 10)
+        yield self.subscriptions._sample()
+        self.assertEqual(self.reads, [[dict(block_id='b', read_handle='count'),
+                                       dict(block_id='b', read_handle='byte_count')]])
+        self.assertEqual([sent[0] for sent in self.sent], [first, second])
+        self.assertEqual(self.sent[0][1], self.sent[1][1])
+        self.assertEqual(len(self.sent[1][2]), 2)
+        self.assertEqual(self.sent[1][3], dict(uptime=1))
+
+    @gen_test
+    def test_only_changes_pushed(self):
+        self.subscriptions.subscribe([dict(block_id='b', read_handle='count'),
+                                      dict(block_id='b', read_handle='byte_count')], False, 10)
+        yield self.subscriptions._sample()
+        yield self.subscriptions._sample()
+        self.assertEqual(len(self.sent), 1)
+        self.values['count'] = 2
+        yield self.subscriptions._sample()
+        self.assertEqual(self.sent[1][2], [dict(block_id='b', read_handle='count', result=2, error=None)])
+
+    @gen_test
+    def test_interval_in_ticks(self):
+        self.subscriptions.subscribe([dict(block_id='b', read_handle='count')], False, 25)
+        for _ in xrange(6):
+            self.values['count'] += 1
+            yield self.subscriptions._sample()
+        self.assertEqual(len(self.reads), 2)
+
+    @gen_test
+    def test_overdue_sampled_after_slow_sample(self):
+        first = self.subscriptions.subscribe([dict(block_id='b', read_handle='count')], False, 10)
+        second = self.subscriptions.subscribe([dict(block_id='b', read_handle='byte_count')], False, 20)
+        self.engine_released = locks.Event()
+        for _ in xrange(3):
+            # every sample takes longer than a tick, so only odd ticks start a sample
+            sampling = self.subscriptions._sample()
+            yield self.subscriptions._sample()
+            self.engine_released.set()
+            yield sampling
+            self.engine_released.clear()
+        self.assertIn(second, [sent[0] for sent in self.sent])
+        self.assertEqual(self.reads[1], [dict(block_id='b', read_handle='count'),
+                                         dict(block_id='b', read_handle='byte_count')])
+        self.assertEqual(self.sent[0][0], first)
+
+    def test_bad_subscriptions(self):
+        self.assertRaises(BadSubscriptionError, self.subscriptions.subscribe, [], False, 10)
+        self.assertRaises(BadSubscriptionError, self.subscriptions.subscribe, None, True, 0)
+        self.assertRaises(BadSubscriptionError, self.subscriptions.subscribe, [dict(block_id='b')], False, 10)
+        self.assertRaises(BadSubscriptionError, self.subscriptions.subscribe,
+                          [dict(block_id=['b'], read_handle='count')], False, 10)
+        self.assertRaises(BadSubscriptionError, self.subscriptions.subscribe, ['b.count'], False, 10)
+        self.assertRaises(UnknownSubscriptionError, self.subscriptions.unsubscribe, 1)
+
+    @gen_test
+    def test_engine_not_running_not_logged(self):
+        errors = []
+        handler = logging.Handler(logging.ERROR)
+        handler.emit = errors.append
+        app_log.addHandler(handler)
+        try:
+            self.engine_error = EngineNotRunningError()
+            self.subscriptions.subscribe([dict(block_id='b', read_handle='count')], False, 10)
+            yield gen.sleep(0.05)
+        finally:
+            app_log.removeHandler(handler)
+        self.assertGreater(len(self.reads), 1)
+        self.assertEqual(errors, [])
@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+#
+# Copyright (c) 2015 Pavel Lazar pavel.lazar (at) gmail.com
+#
+# The Software is provided WITHOUT ANY WARRANTY, EXPRESS OR IMPLIED.
+#####################################################################
+
+import json
+import unittest
+import messages
+import wire_format
+from manager_exceptions import UnsupportedWireFormatError
+from messages import MessageParsingError
+
+
+def _alert():
+    return messages.Alert(origin_dpid=1, messages=[dict(origin_block='alert', packet='45 00 00 3c'),
+                                                   dict(origin_block='alert', packets=['01', '02 03'])])
+
+
+class TestWireFormat(unittest.TestCase):
+    def test_content_type(self):
+        self.assertEqual(wire_format.content_type(None), wire_format.JSON)
+        self.assertEqual(wire_format.content_type('Application/JSON; charset=UTF-8'), wire_format.JSON)
+        for header in ('text/plain', 'application/x-www-form-urlencoded', 'application/unknown', ''):
+            self.assertEqual(wire_format.content_type(header), wire_format.JSON)
+        self.assertEqual(wire_format.content_type('application/vnd.msgpack'), wire_format.MSGPACK)
+        self.assertRaises(UnsupportedWireFormatError, wire_format.decode, '{}',
+                          wire_format.content_type('application/octet-stream'))
+
+    def test_json(self):
+        alert = _alert()
+        body = wire_format.encode(alert, wire_format.JSON)
+        self.assertEqual(wire_format.decode(body, wire_format.JSON).to_dict(), alert.to_dict())
+        self.assertEqual([message['type'] for message in json.loads(
+            wire_format.encode_many([alert, alert], wire_format.JSON))], ['Alert', 'Alert'])
+
+    def test_unsupported(self):
+        self.assertRaises(UnsupportedWireFormatError, wire_format.decode, '', 'text/plain')
+        self.assertRaises(UnsupportedWireFormatError, wire_format.check_format, 'text/plain')
+
+    def test_invalid_body(self):
+        for body in ('{', '[]', '{"type": "Unknown"}', '{"type": "KeepAlive"}'):
+            self.assertRaises(MessageParsingError, wire_format.decode, body, wire_format.JSON)
+
+    @unittest.skipIf(wire_format.msgpack is None, "msgpack is not installed")
+    def test_msgpack(self):
+        self.assertIn(wire_format.MSGPACK, wire_format.supported_formats())
+        body = wire_format.encode(_alert(), wire_format.MSGPACK)
+        obj = wire_format.msgpack.unpackb(body, raw=False)
+        self.assertEqual(obj['messages'][0]['packet'], '\x45\x00\x00\x3c')
+        self.assertEqual(obj['messages'][1]['packets'], ['\x01', '\x02\x03'])
+        request = messages.ReadRequest(block_id='block', read_handle='count')
+        decoded = wire_format.decode(wire_format.encode(request, wire_format.MSGPACK), wire_format.MSGPACK)
+        self.assertEqual(decoded.to_dict(), request.to_dict())